@@ -1,15 +1,15 @@
 import streamlit as st
 import validators
 from urllib.parse import urlsplit
-from utils.prompts import (SYSTEM_PROMPT_FOR_SELECTING_APPROACH_DYNAMICALLY,
-                           USER_REQUEST_FOR_SELECTING_APPROACH_DYNAMICALLY)
-from utils.get_gpt_response_json import get_gpt_response_json
 from utils.purely_gpt_utils import process_using_approach_1
 from utils.scrape_html_using_scrapenetwork import scrape_body_from_url
 from utils.css_selector_utils import process_using_approach_2
 from utils.enhance_instructions import enhance_user_instructions
-from bs4 import BeautifulSoup
-from urllib.parse import urlparse
+from utils.parsed_document import ParsedDocument
+from utils.pipeline import StagePipeline
+from utils.select_approach import get_approach, select_approach_for_document
+from utils.reporting import set_sink
+from utils.streamlit_sink import StreamlitSink, StreamedRecordsView, with_script_run_ctx
 
 # Set page title and icon
 st.set_page_config(
@@ -17,48 +17,32 @@ st.set_page_config(
     page_icon=":robot_face:"
 )
 
-def select_approach_dynamically(url, instruction):
-    with st.spinner("Selecting approach dynamically"):
-        user_request = USER_REQUEST_FOR_SELECTING_APPROACH_DYNAMICALLY.replace(
-        "<<INSTRUCTION>>", instruction).replace("<<URL>>", url)
-        st.write("Calling GPT")
-
-        response = get_gpt_response_json(
-            user_request=user_request, system_prompt=SYSTEM_PROMPT_FOR_SELECTING_APPROACH_DYNAMICALLY)
-        approach = int(response['approach'])
+# Report progress and results from the utils package on this page
+set_sink(StreamlitSink())
 
+def show_selected_approach(approach):
     if approach == 1:
         st.success(f"Selected Approach: Purely GPT")
     else: 
         st.success(f"Selected Approach: CSS Selectors")
-    
-    return approach
-
-def get_base_url(url):
-    parsed_url = urlparse(url)
-    return f"{parsed_url.scheme}://{parsed_url.netloc}"
-
-def get_top_2_urls_out_of_the_html(html_content):
-    soup = BeautifulSoup(html_content, 'html.parser')
-    links = soup.find_all('a', href=True)
-    
-    url_tally = {}
-    
-    for link in links:
-        url = link['href']
-        if url.startswith("http://") or url.startswith("https://"):
-            base_url = get_base_url(url)
-            if base_url in url_tally:
-                url_tally[base_url] += 1
-            else:
-                url_tally[base_url] = 1
-    
-    sorted_urls = sorted(url_tally.items(), key=lambda x: x[1], reverse=True)
-    top_two_urls = ""
-    for i, (base_url, count) in enumerate(sorted_urls[:2], 1):
-        top_two_urls += f"{i}. {base_url}: {count} times\n"
-    
-    return top_two_urls
+
+def build_pipeline(instruction, url=None, html_content=None, base_url=None):
+    # Instruction enhancement, fetching and approach selection do not depend on each
+    # other, only the selection for uploaded files needs the parsed page
+    pipeline = StagePipeline(wrap_stage=with_script_run_ctx)
+    pipeline.add_stage("enhance_instructions", lambda: enhance_user_instructions(instruction))
+    if url:
+        pipeline.add_stage("fetch_html", lambda: scrape_body_from_url(url=url))
+        pipeline.add_stage("parse_document",
+                           lambda fetch_html: ParsedDocument(fetch_html, base_url=base_url) if fetch_html else None,
+                           dependencies=("fetch_html",))
+        pipeline.add_stage("select_approach", lambda: get_approach(url=url, instruction=instruction))
+    else:
+        pipeline.add_stage("parse_document", lambda: ParsedDocument(html_content, base_url=base_url))
+        pipeline.add_stage("select_approach",
+                           lambda parse_document: select_approach_for_document(parse_document, instruction=instruction),
+                           dependencies=("parse_document",))
+    return pipeline
 
 @st.cache_data
 def extract_base_url(url):
@@ -100,12 +84,12 @@ def main():
         instruction = st.text_area(
             "Enter Instructions:", placeholder="I need a list of all the books and their respective prices on this page.")
 
+        # The extraction answer can be stopped once enough records have streamed in
+        max_records = st.number_input("Stop after this many records (0 keeps all)", min_value=0, value=0, step=10)
+
         if st.button("Scrape and Analyze"):
-            with st.spinner("Enhancing user instructions"):
-                instruction = enhance_user_instructions(instruction)
-            st.info(f"Enhanced user instructions:\n\n{instruction}")
-            # st.warning("Hello world")
             st.info(url_or_file)
+            html_content = None
             if url_or_file == "URL":
                 st.warning(url)
                 if url:
@@ -113,8 +97,6 @@ def main():
                     if validate_url(url):
                         st.warning("url validated")
                         base_url = extract_base_url(url)
-                        html_content = scrape_body_from_url(url=url)
-                        st.info(f"html content scrapped: {html_content}")
                     else:
                         st.error("Invalid URL. Please enter a valid URL.")
                         return
@@ -131,20 +113,33 @@ def main():
             else:
                 st.error("Please enter a URL or upload an HTML file.")
                 return
-            
-            if html_content:
-                if not url:
-                    urls = get_top_2_urls_out_of_the_html(html_content=html_content)
-                    approach = select_approach_dynamically(url=urls, instruction=instruction)
-                else:
-                    approach = select_approach_dynamically(url=url,instruction=instruction)
+
+            pipeline = build_pipeline(instruction=instruction, url=url, html_content=html_content, base_url=base_url)
+            with st.spinner("Enhancing user instructions, fetching the page and selecting the approach"):
+                results = pipeline.run()
+
+            instruction = results["enhance_instructions"]
+            st.info(f"Enhanced user instructions:\n\n{instruction}")
+            with st.expander(label=f"Pipeline stage timings ({pipeline.total_time:.2f}s)"):
+                st.table(pipeline.timing_report())
+
+            # The page is parsed once and shared with every following step
+            document = results["parse_document"]
+            if document:
+                approach = results["select_approach"]
+                show_selected_approach(approach)
+                # Records are shown while the extraction answer streams in
+                records_view = StreamedRecordsView(max_records=max_records)
                 if approach == 1:
                     if base_url:
-                        process_using_approach_1(raw_html_content=html_content,instruction=instruction,base_url=base_url)
+                        process_using_approach_1(raw_html_content=document,instruction=instruction,base_url=base_url,on_record=records_view.on_record)
                     else:
-                        process_using_approach_1(raw_html_content=html_content,instruction=instruction,base_url=None)
+                        process_using_approach_1(raw_html_content=document,instruction=instruction,base_url=None,on_record=records_view.on_record)
                 else:
-                    process_using_approach_2(raw_html_content=html_content,instruction=instruction)
+                    process_using_approach_2(raw_html_content=document,instruction=instruction,on_record=records_view.on_record)
+                records_view.finish()
+            else:
+                st.error("Could not retrieve the HTML content.")
                     
     except Exception as e:
         st.error(f"An unexpected error occurred: {str(e)}")
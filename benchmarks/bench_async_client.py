@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+from mock_openai_server import MockOpenAIServer
+from utils.async_gpt_client import AsyncGPTClient
+
+
+async def run_requests(base_url, count, concurrency):
+    async with AsyncGPTClient(max_concurrency=concurrency, api_key="mock", base_url=base_url,
+                              backoff_base=0.1, use_cache=False) as client:
+        requests = [(f"page {i}", "Extract everything") for i in range(count)]
+        return await client.get_responses_json(requests, model="mock")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sequential vs concurrent GPT calls against a local mock server.")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limited", type=int, default=3, help="Number of initial requests answered with 429.")
+    args = parser.parse_args()
+
+    for concurrency in (1, args.concurrency):
+        with MockOpenAIServer(latency=args.latency, rate_limited_requests=args.rate_limited) as mock:
+            start = time.perf_counter()
+            results = asyncio.run(run_requests(mock.base_url, args.requests, concurrency))
+            elapsed = time.perf_counter() - start
+        failures = sum(isinstance(result, Exception) for result in results)
+        print(f"concurrency={concurrency:<3} requests={args.requests} failures={failures} "
+              f"server_calls={mock.request_count} max_in_flight={mock.max_in_flight} wall={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import argparse
+import time
+
+from common import load_samples, short_name
+from mock_openai_server import MockOpenAIServer
+from utils.chunked_extraction import extract_in_chunks, split_markdown_into_chunks, SINGLE_CALL_TOKEN_LIMIT
+from utils.async_gpt_client import get_gpt_responses_json
+from utils.ensure_limit import count_tokens, reduce_string_to_token_limit
+from utils.parsed_document import ParsedDocument
+from utils.purely_gpt_utils import scrape_and_convert
+from utils.prompts import STRUCTURED_CONTENT_TEMPLATE, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA
+
+INSTRUCTION = "List every product with its title and price."
+SCHEMA = {"type": "object", "properties": {"products": {"type": "array"}}}
+
+
+def single_call(markdown_content, base_url):
+    # The previous behaviour, one call with the markdown cut at the limit
+    markdown_content = reduce_string_to_token_limit(markdown_content, token_limit=SINGLE_CALL_TOKEN_LIMIT)
+    user_request = STRUCTURED_CONTENT_TEMPLATE.render(
+        JSON_SCHEMA=str(SCHEMA), INSTRUCTION=INSTRUCTION, SCRAPED_CONTENT=markdown_content)
+    get_gpt_responses_json([(user_request, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)],
+                           model="mock", api_key="mock", base_url=base_url, use_cache=False)
+    return count_tokens(markdown_content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="One truncated extraction call against concurrent chunked calls, on a mock server whose latency grows with the prompt.")
+    parser.add_argument("--samples", nargs="*", default=["amazon_test.html", "amazon_nailcutters.html", "bookingcom.html"])
+    parser.add_argument("--chunk-tokens", type=int, default=8000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.3)
+    # Extraction answers grow with the records in the prompt, so generation time does too
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'sample':<40} {'tokens':>7} {'single sent':>11} {'single (s)':>10} {'chunks':>6} {'chunked sent':>12} {'chunked (s)':>11}")
+    for name, raw in load_samples(args.samples):
+        markdown_content = scrape_and_convert(ParsedDocument(raw))
+        chunks = split_markdown_into_chunks(markdown_content, args.chunk_tokens)
+        with MockOpenAIServer(latency=args.latency, seconds_per_1k_tokens=args.seconds_per_1k_tokens) as mock:
+            start = time.perf_counter()
+            sent = single_call(markdown_content, mock.base_url)
+            single_time = time.perf_counter() - start
+            start = time.perf_counter()
+            extract_in_chunks(markdown_content, INSTRUCTION, SCHEMA, args.chunk_tokens, args.concurrency,
+                              model="mock", api_key="mock", base_url=mock.base_url, use_cache=False)
+            chunked_time = time.perf_counter() - start
+        chunked_sent = sum(count_tokens(chunk) for chunk in chunks)
+        print(f"{short_name(name):<40} {count_tokens(markdown_content):>7} {sent:>11} {single_time:>10.2f} "
+              f"{len(chunks):>6} {chunked_sent:>12} {chunked_time:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import load_samples
+
+from utils.cpu_pool import CPUPool, convert_to_markdown, summarize_for_selectors
+
+
+def prepare(raw_html):
+    # The CPU-bound stages of both approaches for one page
+    return convert_to_markdown(raw_html), summarize_for_selectors(raw_html)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the CPU-bound page stages in threads and in a process pool")
+    parser.add_argument("--copies", type=int, default=4, help="Copies of every sample page in the corpus")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    corpus = [content for _ in range(args.copies) for _, content in load_samples()]
+    size = sum(len(content) for content in corpus) / 1e6
+    print(f"{len(corpus)} pages, {size:.1f} MB, {os.cpu_count()} cores")
+    print(f"{'mode':24} {'warm-up (s)':>11} {'time (s)':>9} {'pages/s':>8} {'MB/s':>6} {'speedup':>8}")
+
+    prepare(corpus[0])
+    started_at = time.perf_counter()
+    for content in corpus:
+        prepare(content)
+    sequential = time.perf_counter() - started_at
+    print(f"{'sequential':24} {'':>11} {sequential:>9.2f} {len(corpus) / sequential:>8.2f} "
+          f"{size / sequential:>6.2f} {1:>8.2f}")
+
+    for workers in args.workers:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            started_at = time.perf_counter()
+            list(executor.map(prepare, corpus))
+            elapsed = time.perf_counter() - started_at
+        print(f"{f'{workers} threads':24} {'':>11} {elapsed:>9.2f} {len(corpus) / elapsed:>8.2f} "
+              f"{size / elapsed:>6.2f} {sequential / elapsed:>8.2f}")
+
+        started_at = time.perf_counter()
+        pool = CPUPool(workers)
+        warm_up = time.perf_counter() - started_at
+        with pool:
+            started_at = time.perf_counter()
+            futures = [(pool.submit(convert_to_markdown, content), pool.submit(summarize_for_selectors, content))
+                       for content in corpus]
+            for markdown, summary in futures:
+                markdown.result()
+                summary.result()
+            elapsed = time.perf_counter() - started_at
+        print(f"{f'{workers} processes':24} {warm_up:>11.2f} {elapsed:>9.2f} {len(corpus) / elapsed:>8.2f} "
+              f"{size / elapsed:>6.2f} {sequential / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+
+from utils.crawl_frontier import crawl, canonicalize_url
+from utils.fetcher import Fetcher
+from utils.pagination import find_pagination_links
+from utils.parsed_document import ParsedDocument
+from utils.chunked_extraction import merge_extractions
+
+
+class PaginatedSiteServer:
+    # A catalogue of `pages` result pages with `per_page` products each. Every page links
+    # to the next one and to a window of numbered pages, with tracking parameters the
+    # crawler has to ignore. Answers take `latency` seconds.
+
+    def __init__(self, pages: int = 20, per_page: int = 20, latency: float = 0.05):
+        self.pages = pages
+        self.per_page = per_page
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render(self, page: int) -> bytes:
+        products = "".join(
+            f'<li class="product"><h3>Product {page}-{i}</h3><p class="price">{page * 100 + i}.00</p></li>'
+            for i in range(self.per_page))
+        links = [f'<a href="/catalogue?page={number}&ref=pg_{page}">{number}</a>'
+                 for number in range(max(1, page - 2), min(self.pages, page + 2) + 1) if number != page]
+        if page < self.pages:
+            links.append(f'<a href="/catalogue?page={page + 1}&utm_source=nav">Next</a>')
+        return (f'<html><body><h1>Catalogue</h1><ul>{products}</ul>'
+                f'<nav class="pagination">{"".join(links)}</nav></body></html>').encode()
+
+    def _make_handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                time.sleep(site.latency)
+                parts = urlsplit(self.path)
+                page = int(parse_qs(parts.query).get("page", ["1"])[0])
+                if parts.path != "/catalogue" or not 1 <= page <= site.pages:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                body = site.render(page)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def make_process_page(extract_seconds):
+    # Stands in for an extraction approach, reads the products from the page after
+    # waiting as long as a GPT call would take
+    def process_page(url, content, follow):
+        document = ParsedDocument(content, base_url=url)
+        follow(find_pagination_links(document, url))
+        time.sleep(extract_seconds)
+        products = [{"name": item.findtext("h3"), "price": item.findtext("p")}
+                    for item in document.tree.getroot().iter("li")]
+        return {"products": products}
+    return process_page
+
+
+def crawl_sequentially(start_url, process_page, fetch, max_pages):
+    # One page after the other, following the next page link of every page the way a
+    # loop over "next" links would
+    results = []
+    seen = set()
+    url = canonicalize_url(start_url)
+    while url and url not in seen and len(results) < max_pages:
+        seen.add(url)
+        links = []
+        results.append(process_page(url, fetch(url), links.extend))
+        # The next page link comes first
+        url = next((link for link in links if link not in seen), None)
+    return merge_extractions(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl a paginated catalogue sequentially and through the crawl frontier")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per page request")
+    parser.add_argument("--extract-seconds", type=float, default=0.5, help="Simulated extraction time per page")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--politeness-delay", type=float, default=0.1)
+    args = parser.parse_args()
+
+    process_page = make_process_page(args.extract_seconds)
+    print(f"{'mode':32} {'pages':>6} {'records':>8} {'requests':>9} {'time (s)':>9} {'pages/s':>8}")
+    with PaginatedSiteServer(pages=args.pages, latency=args.latency) as site, \
+            Fetcher(use_cache=False) as fetcher:
+        fetch = lambda url: fetcher.fetch(url).content
+        start_url = f"{site.base_url}/catalogue?page=1"
+
+        site.requests = 0
+        started_at = time.perf_counter()
+        records = crawl_sequentially(start_url, process_page, fetch, args.pages)
+        elapsed = time.perf_counter() - started_at
+        print(f"{'sequential next links':32} {args.pages:>6} {len(records['products']):>8} {site.requests:>9} "
+              f"{elapsed:>9.2f} {args.pages / elapsed:>8.2f}")
+
+        for workers in args.workers:
+            site.requests = 0
+            result = asyncio.run(crawl([start_url], process_page, max_pages=args.pages, workers=workers,
+                                       politeness_delay=args.politeness_delay, fetch=fetch))
+            print(f"{f'frontier, {workers} workers':32} {len(result.pages):>6} {len(result.records['products']):>8} "
+                  f"{site.requests:>9} {result.elapsed:>9.2f} {len(result.pages) / result.elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import tracemalloc
+
+import bs4
+from common import load_samples, short_name, best_of
+from utils.parsed_document import ParsedDocument, TAGS_TO_DECOMPOSE
+from utils.selector_utils import summarize_body_using_dict_method
+from utils.content_node import truncate_text, escape_css_identifier
+
+
+def legacy_summarize(document, max_content_items=2):
+    # The recursive BeautifulSoup implementation, get_text at every keyed tag and a
+    # full copy of the result to clean it
+    def process_tag(tag, result_dict):
+        key = None
+        if 'id' in tag.attrs:
+            key = f"#{escape_css_identifier(tag['id'])}"
+        elif 'class' in tag.attrs and tag['class']:
+            key = '.' + '.'.join(escape_css_identifier(cls) for cls in tag['class'])
+        if key:
+            if key not in result_dict:
+                result_dict[key] = {'content': [], 'children': {}}
+            text = tag.get_text(strip=True)
+            if text:
+                result_dict[key]['content'].append(truncate_text(text))
+            for child in tag.children:
+                if isinstance(child, bs4.element.Tag):
+                    process_tag(child, result_dict[key]['children'])
+        else:
+            for child in tag.children:
+                if isinstance(child, bs4.element.Tag):
+                    process_tag(child, result_dict)
+
+    def clean_and_truncate(d):
+        if not isinstance(d, dict):
+            return d
+        clean_dict = {}
+        for key, value in d.items():
+            if key == 'content':
+                value = [item for item in value if item.strip()][:max_content_items]
+            else:
+                value = clean_and_truncate(value)
+            if value:
+                clean_dict[key] = value
+        return {k: v for k, v in clean_dict.items() if v}
+
+    soup = bs4.BeautifulSoup(document.body_html, 'lxml')
+    for tag in soup(TAGS_TO_DECOMPOSE):
+        tag.decompose()
+    result_dict = {}
+    process_tag(soup.body if soup.body else soup, result_dict)
+    return clean_and_truncate(result_dict)
+
+
+def peak_memory(func):
+    # Peak bytes allocated by Python while func runs, lxml's C allocations are not traced
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the single pass dict summary against the recursive one.")
+    parser.add_argument("--samples", nargs="*", default=["bookingcom.html", "THE 10 BEST Hotels in New York City 2024 (from $96) - Tripadvisor.html"])
+    parser.add_argument("--max-content-items", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sample':<40} {'legacy (s)':>11} {'new (s)':>9} {'legacy MiB':>11} {'new MiB':>9} {'same':>5}")
+    for name, raw in load_samples(args.samples):
+        document = ParsedDocument(raw)
+        document.cleaned_tree
+        legacy = lambda: legacy_summarize(document, args.max_content_items)
+        new = lambda: summarize_body_using_dict_method(document, args.max_content_items)
+        legacy_time, legacy_result = best_of(legacy, args.repeat)
+        new_time, new_result = best_of(new, args.repeat)
+        legacy_memory = peak_memory(legacy) / 2 ** 20
+        new_memory = peak_memory(new) / 2 ** 20
+        print(f"{short_name(name):<40} {legacy_time:>11.3f} {new_time:>9.3f} {legacy_memory:>11.1f} {new_memory:>9.1f} "
+              f"{str(legacy_result == new_result):>5}")
+
+
+if __name__ == "__main__":
+    main()
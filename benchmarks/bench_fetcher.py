@@ -0,0 +1,72 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+from local_http_server import LocalHTTPServer
+from utils.fetcher import Fetcher, HTTPCache
+
+
+def legacy_fetch(url):
+    # The previous page fetch, a new connection per request, no timeout, no cache
+    return requests.get(url).content
+
+
+def run(server, urls, fetch, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = list(executor.map(fetch, urls))
+    return time.perf_counter() - start, contents
+
+
+def report(label, server, elapsed, before):
+    connections, requests_made, not_modified, body_bytes = before
+    print(f"{label:<22} {elapsed:>7.2f} {server.requests - requests_made:>9} {server.connections - connections:>12} "
+          f"{server.not_modified - not_modified:>5} {(server.body_bytes - body_bytes) / 2 ** 20:>9.2f}")
+
+
+def snapshot(server):
+    return server.connections, server.requests, server.not_modified, server.body_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy page fetches against the pooled, cached fetcher on a local HTTP server.")
+    parser.add_argument("--rounds", type=int, default=10, help="Times every sample page is requested per run.")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--per-host-limit", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    with LocalHTTPServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as directory:
+        urls = server.urls * args.rounds
+        print(f"{'run':<22} {'wall (s)':>7} {'requests':>9} {'connections':>12} {'304s':>5} {'body MiB':>9}")
+
+        before = snapshot(server)
+        elapsed, expected = run(server, urls, legacy_fetch, args.workers)
+        report("requests.get", server, elapsed, before)
+
+        cache = HTTPCache(os.path.join(directory, "http_cache.sqlite3"))
+        with Fetcher(per_host_limit=args.per_host_limit, use_cache=False) as fetcher:
+            server.max_in_flight = 0
+            before = snapshot(server)
+            elapsed, contents = run(server, urls, lambda url: fetcher.fetch(url).content, args.workers)
+            report("pooled, no cache", server, elapsed, before)
+            assert contents == expected
+            print(f"{'':<22} most requests in flight: {server.max_in_flight} (per host limit {args.per_host_limit})")
+
+        with Fetcher(per_host_limit=args.per_host_limit, cache=cache) as fetcher:
+            before = snapshot(server)
+            elapsed, contents = run(server, server.urls, lambda url: fetcher.fetch(url).content, args.workers)
+            report("pooled, cold cache", server, elapsed, before)
+            before = snapshot(server)
+            elapsed, contents = run(server, urls, lambda url: fetcher.fetch(url).content, args.workers)
+            report("pooled, revalidated", server, elapsed, before)
+            assert contents == expected
+        print(f"cache: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import subprocess
+import sys
+
+from common import REPO_ROOT
+
+CORE_MODULES = [
+    "utils.ensure_limit",
+    "utils.parsed_document",
+    "utils.selector_utils",
+    "utils.purely_gpt_utils",
+    "utils.css_selector_utils",
+    "utils.batch_runner",
+]
+HEAVY_MODULES = ["streamlit", "openai", "tiktoken", "html2text", "bs4"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module, repeat):
+    # Import in a fresh interpreter each time so nothing is already cached in sys.modules
+    best, loaded = None, []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                                 cwd=REPO_ROOT, capture_output=True, text=True)
+        if process.returncode != 0:
+            return None, [process.stderr.strip().splitlines()[-1]]
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        best = result["seconds"] if best is None else min(best, result["seconds"])
+        loaded = result["loaded"]
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold import time of the core utils modules.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    reference, _ = measure("streamlit", args.repeat)
+    print(f"{'module':<28} {'import (s)':>10}  heavy modules loaded")
+    print(f"{'streamlit (reference)':<28} {reference:>10.3f}")
+    for module in CORE_MODULES:
+        seconds, loaded = measure(module, args.repeat)
+        seconds = f"{seconds:.3f}" if seconds is not None else "failed"
+        print(f"{module:<28} {seconds:>10}  {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import argparse
+import copy
+import random
+import time
+
+import lxml.html
+from common import load_samples, short_name, best_of
+from utils.parsed_document import ParsedDocument
+from utils.layout_fingerprint import compute_layout_signature, LayoutClusterIndex
+
+
+def make_variant(document, rng, drop_ratio=0.05, max_subtree=20):
+    # A page rendered from the same template: other text, other numbers in ids and
+    # classes, and a few small blocks missing or repeated as listings usually differ
+    root = copy.deepcopy(document.root)
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        if element.text and element.text.strip():
+            element.text = f"text {rng.randint(0, 10 ** 6)}"
+        for attribute in ("id", "class"):
+            value = element.get(attribute)
+            if value and any(c.isdigit() for c in value):
+                element.set(attribute, ''.join(str(rng.randint(0, 9)) if c.isdigit() else c for c in value))
+    body = root.find('body')
+    elements = [e for e in (body if body is not None else root).iter()
+                if isinstance(e.tag, str) and sum(1 for _ in e.iter()) <= max_subtree][1:]
+    for element in rng.sample(elements, int(len(elements) * drop_ratio)):
+        parent = element.getparent()
+        if parent is None:
+            continue
+        if rng.random() < 0.5:
+            parent.remove(element)
+        else:
+            parent.append(copy.deepcopy(element))
+    return lxml.html.tostring(root)
+
+
+def brute_force_clusters(signatures, threshold):
+    # Reference clustering comparing every page with every page indexed before it
+    cluster_of = []
+    for i, signature in enumerate(signatures):
+        best, best_similarity = None, threshold
+        for j in range(i):
+            similarity = signature.similarity(signatures[j])
+            if similarity >= best_similarity:
+                best, best_similarity = j, similarity
+        cluster_of.append(cluster_of[best] if best is not None else i)
+    return cluster_of
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time layout signatures and clustering on sample pages and synthetic variants.")
+    parser.add_argument("--variants", type=int, default=20, help="Synthetic variants per sample page.")
+    parser.add_argument("--index-pages", type=int, default=5000, help="Pages inserted in the index scaling run.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    print(f"{'sample':<40} {'bytes':>9} {'parse (s)':>10} {'signature (s)':>14} {'shingles':>9} {'variant sim':>12}")
+    pages = []
+    for name, raw in load_samples():
+        parse_time, document = best_of(lambda: ParsedDocument(raw), args.repeat)
+        signature_time, signature = best_of(lambda: compute_layout_signature(document), args.repeat)
+        variant_signatures = [compute_layout_signature(make_variant(document, rng)) for _ in range(args.variants)]
+        similarities = [signature.similarity(v) for v in variant_signatures]
+        pages.append((name, signature, variant_signatures))
+        print(f"{short_name(name):<40} {len(raw):>9} {parse_time:>10.3f} {signature_time:>14.4f} "
+              f"{signature.shingle_count:>9} {min(similarities):>5.2f}-{max(similarities):.2f}")
+
+    print("\nCross-page similarity (different layouts should stay below the threshold)")
+    for i, (name_a, signature_a, _) in enumerate(pages):
+        for name_b, signature_b, _ in pages[i + 1:]:
+            print(f"  {short_name(name_a, 30):<30} {short_name(name_b, 30):<30} "
+                  f"minhash {signature_a.similarity(signature_b):.2f} simhash distance {signature_a.hamming_distance(signature_b):>2}")
+
+    # Cluster purity: every variant should land in the cluster of its own sample
+    labelled = []
+    for name, signature, variants in pages:
+        labelled.append((name, signature))
+        labelled.extend((name, v) for v in variants)
+    rng.shuffle(labelled)
+    index = LayoutClusterIndex()
+    for page_id, (name, signature) in enumerate(labelled):
+        index.add(page_id, signature)
+    clusters = index.clusters()
+    pure = sum(1 for members in clusters.values() if len({labelled[m][0] for m in members}) == 1)
+    print(f"\n{len(labelled)} pages from {len(pages)} layouts -> {len(clusters)} clusters, {pure} pure")
+
+    # Scaling: LSH insertion against the all-pairs reference on the same pages
+    signatures = [labelled[i % len(labelled)][1] for i in range(args.index_pages)]
+    start = time.perf_counter()
+    index = LayoutClusterIndex()
+    for page_id, signature in enumerate(signatures):
+        index.add(page_id, signature)
+    lsh_time = time.perf_counter() - start
+    brute_pages = min(args.index_pages, 2000)
+    start = time.perf_counter()
+    brute_force_clusters(signatures[:brute_pages], index.threshold)
+    brute_time = time.perf_counter() - start
+    print(f"LSH index: {args.index_pages} pages in {lsh_time:.3f}s ({lsh_time / args.index_pages * 1e6:.0f} us/page)")
+    print(f"All pairs: {brute_pages} pages in {brute_time:.3f}s ({brute_time / brute_pages * 1e6:.0f} us/page)")
+
+
+if __name__ == "__main__":
+    main()
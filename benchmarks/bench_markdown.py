@@ -0,0 +1,44 @@
+import argparse
+
+from common import load_samples, short_name, best_of
+from utils.ensure_limit import count_tokens
+from utils.markdown_converter import html_to_markdown
+from utils.parsed_document import ParsedDocument
+
+BASE_URL = "https://example.com"
+
+
+def legacy_convert(document):
+    # The previous path: serialize the parsed body and have html2text parse it again
+    import html2text
+    return html2text.html2text(document.html, baseurl=BASE_URL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the single-pass markdown converter against html2text")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="Skip html2text, e.g. when it is not installed")
+    args = parser.parse_args()
+
+    print(f"{'sample':40} {'MB':>6} {'legacy MB/s':>12} {'new MB/s':>9} {'legacy tokens':>14} {'new tokens':>11}")
+    total_size = total_legacy_time = total_new_time = 0.0
+    for name, content in load_samples():
+        size = len(content) / 1e6
+        document = ParsedDocument(content, base_url=BASE_URL)
+        new_time, markdown = best_of(lambda: html_to_markdown(document.original_body, base_url=BASE_URL), args.repeat)
+        legacy_rate = legacy_tokens = ""
+        if not args.skip_legacy:
+            legacy_time, legacy_markdown = best_of(lambda: legacy_convert(document), args.repeat)
+            legacy_rate = f"{size / legacy_time:.2f}"
+            legacy_tokens = count_tokens(legacy_markdown)
+            total_legacy_time += legacy_time
+        total_size += size
+        total_new_time += new_time
+        print(f"{short_name(name):40} {size:>6.2f} {legacy_rate:>12} {size / new_time:>9.2f} "
+              f"{legacy_tokens:>14} {count_tokens(markdown):>11}")
+    legacy_rate = f"{total_size / total_legacy_time:.2f}" if total_legacy_time else ""
+    print(f"{'all samples':40} {total_size:>6.2f} {legacy_rate:>12} {total_size / total_new_time:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import json
+
+from common import load_samples, short_name, best_of
+from utils.ensure_limit import count_tokens
+from utils.pagination import rank_pagination_candidates, CONFIDENT_SCORE, MAX_GPT_CANDIDATES
+from utils.parsed_document import ParsedDocument
+from utils.prompts import (SYSTEM_PROMPT_FOR_PAGINATION_REQUEST, PAGINATION_LINKS_TEMPLATE,
+                           SYSTEM_PROMPT_FOR_PAGINATION_CANDIDATES, PAGINATION_CANDIDATES_TEMPLATE)
+from utils.purely_gpt_utils import scrape_and_convert
+
+# The saved pages carry no URL of their own, their links are resolved against these
+PAGE_URLS = {
+    "amazon_nailcutters.html": "https://www.amazon.com/s?k=nail+cutter",
+    "amazon_test.html": "https://www.amazon.com/s?k=personalized+metal+signs",
+    "bookingcom.html": "https://www.booking.com/searchresults.html",
+    "books.html": "https://books.toscrape.com/catalogue/page-1.html",
+}
+DEFAULT_PAGE_URL = "https://www.tripadvisor.com/Hotels-g60763-New_York_City_New_York-Hotels.html"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pagination detector against the full-page GPT prompt")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'sample':40} {'detect (ms)':>11} {'links':>6} {'best':>5} {'decision':>9} "
+          f"{'page prompt tokens':>19} {'candidate prompt tokens':>24}")
+    for name, content in load_samples():
+        page_url = PAGE_URLS.get(name, DEFAULT_PAGE_URL)
+        document = ParsedDocument(content, base_url=page_url)
+        elapsed, candidates = best_of(lambda: rank_pagination_candidates(document, page_url), args.repeat)
+        confident = [candidate for candidate in candidates if candidate.score >= CONFIDENT_SCORE]
+        decision = "local" if confident else "gpt" if candidates else "none"
+
+        # The previous approach sent the whole page as markdown on every page
+        page_prompt = PAGINATION_LINKS_TEMPLATE.render(MARKDOWN_CONTENT=scrape_and_convert(document))
+        page_tokens = count_tokens(SYSTEM_PROMPT_FOR_PAGINATION_REQUEST + page_prompt)
+        candidate_tokens = 0
+        if decision == "gpt":
+            listing = json.dumps([{'id': index, 'text': candidate.text, 'url': candidate.url}
+                                  for index, candidate in enumerate(candidates[:MAX_GPT_CANDIDATES])], ensure_ascii=False)
+            candidate_tokens = count_tokens(SYSTEM_PROMPT_FOR_PAGINATION_CANDIDATES +
+                                            PAGINATION_CANDIDATES_TEMPLATE.render(CANDIDATES=listing))
+        best = candidates[0].score if candidates else 0.0
+        print(f"{short_name(name):40} {elapsed * 1000:>11.1f} {len(confident):>6} {best:>5.2f} {decision:>9} "
+              f"{page_tokens:>19} {candidate_tokens:>24}")
+
+
+if __name__ == "__main__":
+    main()
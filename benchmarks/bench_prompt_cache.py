@@ -0,0 +1,76 @@
+import argparse
+import os
+import time
+
+from common import load_samples, short_name
+from mock_openai_server import MockOpenAIServer
+
+INSTRUCTIONS = ["List every product with its title and price.", "List the name and rating of every item."]
+ANSWER = '{"type": "object", "properties": {"products": {"type": "array"}}}'
+
+
+def page_last(document, instruction, on_usage):
+    # The previous layout, the task first and the page after it, the schema call reading
+    # the collapsed page
+    from utils.get_gpt_response_json import get_gpt_response_json
+    from utils.prompts import (JSON_SCHEMA_TEMPLATE, STRUCTURED_CONTENT_TEMPLATE, SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA,
+                               SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)
+    from utils.purely_gpt_utils import scrape_and_convert
+    markdown_content = scrape_and_convert(document)
+    collapsed_markdown = scrape_and_convert(document, collapse_records=True)
+    json_schema = get_gpt_response_json(
+        JSON_SCHEMA_TEMPLATE.render(INSTRUCTION=instruction, SCRAPED_CONTENT=collapsed_markdown),
+        SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA, on_usage=on_usage)
+    get_gpt_response_json(
+        STRUCTURED_CONTENT_TEMPLATE.render(INSTRUCTION=instruction, JSON_SCHEMA=str(json_schema),
+                                           SCRAPED_CONTENT=markdown_content),
+        SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA, on_usage=on_usage)
+
+
+def page_first(document, instruction, on_usage):
+    from utils.purely_gpt_utils import extract_using_approach_1
+
+    def on_result(label, value):
+        if label.endswith("Call Usage"):
+            on_usage(value)
+
+    extract_using_approach_1(document, instruction, on_result=on_result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prompt and cached prompt tokens of approach 1 with the page after and before the task, against a mock server with a prompt cache")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.02)
+    parser.add_argument("--seconds-per-1k-cached-tokens", type=float, default=0.002)
+    args = parser.parse_args()
+
+    print(f"{'sample':40} {'layout':>10} {'calls':>6} {'prompt tokens':>14} {'cached':>8} {'billed':>8} {'time (s)':>9}")
+    with MockOpenAIServer(latency=args.latency, content=ANSWER, seconds_per_1k_tokens=args.seconds_per_1k_tokens,
+                          prompt_cache=True, seconds_per_1k_cached_tokens=args.seconds_per_1k_cached_tokens) as mock:
+        # The synchronous client reads its endpoint from the environment, answers must
+        # come from the mock and not the response cache
+        os.environ["OPENAI_BASE_URL"] = mock.base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        os.environ["LLM_CACHE_DISABLED"] = "1"
+        from utils.parsed_document import ParsedDocument
+
+        for name, content in load_samples():
+            for layout, run in (("page last", page_last), ("page first", page_first)):
+                # Neither layout reads prefixes the other one cached
+                mock.cached_prefixes.clear()
+                usages = []
+                started_at = time.perf_counter()
+                # The same page extracted with two instructions, one after the other
+                for instruction in INSTRUCTIONS:
+                    run(ParsedDocument(content), instruction, usages.append)
+                elapsed = time.perf_counter() - started_at
+                prompt_tokens = sum(usage["prompt_tokens"] for usage in usages)
+                cached_tokens = sum(usage["cached_tokens"] for usage in usages)
+                # Cached tokens at half the price
+                billed = prompt_tokens - cached_tokens // 2
+                print(f"{short_name(name):40} {layout:>10} {len(usages):>6} {prompt_tokens:>14} {cached_tokens:>8} "
+                      f"{billed:>8} {elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
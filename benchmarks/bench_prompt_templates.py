@@ -0,0 +1,44 @@
+import argparse
+
+from common import load_samples, short_name, best_of
+from utils.ensure_limit import count_tokens
+from utils.parsed_document import ParsedDocument
+from utils.prompts import (USER_REQUEST_FOR_STRUCTURED_CONTENT, STRUCTURED_CONTENT_TEMPLATE,
+                           SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA, count_chat_prompt_tokens)
+from utils.purely_gpt_utils import scrape_and_convert
+
+INSTRUCTION = "List every product with its title and price."
+SCHEMA = '{"type": "object", "properties": {"products": {"type": "array"}}}'
+
+
+def chained_replace(markdown_content):
+    # The previous way, one pass over the whole prompt per placeholder
+    return USER_REQUEST_FOR_STRUCTURED_CONTENT.replace("<<JSON_SCHEMA>>", SCHEMA).replace(
+        "<<INSTRUCTION>>", INSTRUCTION).replace("<<SCRAPED_CONTENT>>", markdown_content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the extraction prompt with chained str.replace and with a precompiled template, and count its tokens")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'sample':40} {'replace (ms)':>12} {'render (ms)':>11} {'same':>5} {'prompt tokens':>14} "
+          f"{'encode (ms)':>11} {'cached count (ms)':>18}")
+    for name, content in load_samples():
+        markdown_content = scrape_and_convert(ParsedDocument(content))
+        values = dict(JSON_SCHEMA=SCHEMA, INSTRUCTION=INSTRUCTION, SCRAPED_CONTENT=markdown_content)
+        replace_time, replaced = best_of(lambda: chained_replace(markdown_content), args.repeat)
+        render_time, rendered = best_of(lambda: STRUCTURED_CONTENT_TEMPLATE.render(**values), args.repeat)
+        # Encoding the whole prompt against counting it from cached segment counts, the
+        # page's count is cached by the first call the way a second call on the page finds it
+        encode_time, tokens = best_of(lambda: count_tokens(rendered), 3)
+        count_chat_prompt_tokens(SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA,
+                                 STRUCTURED_CONTENT_TEMPLATE, **values)
+        count_time, counted = best_of(lambda: STRUCTURED_CONTENT_TEMPLATE.count_tokens(**values), 3)
+        assert counted == tokens, (name, counted, tokens)
+        print(f"{short_name(name):40} {replace_time * 1000:>12.3f} {render_time * 1000:>11.3f} "
+              f"{str(replaced == rendered):>5} {tokens:>14} {encode_time * 1000:>11.2f} {count_time * 1000:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
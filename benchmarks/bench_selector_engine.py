@@ -0,0 +1,95 @@
+import argparse
+
+from bs4 import BeautifulSoup
+from lxml.cssselect import CSSSelector
+from common import load_samples, short_name, best_of
+from utils.parsed_document import ParsedDocument, element_text
+from utils.selector_utils import summarize_body_using_dict_method
+from utils.selector_engine import CompiledSelectorPlan, compile_selectors
+
+
+def legacy_scrape(soup, selectors):
+    # The BeautifulSoup implementation, soup.select once per selector
+    def scrape_nested(soup, selectors, content_dict):
+        for name, selector in selectors.items():
+            try:
+                if isinstance(selector, dict):
+                    content_dict[name] = {}
+                    scrape_nested(soup, selector, content_dict[name])
+                else:
+                    selector_string = ' '.join(selector) if isinstance(selector, list) else selector
+                    content_dict[name] = [element.get_text(strip=True) for element in soup.select(selector_string)]
+            except Exception:
+                content_dict[name] = []
+    scraped_content = {}
+    scrape_nested(soup, selectors, scraped_content)
+    return scraped_content
+
+
+def uncompiled_scrape(root, selectors):
+    # lxml without plan caching, every selector is translated on every call
+    scraped_content = {}
+    for name, selector in selectors.items():
+        if isinstance(selector, dict):
+            scraped_content[name] = uncompiled_scrape(root, selector)
+        else:
+            selector_string = ' '.join(selector) if isinstance(selector, list) else selector
+            try:
+                scraped_content[name] = [element_text(e) for e in CSSSelector(selector_string, translator='html')(root)]
+            except Exception:
+                scraped_content[name] = []
+    return scraped_content
+
+
+def build_selectors(document, count):
+    # A selector dict shaped like the ones GPT returns, made of the summary's keys
+    # and of descendant combinations of a key with its children
+    selectors = {"fields": {}, "nested": {}}
+    stack = [(None, summarize_body_using_dict_method(document, max_content_items=2))]
+    while stack and len(selectors["fields"]) + len(selectors["nested"]) < count:
+        parent, node = stack.pop(0)
+        for key, value in node.items():
+            if key == "content" or not isinstance(value, dict):
+                continue
+            selector = key if parent is None else f"{parent} {key}"
+            target = selectors["nested"] if parent else selectors["fields"]
+            target[f"field_{len(target)}"] = selector
+            stack.append((key, value.get("children", {})))
+    return selectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the compiled selector engine against BeautifulSoup.")
+    parser.add_argument("--samples", nargs="*", default=["amazon_test.html", "bookingcom.html"])
+    parser.add_argument("--selectors", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'sample':<22} {'sel':>4} {'bs4 (s)':>9} {'lxml (s)':>9} {'compile (s)':>12} {'cached (s)':>11} {'speedup':>8} {'same':>5}")
+    for name, raw in load_samples(args.samples):
+        document = ParsedDocument(raw)
+        selectors = build_selectors(document, args.selectors)
+        total = len(selectors["fields"]) + len(selectors["nested"])
+
+        # The BeautifulSoup version parsed the page with html.parser on every call,
+        # the parse is subtracted so only selector evaluation is compared
+        legacy_time, legacy_result = best_of(
+            lambda: legacy_scrape(BeautifulSoup(raw, 'html.parser'), selectors), max(1, args.repeat // 2))
+        select_only_time, _ = best_of(lambda: legacy_scrape(BeautifulSoup(raw, 'html.parser'), {}), 1)
+        legacy_time -= select_only_time
+        uncompiled_time, _ = best_of(lambda: uncompiled_scrape(document.root, selectors), args.repeat)
+        compile_time, _ = best_of(lambda: CompiledSelectorPlan(selectors), args.repeat)
+        compile_selectors(selectors)
+
+        def evaluate_cached_plan():
+            # The page index is rebuilt every time, as it would be for a new page
+            document.selector_index = None
+            return compile_selectors(selectors).evaluate(document)
+        cached_time, result = best_of(evaluate_cached_plan, args.repeat)
+
+        print(f"{short_name(name, 22):<22} {total:>4} {legacy_time:>9.4f} {uncompiled_time:>9.4f} {compile_time:>12.4f} "
+              f"{cached_time:>11.4f} {legacy_time / cached_time:>7.1f}x {str(result == legacy_result):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from common import load_samples, short_name
+from mock_openai_server import MockOpenAIServer
+
+INSTRUCTION = "List every product with its title and price."
+ANSWER = json.dumps({"json_schema": {"type": "object", "properties": {"products": {"type": "array"}}},
+                     "data": {"products": [{"title": f"Product {i}", "price": f"${i}.99"} for i in range(20)]}})
+# Pages of one site, the saved pages carry no URL of their own
+PAGE_URL = "https://shop.example.com"
+
+MODES = [
+    ("schema call + extraction", dict(single_call=False, use_schema_cache=False)),
+    ("schema call, stored schema", dict(single_call=False, use_schema_cache=True)),
+    ("single call", dict(single_call=True, use_schema_cache=False)),
+    ("single call, stored schema", dict(single_call=True, use_schema_cache=True)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPT calls, prompt tokens and time of approach 1 over several pages of a site, with the schema generated in a call of its own, in the extraction call, and stored after the first page")
+    parser.add_argument("--pages", type=int, default=5, help="Pages of the site extracted one after the other")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.02)
+    parser.add_argument("--samples", nargs="*", default=["amazon_test.html", "bookingcom.html", "books.html"])
+    args = parser.parse_args()
+
+    with MockOpenAIServer(latency=args.latency, content=ANSWER, seconds_per_1k_tokens=args.seconds_per_1k_tokens) as mock, \
+            tempfile.TemporaryDirectory() as directory:
+        # The synchronous client reads its endpoint from the environment, answers must
+        # come from the mock and not the response cache, schemas go to a fresh store
+        os.environ["OPENAI_BASE_URL"] = mock.base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        os.environ["LLM_CACHE_DISABLED"] = "1"
+        os.environ["TEMPLATE_STORE_PATH"] = os.path.join(directory, "templates.sqlite3")
+        from utils.parsed_document import ParsedDocument
+        from utils.purely_gpt_utils import extract_using_approach_1
+        from utils.template_store import get_default_template_store
+
+        print(f"{'sample':40} {'mode':>28} {'calls':>6} {'prompt tokens':>14} {'s/page':>7}")
+        for name, content in load_samples(args.samples):
+            for mode, options in MODES:
+                get_default_template_store().clear()
+                requests, prompt_tokens = mock.request_count, mock.prompt_tokens
+                started_at = time.perf_counter()
+                for _ in range(args.pages):
+                    extract_using_approach_1(ParsedDocument(content, base_url=PAGE_URL), INSTRUCTION,
+                                             base_url=PAGE_URL, **options)
+                elapsed = time.perf_counter() - started_at
+                print(f"{short_name(name):40} {mode:>28} {mock.request_count - requests:>6} "
+                      f"{mock.prompt_tokens - prompt_tokens:>14} {elapsed / args.pages:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
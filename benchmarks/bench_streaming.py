@@ -0,0 +1,51 @@
+import argparse
+import json
+import os
+import time
+
+from common import REPO_ROOT  # noqa: F401  (puts the repo on sys.path)
+from mock_openai_server import MockOpenAIServer
+
+
+def make_answer(records):
+    return json.dumps({"products": [{"title": f"Product {i}", "price": f"${i}.99", "rating": "4.5 out of 5 stars"}
+                                    for i in range(records)]}, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time to first record of a streamed answer against waiting for the full answer.")
+    parser.add_argument("--records", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--seconds-per-chunk", type=float, default=0.01)
+    parser.add_argument("--stop-after", type=int, default=10, help="Records to read before cancelling the third run.")
+    args = parser.parse_args()
+
+    content = make_answer(args.records)
+    with MockOpenAIServer(latency=args.latency, content=content, seconds_per_chunk=args.seconds_per_chunk) as mock:
+        # The synchronous client reads its endpoint from the environment
+        os.environ["OPENAI_BASE_URL"] = mock.base_url
+        os.environ["OPENAI_API_KEY"] = "mock"
+        from utils.get_gpt_response_json import get_gpt_response_json, stream_gpt_response_json
+
+        start = time.perf_counter()
+        result = get_gpt_response_json("page", model="mock", use_cache=False)
+        blocking_time = time.perf_counter() - start
+        print(f"{'blocking':<10} records={len(result.get('products', [])):<4} first record={blocking_time:.2f}s total={blocking_time:.2f}s")
+
+        result, stream = stream_gpt_response_json("page", model="mock", use_cache=False)
+        print(f"{'streamed':<10} records={len(stream.records):<4} first record={stream.time_to_first_record:.2f}s "
+              f"total={stream.total_time:.2f}s same={result == json.loads(content)}")
+
+        shown = []
+
+        def show_until_enough(path, record):
+            shown.append(record)
+            return len(shown) < args.stop_after
+
+        result, stream = stream_gpt_response_json("page", model="mock", use_cache=False, on_record=show_until_enough)
+        print(f"{'cancelled':<10} records={len(stream.records):<4} first record={stream.time_to_first_record:.2f}s "
+              f"total={stream.total_time:.2f}s complete={stream.complete}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import argparse
+
+from common import load_samples, short_name, best_of
+from utils.ensure_limit import get_encoding, truncate_to_token_limit
+
+
+def legacy_reduce(input_string, token_limit, chunk_size=1000):
+    # The previous implementation: drop chunk_size characters and re-encode everything
+    enc = get_encoding()
+    total_tokens = len(enc.encode(input_string, disallowed_special=()))
+    passes = 1
+    while total_tokens > token_limit and len(input_string) > 0:
+        input_string = input_string[:-min(chunk_size, len(input_string))]
+        total_tokens = len(enc.encode(input_string, disallowed_special=()))
+        passes += 1
+    return input_string, passes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare token truncation against the legacy chunk loop.")
+    parser.add_argument("--token-limit", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-legacy", action="store_true", help="The legacy loop takes minutes on the larger pages.")
+    args = parser.parse_args()
+
+    get_encoding()
+    print(f"{'sample':<40} {'chars':>9} {'strategy':>8} {'new (s)':>9} {'legacy (s)':>11} {'encodes':>8}")
+    for name, raw in load_samples():
+        text = raw.decode("utf-8", errors="ignore")
+        for strategy in ("head", "tail", "middle"):
+            new_time, _ = best_of(lambda: truncate_to_token_limit(text, args.token_limit, strategy), args.repeat)
+            legacy_time, passes = "-", "-"
+            if strategy == "head" and not args.skip_legacy:
+                legacy_time, (_, passes) = best_of(lambda: legacy_reduce(text, args.token_limit), 1)
+                legacy_time = f"{legacy_time:.3f}"
+            print(f"{short_name(name):<40} {len(text):>9} {strategy:>8} {new_time:>9.3f} {legacy_time:>11} {passes:>8}")
+
+
+if __name__ == "__main__":
+    main()
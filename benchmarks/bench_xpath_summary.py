@@ -0,0 +1,105 @@
+import argparse
+import re
+import sys
+import tracemalloc
+
+from lxml import etree
+from common import load_samples, short_name, best_of
+from utils.parsed_document import ParsedDocument
+from utils.xpath_utils import summarize_body_using_xpath_method
+
+
+def legacy_summarize(html_content, max_content_length=70):
+    # The recursive implementation calling getpath and re.sub for every node
+    result_dict = {}
+    tree = ParsedDocument.from_content(html_content).cleaned_tree
+
+    def process_element(element, result_dict):
+        xpath = re.sub(r'\[\d+\]', '[1]', tree.getpath(element))
+        if xpath not in result_dict:
+            result_dict[xpath] = {'content': [], 'children': {}}
+            class_name = element.get('class')
+            if class_name:
+                result_dict[xpath]['class'] = ' '.join(class_name).replace(' ', '')
+        text = (element.text or '').strip()
+        if text:
+            truncated_text = text[:max_content_length] + '...' if len(text) > max_content_length else text
+            result_dict[xpath]['content'].append(truncated_text)
+        unique_children = {}
+        for child in element:
+            child_tag = tree.getpath(child).split('/')[-1]
+            if child_tag not in unique_children:
+                unique_children[child_tag] = True
+                process_element(child, result_dict[xpath]['children'])
+
+    process_element(tree.getroot(), result_dict)
+
+    def clean_dict(d):
+        if isinstance(d, dict):
+            cleaned = {k: clean_dict(v) for k, v in d.items() if v}
+            if 'content' in cleaned:
+                cleaned['content'] = [item for item in cleaned['content'] if item.strip()][:2]
+            if 'children' in cleaned and not cleaned['children']:
+                del cleaned['children']
+            return cleaned if cleaned else None
+        return d
+
+    return clean_dict(result_dict) or {}
+
+
+def peak_memory(func):
+    # Peak bytes allocated by Python while func runs
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def deep_document(depth):
+    # Parsers cap nesting well below the recursion limit, so the tree is built directly
+    document = ParsedDocument("<html><body></body></html>")
+    parent = document.root.find('body')
+    for i in range(depth):
+        parent = etree.SubElement(parent, 'div', {'class': f'level-{i % 7}'})
+        parent.text = f"level {i}"
+    return document
+
+
+def run(label, legacy, new, repeat):
+    try:
+        legacy_time, legacy_result = best_of(legacy, repeat)
+        legacy_memory = f"{peak_memory(legacy) / 2 ** 20:>10.1f}"
+        legacy_time = f"{legacy_time:.3f}"
+    except RecursionError:
+        legacy_time, legacy_result, legacy_memory = "recursion", None, f"{'-':>10}"
+    new_time, new_result = best_of(new, repeat)
+    new_memory = peak_memory(new) / 2 ** 20
+    same = "-" if legacy_result is None else str(legacy_result == new_result)
+    print(f"{short_name(label):<40} {legacy_time:>11} {new_time:>9.3f} {legacy_memory} {new_memory:>10.1f} {same:>5}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the iterative XPath summary against the recursive one.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=sys.getrecursionlimit() * 2)
+    parser.add_argument("--max-nodes", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'sample':<40} {'legacy (s)':>11} {'new (s)':>9} {'legacy MiB':>10} {'new MiB':>10} {'same':>5}")
+    for name, raw in load_samples():
+        document = ParsedDocument(raw)
+        document.cleaned_tree
+        run(name, lambda: legacy_summarize(document), lambda: summarize_body_using_xpath_method(document), args.repeat)
+        budget_time, _ = best_of(lambda: summarize_body_using_xpath_method(document, max_nodes=args.max_nodes), args.repeat)
+        print(f"{'  with max_nodes=' + str(args.max_nodes):<40} {'':>11} {budget_time:>9.3f}")
+
+    document = deep_document(args.depth)
+    document.cleaned_tree
+    run(f"synthetic depth {args.depth}", lambda: legacy_summarize(document),
+        lambda: summarize_body_using_xpath_method(document), 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import os
+import sys
+import time
+
+# Make the utils package importable when running a benchmark as a script
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+SAMPLE_DIR = os.path.join(REPO_ROOT, "sample")
+
+
+def load_samples(names=None):
+    # Return (name, raw bytes) for every saved page in sample/
+    samples = []
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        path = os.path.join(SAMPLE_DIR, name)
+        if not name.endswith(".html") or not os.path.isfile(path):
+            continue
+        if names and name not in names:
+            continue
+        with open(path, "rb") as f:
+            samples.append((name, f.read()))
+    return samples
+
+
+def short_name(name, width=40):
+    return name if len(name) <= width else name[:width - 3] + "..."
+
+
+def best_of(func, repeat=3):
+    # Run func repeat times and return (best wall time in seconds, last result)
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common import SAMPLE_DIR
+
+
+class LocalHTTPServer:
+    # Serves the saved pages of sample/ over HTTP/1.1 with keep-alive, gzip, ETag and
+    # Last-Modified, with etag=False pages are revalidated by Last-Modified alone.
+    # Counts connections, requests, 304 answers, body bytes and the most requests
+    # handled at once, so fetchers can be checked without the network.
+
+    def __init__(self, latency: float = 0.0, cache_control: str = "no-cache", host: str = "127.0.0.1", port: int = 0,
+                 etag: bool = True):
+        self.latency = latency
+        self.cache_control = cache_control
+        self.etag = etag
+        self.connections = 0
+        self.requests = 0
+        self.not_modified = 0
+        self.body_bytes = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.pages = {}
+        for name in sorted(os.listdir(SAMPLE_DIR)):
+            path = os.path.join(SAMPLE_DIR, name)
+            if name.endswith(".html") and os.path.isfile(path):
+                with open(path, "rb") as f:
+                    content = f.read()
+                self.pages["/" + name.replace(" ", "_")] = (content, gzip.compress(content),
+                                                            '"' + hashlib.sha1(content).hexdigest() + '"',
+                                                            formatdate(os.path.getmtime(path), usegmt=True))
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def urls(self):
+        return [self.base_url + path for path in self.pages]
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def do_GET(self):
+                with server._lock:
+                    server.requests += 1
+                    server._in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server._in_flight)
+                try:
+                    time.sleep(server.latency)
+                    page = server.pages.get(self.path)
+                    if page is None:
+                        self.send_response(404)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    content, compressed, etag, last_modified = page
+                    if server.etag:
+                        not_modified = self.headers.get("If-None-Match") == etag
+                    else:
+                        not_modified = self.headers.get("If-Modified-Since") == last_modified
+                    if not_modified:
+                        with server._lock:
+                            server.not_modified += 1
+                        self.send_response(304)
+                        if server.etag:
+                            self.send_header("ETag", etag)
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    body = content
+                    self.send_response(200)
+                    if "gzip" in self.headers.get("Accept-Encoding", ""):
+                        body = compressed
+                        self.send_header("Content-Encoding", "gzip")
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    if server.etag:
+                        self.send_header("ETag", etag)
+                    self.send_header("Last-Modified", last_modified)
+                    self.send_header("Cache-Control", server.cache_control)
+                    self.end_headers()
+                    self.wfile.write(body)
+                    with server._lock:
+                        server.body_bytes += len(body)
+                finally:
+                    with server._lock:
+                        server._in_flight -= 1
+
+        return Handler
@@ -0,0 +1,200 @@
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prompts are cached in blocks of 128 tokens once 1024 tokens long, as by the OpenAI
+# API, at the 4 characters per token the mock counts with
+PROMPT_CACHE_BLOCK_CHARS = 128 * 4
+PROMPT_CACHE_MIN_CHARS = 1024 * 4
+
+
+class MockOpenAIServer:
+    # Minimal stand-in for the chat completions endpoint.
+    # Every response takes `latency` seconds plus `seconds_per_1k_tokens` for every thousand
+    # prompt tokens, and the first `rate_limited_requests` requests are answered with a 429
+    # carrying a Retry-After header. The answer echoes the request unless `content` is
+    # given. Streamed requests get the answer as server-sent events of `stream_chunk_size`
+    # characters, one every `seconds_per_chunk` seconds.
+    # With `prompt_cache` the longest prefix of the messages seen in an earlier request
+    # is served from a prompt cache: it counts as cached_tokens in the usage and takes
+    # `seconds_per_1k_cached_tokens` instead of `seconds_per_1k_tokens`.
+
+    def __init__(self, latency: float = 0.5, rate_limited_requests: int = 0, retry_after: float = 0.2,
+                 host: str = "127.0.0.1", port: int = 0, seconds_per_1k_tokens: float = 0.0,
+                 content: str = None, stream_chunk_size: int = 16, seconds_per_chunk: float = 0.0,
+                 prompt_cache: bool = False, seconds_per_1k_cached_tokens: float = 0.0):
+        self.latency = latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.prompt_cache = prompt_cache
+        self.seconds_per_1k_cached_tokens = seconds_per_1k_cached_tokens
+        self.cached_prefixes = set()
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.content = content
+        self.stream_chunk_size = stream_chunk_size
+        self.seconds_per_chunk = seconds_per_chunk
+        self.cancelled_streams = 0
+        self.rate_limited_requests = rate_limited_requests
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def build_content(self, body: dict) -> str:
+        if self.content is not None:
+            return self.content
+        return json.dumps({"echo": body["messages"][-1]["content"][-50:]})
+
+    def read_prompt_cache(self, body: dict) -> int:
+        # Cached tokens of the request's longest prefix already seen, the request's own
+        # prefixes are cached for the following requests
+        if not self.prompt_cache:
+            return 0
+        prompt = "".join(message["role"] + "\n" + message["content"] + "\n" for message in body["messages"])
+        digest = hashlib.sha256()
+        cached_chars = 0
+        prefixes = []
+        for start in range(0, len(prompt) - PROMPT_CACHE_BLOCK_CHARS + 1, PROMPT_CACHE_BLOCK_CHARS):
+            digest.update(prompt[start:start + PROMPT_CACHE_BLOCK_CHARS].encode("utf-8"))
+            end = start + PROMPT_CACHE_BLOCK_CHARS
+            if end >= PROMPT_CACHE_MIN_CHARS:
+                prefixes.append(digest.hexdigest())
+                # Every digest covers the whole prefix up to end
+                if prefixes[-1] in self.cached_prefixes:
+                    cached_chars = end
+        with self._lock:
+            self.cached_prefixes.update(prefixes)
+        return cached_chars // 4
+
+    def build_usage(self, prompt_tokens: int, cached_tokens: int, content: str) -> dict:
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                "total_tokens": prompt_tokens + len(content) // 4,
+                "prompt_tokens_details": {"cached_tokens": cached_tokens}}
+
+    def build_completion(self, body: dict, prompt_tokens: int = 0, cached_tokens: int = 0) -> dict:
+        content = self.build_content(body)
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": self.build_usage(prompt_tokens, cached_tokens, content),
+        }
+
+    def _make_handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, body, prompt_tokens, cached_tokens):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                content = mock.build_content(body)
+                try:
+                    for start in range(0, len(content), mock.stream_chunk_size):
+                        time.sleep(mock.seconds_per_chunk)
+                        chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                                 "model": body.get("model", "mock"),
+                                 "choices": [{"index": 0, "finish_reason": None,
+                                              "delta": {"content": content[start:start + mock.stream_chunk_size]}}]}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                        self.wfile.flush()
+                    if (body.get("stream_options") or {}).get("include_usage"):
+                        chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                                 "model": body.get("model", "mock"), "choices": [],
+                                 "usage": mock.build_usage(prompt_tokens, cached_tokens, content)}
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped reading, e.g. after cancelling early
+                    with mock._lock:
+                        mock.cancelled_streams += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with mock._lock:
+                    mock.request_count += 1
+                    request_number = mock.request_count
+                    mock._in_flight += 1
+                    mock.max_in_flight = max(mock.max_in_flight, mock._in_flight)
+                try:
+                    if request_number <= mock.rate_limited_requests:
+                        self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                        {"Retry-After": str(mock.retry_after)})
+                        return
+                    prompt_tokens = sum(len(message["content"]) // 4 for message in body["messages"])
+                    cached_tokens = min(mock.read_prompt_cache(body), prompt_tokens)
+                    with mock._lock:
+                        mock.prompt_tokens += prompt_tokens
+                        mock.cached_tokens += cached_tokens
+                    time.sleep(mock.latency + (prompt_tokens - cached_tokens) / 1000 * mock.seconds_per_1k_tokens
+                               + cached_tokens / 1000 * mock.seconds_per_1k_cached_tokens)
+                    if body.get("stream"):
+                        self._send_stream(body, prompt_tokens, cached_tokens)
+                    else:
+                        # Generating the answer takes as long as streaming it
+                        chunks = -(-len(mock.build_content(body)) // mock.stream_chunk_size)
+                        time.sleep(chunks * mock.seconds_per_chunk)
+                        self._send_json(200, mock.build_completion(body, prompt_tokens, cached_tokens))
+                finally:
+                    with mock._lock:
+                        mock._in_flight -= 1
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock chat completions endpoint.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--rate-limited-requests", type=int, default=0)
+    parser.add_argument("--seconds-per-1k-tokens", type=float, default=0.0)
+    parser.add_argument("--prompt-cache", action="store_true", help="Serve repeated prompt prefixes from a prompt cache")
+    parser.add_argument("--seconds-per-1k-cached-tokens", type=float, default=0.0)
+    args = parser.parse_args()
+    mock = MockOpenAIServer(latency=args.latency, rate_limited_requests=args.rate_limited_requests, port=args.port,
+                            seconds_per_1k_tokens=args.seconds_per_1k_tokens, prompt_cache=args.prompt_cache,
+                            seconds_per_1k_cached_tokens=args.seconds_per_1k_cached_tokens)
+    print(f"Serving on {mock.base_url}")
+    mock.server.serve_forever()
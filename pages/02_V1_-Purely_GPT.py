@@ -1,20 +1,22 @@
 import streamlit as st
-from bs4 import BeautifulSoup
-import html2text
 import validators
 from urllib.parse import urlsplit
 from utils.enhance_instructions import enhance_user_instructions
-from utils.prompts import (SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA,
-                           SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA, SYSTEM_PROMPT_DEFAULT, USER_REQUEST_FOR_JSON_SCHEMA, USER_REQUEST_FOR_STRUCTURED_CONTENT)
-from utils.get_gpt_response_json import get_gpt_response_json
-from utils.ensure_limit import reduce_string_to_token_limit
 from utils.scrape_html_using_scrapenetwork import scrape_body_from_url
+from utils.parsed_document import ParsedDocument
+from utils.purely_gpt_utils import extract_using_approach_1
+from utils.reporting import set_sink
+from utils.streamlit_sink import StreamlitSink, StreamedRecordsView
 # Set page title and icon
 st.set_page_config(
     page_title="Intelli Scrape - Approach 1",
     page_icon=":robot_face:"
 )
 
+# Report progress and results from the utils package on this page
+sink = StreamlitSink()
+set_sink(sink)
+
 @st.cache_data
 def extract_base_url(url):
     try:
@@ -33,18 +35,6 @@ def validate_url(url):
         st.error(f"Error validating URL: {str(e)}")
         return False
 
-# @st.cache_data
-def scrape_and_convert(html_content, base_url=None):
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        markdown_content = html2text.html2text(str(body_content), baseurl=base_url)
-        return markdown_content
-    except Exception as e:
-        st.error(f"Error during HTML to Markdown conversion: {str(e)}")
-        return ""
-
 def main():
     try:
         # Page layout with title
@@ -63,6 +53,13 @@ def main():
         instruction = st.text_area(
             "Enter Instructions:", placeholder="I need a list of all the books and their respective prices on this page.")
 
+        # Pages too long for one GPT call are split and extracted concurrently instead of truncated
+        extract_in_chunks_enabled = st.checkbox("Extract long pages in chunks", value=True)
+        # Records are shown while the answer streams in, the answer can be stopped early
+        max_records = st.number_input("Stop after this many records (0 keeps all)", min_value=0, value=0, step=10)
+        # One call generates the JSON schema and extracts the records with it
+        single_call = st.checkbox("Generate the JSON schema in the extraction call", value=True)
+
         if st.button("Scrape and Analyze"):
             instruction = enhance_user_instructions(instruction)
             st.info(f"Enhanced user instructions:\n\n{instruction}")
@@ -73,9 +70,7 @@ def main():
                         base_url = extract_base_url(url)
                         html_content = scrape_body_from_url(url=url)
                         # st.success(html_content)
-                        # Scrape and convert HTML to Markdown
-                        markdown_content = scrape_and_convert(
-                            html_content=html_content, base_url=base_url)
+                        document = ParsedDocument(html_content, base_url=base_url)
 
                     else:
                         st.error("Invalid URL. Please enter a valid URL.")
@@ -88,8 +83,7 @@ def main():
                     base_url = extract_base_url(url=uploaded_file.name)
                     # Read HTML content from the uploaded file
                     html_content = uploaded_file.read()
-                    # Scrape and convert HTML to Markdown
-                    markdown_content = scrape_and_convert(html_content)
+                    document = ParsedDocument(html_content)
                 else:
                     st.error("Please enter upload a valid HTML file.")
                     return
@@ -97,28 +91,12 @@ def main():
                 st.error("Please enter a URL or upload an HTML file.")
                 return
 
-            with st.expander(label="Scraped Raw Markdown Content"):
-                st.markdown(markdown_content)
-
-            markdown_content = reduce_string_to_token_limit(markdown_content)
-
-            user_request_json_schema = USER_REQUEST_FOR_JSON_SCHEMA.replace(
-                "<<INSTRUCTION>>", instruction).replace("<<SCRAPED_CONTENT>>", markdown_content)
-
-            json_schema = get_gpt_response_json(
-                user_request=user_request_json_schema, system_prompt=SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA)
-
-            with st.expander(label="JSON Schema"):
-                st.json(json_schema)
-
-            user_request_for_structured_content = USER_REQUEST_FOR_STRUCTURED_CONTENT.replace(
-                "<<JSON_SCHEMA>>", str(json_schema)).replace("<<INSTRUCTION>>", instruction).replace("<<SCRAPED_CONTENT>>", markdown_content)
-
-            extracted_structured_content = get_gpt_response_json(
-                user_request=user_request_for_structured_content, system_prompt=SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)
-
-            with st.expander(label="Extracted Structured Content"):
-                st.json(extracted_structured_content)
+            # Every step is shown through the sink, the records while the answer streams in
+            records_view = StreamedRecordsView(max_records=max_records)
+            extract_using_approach_1(document, instruction, base_url=document.base_url, on_result=sink.result,
+                                     on_record=records_view.on_record, single_call=single_call,
+                                     chunked=None if extract_in_chunks_enabled else False)
+            records_view.finish()
 
     except Exception as e:
         st.error(f"An unexpected error occurred: {str(e)}")
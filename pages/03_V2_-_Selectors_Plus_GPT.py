@@ -1,25 +1,26 @@
 import streamlit as st
-from bs4 import BeautifulSoup
 from utils.enhance_instructions import enhance_user_instructions
-from utils.get_gpt_response_json import get_gpt_response_json
+from utils.get_gpt_response_json import get_gpt_response_json, stream_gpt_response_json
 import validators
 import json
 from utils.prompts import (SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS,
-                           USER_REQUEST_FOR_GETTING_THE_DESIRED_SELECTORS,
+                           DESIRED_SELECTORS_TEMPLATE,
                            SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
-                           USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
+                           ENHANCING_SELECTORS_CONTENT_TEMPLATE,
                            SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_XPATHS,  # Import the new XPath prompts
-                           USER_REQUEST_FOR_GETTING_THE_DESIRED_XPATHS,
+                           DESIRED_XPATHS_TEMPLATE,
                            SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT,
-                           USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT)
-from lxml import etree
-from typing import Dict, Any
+                           ENHANCING_XPATHS_CONTENT_TEMPLATE)
 from utils.selector_utils import summarize_body_using_dict_method
 from utils.ascii_utils import summarize_body_using_ascii_tree
-from utils.selector_utils import TAGS_TO_DECOMPOSE
+from utils.xpath_utils import summarize_body_using_xpath_method, scrape_content_using_xpath
+from utils.css_selector_utils import (scrape_content_using_selectors, scrape_body_from_html,
+                                      scrape_body_from_url)
 from utils.ensure_limit import reduce_string_to_token_limit
-import re
-from utils.scrape_html_using_scrapenetwork import scrape_body_from_url as scrape_util
+from utils.summary_budget import fit_summary_to_budget, DEFAULT_SUMMARY_TOKEN_BUDGET
+from utils.template_store import get_selectors_with_template
+from utils.reporting import set_sink
+from utils.streamlit_sink import StreamlitSink, StreamedRecordsView
 
 # Set page title and icon
 st.set_page_config(
@@ -27,105 +28,8 @@ st.set_page_config(
     page_icon=":robot_face:"
 )
 
-def summarize_body_using_xpath_method(html_content: str, max_content_length: int = 70) -> Dict[str, Any]:
-    result_dict = {}
-    
-    # Initialize BeautifulSoup to decompose unnecessary tags
-    soup = BeautifulSoup(html_content, 'html.parser')
-    for tag in soup(TAGS_TO_DECOMPOSE):
-        tag.decompose()
-    
-    # Only process the <body> tag, if it exists
-    body = soup.body if soup.body else soup
-    html_content = str(body)
-    
-    # Parse the HTML content and create an ElementTree object
-    tree = etree.HTML(html_content)
-    tree = etree.ElementTree(tree)
-
-    def process_element(element, result_dict, include_siblings=True):
-        xpath = tree.getpath(element)
-        # Normalize the xpath by removing list indices and keeping only the first sibling
-        xpath = re.sub(r'\[\d+\]', '[1]', xpath)
-        if xpath not in result_dict:
-            result_dict[xpath] = {'content': [], 'children': {}}
-            # Add class attribute if it exists
-            class_name = element.get('class')
-            if class_name:
-                result_dict[xpath]['class'] = ' '.join(class_name).replace(' ', '')
-        text = (element.text or '').strip()
-        if text:
-            # Truncate the text if it's longer than max_content_length
-            truncated_text = text[:max_content_length] + '...' if len(text) > max_content_length else text
-            result_dict[xpath]['content'].append(truncated_text)
-        # Process only the first child of each type
-        unique_children = {}
-        for child in element:
-            child_xpath = tree.getpath(child)
-            child_tag = child_xpath.split('/')[-1]
-            # If we haven't processed this type of child yet, do so now
-            if child_tag not in unique_children:
-                unique_children[child_tag] = True
-                process_element(child, result_dict[xpath]['children'], include_siblings=False)
-
-    process_element(tree.getroot(), result_dict)
-
-    def clean_dict(d):
-        if isinstance(d, dict):
-            cleaned = {k: clean_dict(v) for k, v in d.items() if v}
-            if 'content' in cleaned:
-                # Filter out empty strings and truncate the list to the first two items
-                cleaned['content'] = [item for item in cleaned['content'] if item.strip()][:2]
-            if 'children' in cleaned and not cleaned['children']:
-                del cleaned['children']  # Remove empty children dicts
-            return cleaned if cleaned else None  # Remove empty dicts
-        return d
-
-    cleaned_result_dict = clean_dict(result_dict)
-    return cleaned_result_dict if cleaned_result_dict else {}
-
-def scrape_content_using_xpath(html_content, xpath_dict):
-    scraped_content = {}
-    tree = etree.HTML(html_content)
-
-    for label, xpath in xpath_dict.items():
-        try:
-            elements = tree.xpath(xpath)
-            # Extract text content from each element found by the XPath
-            scraped_content[label] = [element.text for element in elements if element.text]
-        except Exception as e:
-            print(f"Error processing XPath {xpath} for label {label}: {e}")
-
-    return scraped_content
-
-def scrape_content_using_selectors(html_content, selectors):
-    scraped_content = {}
-    # Initialize BeautifulSoup with the HTML content
-    soup = BeautifulSoup(html_content, 'html.parser')
-   
-    def scrape_nested(soup, selectors, content_dict):
-        for name, selector in selectors.items():
-            try:
-                if isinstance(selector, dict):  # Nested structure
-                    content_dict[name] = {}
-                    scrape_nested(soup, selector, content_dict[name])
-                elif isinstance(selector, list):  # Selector is a list
-                    # Concatenate list elements to form a selector string
-                    selector_string = ' '.join(selector)
-                    elements = soup.select(selector_string)
-                    content = [element.get_text(strip=True) for element in elements]
-                    content_dict[name] = content
-                else:  # Selector is a string
-                    elements = soup.select(selector)
-                    content = [element.get_text(strip=True) for element in elements]
-                    content_dict[name] = content
-            except Exception as e:
-                # Log the error and continue with the next selector
-                print(f"Error processing selector {name}: {e}")
-                content_dict[name] = []
-
-    scrape_nested(soup, selectors, scraped_content)
-    return scraped_content
+# Report progress and results from the utils package on this page
+set_sink(StreamlitSink())
 
 def validate_url(url):
     try:
@@ -134,27 +38,6 @@ def validate_url(url):
         st.error(f"Error validating URL: {str(e)}")
         return False
 
-def scrape_body_from_html(html_content_raw):
-    try:
-        soup = BeautifulSoup(html_content_raw, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        return html_content_raw, body_content
-    except Exception as e:
-        st.error(f"Error during HTML content extraction: {str(e)}")
-        return None, None
-
-def scrape_body_from_url(url):
-    try:
-        html_content_scrapped = scrape_util(url=url)
-        soup = BeautifulSoup(html_content_scrapped, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        return html_content_scrapped, body_content
-    except Exception as e:
-        st.error(f"Error scraping HTML content from URL: {str(e)}")
-        return None, None
-
 def main():
     try:
         # Page layout with title
@@ -177,6 +60,9 @@ def main():
         # Input for URL or File Upload
         st.session_state['summarizing_method'] = st.radio("Choose Input Type:",
                                ("Summarize body through CSS Selectors method","Summarize body through XML Xpaths method","Summarize body through ASCII tree method"),captions = ["Consumes less amount of tokens.", "", "Very token-hungry"],index=0)
+
+        # Enhanced records are shown while the answer streams in, the answer can be stopped early
+        max_records = st.number_input("Stop after this many records (0 keeps all)", min_value=0, value=0, step=10)
         
         if st.button("Scrape and Analyze"):
             # st.info(instruction)
@@ -186,7 +72,7 @@ def main():
                 if url_or_file == "URL":
                     if url:
                         if validate_url(url):
-                            html_content_raw, html_content = scrape_body_from_url(
+                            html_content_raw, document = scrape_body_from_url(
                                 url=url)
                         else:
                             st.error("Invalid URL. Please enter a valid URL.")
@@ -198,7 +84,7 @@ def main():
                     if uploaded_file.name.endswith(".html") or uploaded_file.name.endswith(".htm"):
                         # Read HTML content from the uploaded file
                         html_content_raw = uploaded_file.read()
-                        html_content_raw, html_content = scrape_body_from_html(
+                        html_content_raw, document = scrape_body_from_html(
                             html_content_raw=html_content_raw)
                     else:
                         st.error("Please enter upload a valid HTML file.")
@@ -208,73 +94,95 @@ def main():
                     return
 
                 with st.expander(label="Raw HTML Content"):
-                    st.markdown(html_content)
+                    st.markdown(document.html if document else "")
 
-                if html_content:
+                if document:
 
                     with st.expander(label="Summarized Selectors"):
                         if st.session_state.summarizing_method == "Summarize body through CSS Selectors method":
-                            summarized_dict = summarize_body_using_dict_method(html_content)
+                            summarized_dict = summarize_body_using_dict_method(document, collapse_records=True)
                             st.json(summarized_dict)
                         elif st.session_state.summarizing_method == "Summarize body through XML Xpaths method":
-                            summarized_dict = summarize_body_using_xpath_method(html_content=str(html_content))
+                            summarized_dict = summarize_body_using_xpath_method(html_content=document)
                             st.json(summarized_dict)
                         else:
-                            summarized_dict = summarize_body_using_ascii_tree(html_content)
+                            # Repeated records are drawn once, texts are shortened and the
+                            # rendering stops to fit the summary budget
+                            summarized_dict = summarize_body_using_ascii_tree(
+                                document, token_limit=DEFAULT_SUMMARY_TOKEN_BUDGET, collapse_records=True)
                             st.markdown(summarized_dict)
 
                     if st.session_state['summarizing_method'] == "Summarize body through XML Xpaths method":
                         # Use XPath prompts
-                        reduced_dict = reduce_string_to_token_limit(json.dumps(summarized_dict))
-                        user_request_for_desired_selectors = USER_REQUEST_FOR_GETTING_THE_DESIRED_XPATHS.replace(
-                            "<<INSTRUCTION>>", instruction).replace("<<XPATHS_TO_CONTENT_MAPPING>>", reduced_dict)
-
-                        desired_selectors = get_gpt_response_json(
-                            user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_XPATHS)
-                        
-                        with st.expander(label="Desired Selectors GPT"):
+                        def generate_xpaths():
+                            reduced_dict = json.dumps(fit_summary_to_budget(summarized_dict))
+                            user_request_for_desired_selectors = DESIRED_XPATHS_TEMPLATE.render(
+                                INSTRUCTION=instruction, XPATHS_TO_CONTENT_MAPPING=reduced_dict)
+                            return get_gpt_response_json(
+                                user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_XPATHS)
+
+                        # Reuse the XPaths learned for this site layout while they keep matching
+                        desired_selectors, scraped_content_after_applying_selectors, from_template = get_selectors_with_template(
+                            summarized_dict, instruction, generate_xpaths,
+                            lambda xpaths: scrape_content_using_xpath(html_content=document, xpath_dict=xpaths),
+                            url=document.base_url, kind="xpath")
+
+                        with st.expander(label="Desired Selectors (cached template)" if from_template else "Desired Selectors GPT"):
                             st.json(desired_selectors)
 
                         if html_content_raw:
-                            scraped_content_after_applying_selectors = scrape_content_using_xpath(
-                                html_content=html_content_raw, xpath_dict=desired_selectors)
 
                             with st.expander(label="Scrapped Content after applying Selectors"):
                                 st.json(scraped_content_after_applying_selectors)
 
-                            user_request_for_enhancing_scrapped_content = USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT.replace(
-                                "<<INSTRUCTION>>", instruction).replace("<<RAW_SCRAPPED_CONTENT_DICT>>", json.dumps(scraped_content_after_applying_selectors))
+                            user_request_for_enhancing_scrapped_content = ENHANCING_XPATHS_CONTENT_TEMPLATE.render(
+                                INSTRUCTION=instruction, RAW_SCRAPPED_CONTENT_DICT=json.dumps(scraped_content_after_applying_selectors))
 
-                            enhanced_scrapped_content = get_gpt_response_json(
-                                user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT)
+                            records_view = StreamedRecordsView(max_records=max_records)
+                            enhanced_scrapped_content, _ = stream_gpt_response_json(
+                                user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT,
+                                on_record=records_view.on_record)
+                            records_view.finish()
                             
                             with st.expander(label="Enhanced Content"):
                                 st.json(enhanced_scrapped_content)
                     else:
-                        reduced_dict = reduce_string_to_token_limit(json.dumps(summarized_dict))
-                        user_request_for_desired_selectors = USER_REQUEST_FOR_GETTING_THE_DESIRED_SELECTORS.replace(
-                            "<<INSTRUCTION>>", instruction).replace("<<SELECTORS_TO_CONTENT_MAPPING>>", reduced_dict)
-
-                        desired_selectors = get_gpt_response_json(
-                            user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS)
-
-                        with st.expander(label="Desired Selectors GPT"):
+                        def generate_selectors():
+                            if isinstance(summarized_dict, dict):
+                                # Degrade the summary until it fits the budget instead of cutting its JSON
+                                reduced_dict = json.dumps(fit_summary_to_budget(summarized_dict))
+                            else:
+                                reduced_dict = reduce_string_to_token_limit(json.dumps(summarized_dict))
+                            user_request_for_desired_selectors = DESIRED_SELECTORS_TEMPLATE.render(
+                                INSTRUCTION=instruction, SELECTORS_TO_CONTENT_MAPPING=reduced_dict)
+                            return get_gpt_response_json(
+                                user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS)
+
+                        # Reuse the selectors learned for this site layout while they keep matching.
+                        # The ASCII tree summary carries page text rather than structure, so it always asks GPT.
+                        desired_selectors, scraped_content_after_applying_selectors, from_template = get_selectors_with_template(
+                            summarized_dict, instruction, generate_selectors,
+                            lambda selectors: scrape_content_using_selectors(html_content=document, selectors=selectors),
+                            url=document.base_url, kind="css", use_templates=isinstance(summarized_dict, dict))
+
+                        with st.expander(label="Desired Selectors (cached template)" if from_template else "Desired Selectors GPT"):
                             st.json(desired_selectors)
 
                         if html_content_raw:
-                            scraped_content_after_applying_selectors = scrape_content_using_selectors(
-                                html_content=html_content_raw, selectors=desired_selectors)
 
                             with st.expander(label="Scrapped Content after applying Selectors"):
                                 st.json(scraped_content_after_applying_selectors)
 
-                            user_request_for_enhancing_scrapped_content = USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT.replace(
-                                "<<INSTRUCTION>>", instruction).replace("<<RAW_SCRAPPED_CONTENT_DICT>>", json.dumps(scraped_content_after_applying_selectors))
+                            user_request_for_enhancing_scrapped_content = ENHANCING_SELECTORS_CONTENT_TEMPLATE.render(
+                                INSTRUCTION=instruction, RAW_SCRAPPED_CONTENT_DICT=json.dumps(scraped_content_after_applying_selectors))
 
                             # st.warning(f"prompt: {user_request_for_enhancing_scrapped_content}")
 
-                            enhanced_scrapped_content = get_gpt_response_json(
-                                user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT)
+                            records_view = StreamedRecordsView(max_records=max_records)
+                            enhanced_scrapped_content, _ = stream_gpt_response_json(
+                                user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
+                                on_record=records_view.on_record)
+                            records_view.finish()
 
                             with st.expander(label="Enhanced Content"):
                                 st.json(enhanced_scrapped_content)
@@ -1,12 +1,14 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-import html2text
 import validators
 from urllib.parse import urlsplit
 
-from utils.prompts import (SYSTEM_PROMPT_FOR_PAGINATION_REQUEST, USER_REQUEST_FOR_PAGINATION_LINKS)
-from utils.get_gpt_response_json import get_gpt_response_json
+from utils.parsed_document import ParsedDocument
+from utils.fetcher import get_default_fetcher
+from utils.purely_gpt_utils import scrape_and_convert
+from utils.pagination import discover_pagination_links, rank_pagination_candidates
+from utils.crawl_frontier import crawl_and_extract, DEFAULT_POLITENESS_DELAY_SECONDS
+from utils.reporting import set_sink
+from utils.streamlit_sink import StreamlitSink
 
 # Set page title and icon
 st.set_page_config(
@@ -14,6 +16,9 @@ st.set_page_config(
     page_icon=":robot_face:"
 )
 
+# Report progress and results from the utils package on this page
+set_sink(StreamlitSink())
+
 @st.cache_data
 def extract_base_url(url):
     try:
@@ -27,25 +32,13 @@ def extract_base_url(url):
 # @st.cache_data
 def scrape_body_from_url(url):
     try:
-        # Use requests to get HTML content
-        html_content_scrapped = requests.get(url).content
+        # Fetch the page directly through the shared pooled and cached fetcher
+        html_content_scrapped = get_default_fetcher("direct").fetch(url).content
         return html_content_scrapped
     except Exception as e:
         st.error(f"Error scraping HTML content from URL: {str(e)}")
         return None
 
-# @st.cache_data
-def scrape_and_convert(html_content, base_url=None):
-    try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        markdown_content = html2text.html2text(str(body_content), baseurl=base_url)
-        return markdown_content
-    except Exception as e:
-        st.error(f"Error during HTML to Markdown conversion: {str(e)}")
-        return ""
-
 
 # @st.cache_data
 def validate_url(url):
@@ -65,7 +58,9 @@ def main():
         st.sidebar.info(
             "This tool allows you to analyze the content of an HTML page, "
             "checking for pagination. Whether you input a URL or upload an HTML file, the app extracts "
-            "and converts the content to Markdown. It then identifies pagination links and provides a JSON output."
+            "and converts the content to Markdown. It then scores the links of the page to identify the pagination links "
+            "and provides a JSON output. "
+            "For a URL it can also follow the pagination and extract the records of every page."
         )
 
         # Input for URL or File Upload
@@ -77,6 +72,15 @@ def main():
         else:
             uploaded_file = st.file_uploader("Upload HTML file", type=["html"])
 
+        # Following the pagination crawls the result pages and extracts each of them
+        follow_pagination = st.checkbox("Follow pagination and extract", value=False, disabled=url_or_file != "URL")
+        if follow_pagination:
+            instruction = st.text_area(
+                "Enter Instructions:", placeholder="I need a list of all the books and their respective prices on this page.")
+            approach = st.radio("Extraction approach:", ("CSS Selectors", "Purely GPT"),
+                                captions=["Selectors learned on the first page are reused on the next ones.", ""])
+            max_pages = st.number_input("Maximum pages", min_value=1, value=5, step=1)
+
         if st.button("Process"):
             if url_or_file == "URL":
                 if url:
@@ -84,8 +88,9 @@ def main():
                     if validate_url(url):
                         base_url = extract_base_url(url)
                         html_content = scrape_body_from_url(url=url)
+                        document = ParsedDocument(html_content, base_url=base_url)
                         markdown_content = scrape_and_convert(
-                            html_content=html_content, base_url=base_url)
+                            html_content=document, base_url=base_url)
                     else:
                         st.error("Invalid URL. Please enter a valid URL.")
                         return
@@ -97,8 +102,9 @@ def main():
                     base_url = extract_base_url(url=uploaded_file.name)
                     # Read HTML content from the uploaded file
                     html_content = uploaded_file.read()
-                    # Scrape and convert HTML to Markdown
-                    markdown_content = scrape_and_convert(html_content)
+                    # Parse once and convert HTML to Markdown
+                    document = ParsedDocument(html_content)
+                    markdown_content = scrape_and_convert(document)
                 else:
                     st.error("Please enter upload a valid HTML file.")
                     return
@@ -109,8 +115,14 @@ def main():
             with st.expander(label="Scraped Raw Markdown Content"):
                 st.markdown(markdown_content)
 
-            user_request = USER_REQUEST_FOR_PAGINATION_LINKS.replace("MARKDOWN_CONTENT",markdown_content)
-            pagination_links = get_gpt_response_json(user_request=user_request,system_prompt=SYSTEM_PROMPT_FOR_PAGINATION_REQUEST)
+            # Links are scored on the page structure, GPT only picks among the candidates
+            # when none of them is recognized with confidence
+            page_url = url if url_or_file == "URL" else None
+            candidates = rank_pagination_candidates(document, page_url)
+            if candidates:
+                with st.expander(label="Pagination Candidates"):
+                    st.json([candidate.to_dict() for candidate in candidates])
+            pagination_links = discover_pagination_links(document, page_url)
 
             if len(pagination_links):
                 with st.expander(label="Pagination Links"):
@@ -118,6 +130,30 @@ def main():
             else:
                 st.info("No pagination links found on the page.")
 
+            if follow_pagination and url_or_file == "URL":
+                if not instruction:
+                    st.error("Please enter instructions.")
+                    return
+                progress = st.empty()
+                crawled_pages = []
+
+                def on_page(page_url, records):
+                    crawled_pages.append(page_url)
+                    progress.info(f"Extracted {len(crawled_pages)} of at most {max_pages} pages, last: {page_url}")
+
+                # Pages are fetched and extracted in threads, on_page runs on this script's thread
+                crawl_result = crawl_and_extract(url, instruction, approach=2 if approach == "CSS Selectors" else 1,
+                                                 max_pages=int(max_pages), politeness_delay=DEFAULT_POLITENESS_DELAY_SECONDS,
+                                                 on_page=on_page)
+                progress.info(f"Extracted {len(crawl_result.pages)} pages in {crawl_result.elapsed:.1f}s")
+                with st.expander(label="Crawled Pages"):
+                    st.json(crawl_result.pages)
+                if crawl_result.errors:
+                    with st.expander(label="Failed Pages"):
+                        st.json(crawl_result.errors)
+                with st.expander(label="Extracted Records", expanded=True):
+                    st.json(crawl_result.records)
+
     except Exception as e:
         st.error(f"An unexpected error occurred: {str(e)}")
 
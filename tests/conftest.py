@@ -0,0 +1,18 @@
+import os
+import sys
+
+# The tests import the utils package and the local servers of the benchmarks
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (REPO_ROOT, os.path.join(REPO_ROOT, "benchmarks")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import tiktoken  # noqa: E402
+
+from utils import ensure_limit  # noqa: E402
+
+# cl100k_base is downloaded on first use, the tests count tokens with a byte level
+# encoding instead so they never need the network
+ensure_limit._encoding = tiktoken.Encoding(
+    name="test_bytes", pat_str=r"""\s+|\S+""", mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={})
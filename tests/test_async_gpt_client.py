@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+import openai
+
+from mock_openai_server import MockOpenAIServer
+from utils import llm_cache
+from utils.async_gpt_client import AsyncGPTClient
+
+
+def run_requests(mock, count=1, **client_kwargs):
+    client_kwargs.setdefault("use_cache", False)
+
+    async def run():
+        async with AsyncGPTClient(api_key="mock", base_url=mock.base_url, **client_kwargs) as client:
+            return await client.get_responses_json([(f"page {i}", "Extract everything") for i in range(count)],
+                                                   model="mock")
+
+    return asyncio.run(run())
+
+
+def test_waits_as_long_as_retry_after_asks():
+    # Backoff without the header would wait at most backoff_base
+    with MockOpenAIServer(latency=0, rate_limited_requests=1, retry_after=0.5) as mock:
+        started_at = time.perf_counter()
+        results = run_requests(mock, backoff_base=0.01)
+        elapsed = time.perf_counter() - started_at
+    assert results == [{"echo": "page 0"}]
+    assert mock.request_count == 2
+    assert elapsed >= 0.5
+
+
+def test_malformed_retry_after_falls_back_to_backoff():
+    with MockOpenAIServer(latency=0, rate_limited_requests=1, retry_after="garbage") as mock:
+        results = run_requests(mock, backoff_base=0.01)
+    assert results == [{"echo": "page 0"}]
+    assert mock.request_count == 2
+
+
+def test_retries_rate_limited_requests_until_they_succeed():
+    with MockOpenAIServer(latency=0, rate_limited_requests=3, retry_after=0.05) as mock:
+        results = run_requests(mock)
+    assert results == [{"echo": "page 0"}]
+    assert mock.request_count == 4
+
+
+def test_gives_up_after_max_retries():
+    with MockOpenAIServer(latency=0, rate_limited_requests=10, retry_after=0.01) as mock:
+        results = run_requests(mock, max_retries=2)
+    assert isinstance(results[0], openai.RateLimitError)
+    assert mock.request_count == 3
+
+
+def test_rate_limit_pauses_every_request():
+    # One 429 holds back the requests that were not rate limited themselves
+    with MockOpenAIServer(latency=0.05, rate_limited_requests=1, retry_after=0.5) as mock:
+        started_at = time.perf_counter()
+        results = run_requests(mock, count=4, max_concurrency=1)
+        elapsed = time.perf_counter() - started_at
+    assert not any(isinstance(result, Exception) for result in results)
+    assert elapsed >= 0.5
+
+
+def test_semaphore_bounds_requests_in_flight():
+    with MockOpenAIServer(latency=0.1) as mock:
+        results = run_requests(mock, count=12, max_concurrency=3)
+    assert len(results) == 12 and not any(isinstance(result, Exception) for result in results)
+    assert mock.max_in_flight == 3
+
+
+def test_cached_responses_are_not_requested_again(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_DISABLED", False)
+    monkeypatch.setattr(llm_cache, "_default_cache", llm_cache.LLMResponseCache(str(tmp_path / "cache.sqlite3")))
+    with MockOpenAIServer(latency=0) as mock:
+        first = run_requests(mock, use_cache=True)
+        second = run_requests(mock, use_cache=True)
+    assert first == second == [{"echo": "page 0"}]
+    assert mock.request_count == 1
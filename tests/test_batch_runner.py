@@ -0,0 +1,88 @@
+import json
+
+import pyarrow.parquet
+
+from utils import batch_runner
+from utils.batch_runner import STATUS_ERROR, STATUS_OK, run_batch
+
+
+class Crash(BaseException):
+    # Stops the run the way an interrupt does, past the per-job error handling
+    pass
+
+
+def write_jobs(path, job_ids):
+    with open(path, "w", encoding="utf-8") as f:
+        for job_id in job_ids:
+            f.write(json.dumps({"id": job_id, "html_path": f"{job_id}.html", "instruction": "List everything"}) + "\n")
+    return str(path)
+
+
+def make_runner(calls, fail=(), crash=()):
+    def job_runner(job):
+        calls.append(job["id"])
+        if job["id"] in crash:
+            raise Crash()
+        if job["id"] in fail:
+            raise ValueError("No HTML content could be retrieved")
+        return {"approach": 1, "instruction": job["instruction"], "result": {"job": job["id"]}}
+    return job_runner
+
+
+def read_rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resumed_run_skips_finished_jobs(tmp_path):
+    jobs = write_jobs(tmp_path / "jobs.jsonl", ["a", "b", "c", "d", "e"])
+    output = str(tmp_path / "results.jsonl")
+    calls = []
+    try:
+        run_batch(jobs, output, workers=1, job_runner=make_runner(calls, crash={"c"}))
+    except Crash:
+        pass
+    finished = [row["job_id"] for row in read_rows(output)]
+    assert "c" not in finished
+
+    calls = []
+    summary = run_batch(jobs, output, workers=1, job_runner=make_runner(calls))
+    assert sorted(calls) == sorted(set("abcde") - set(finished))
+    assert summary["skipped"] == len(finished)
+    assert sorted(row["job_id"] for row in read_rows(output)) == list("abcde")
+
+
+def test_jobs_of_an_unwritten_parquet_part_are_run_again(tmp_path, monkeypatch):
+    jobs = write_jobs(tmp_path / "jobs.jsonl", ["a", "b", "c"])
+    output = str(tmp_path / "results.parquet")
+    # The process dies before the buffered rows reach a part file
+    with monkeypatch.context() as patch:
+        patch.setattr(batch_runner.ParquetResultWriter, "close", lambda writer: None)
+        run_batch(jobs, output, workers=1, job_runner=make_runner([]))
+    with open(output + ".checkpoint", encoding="utf-8") as f:
+        assert f.read() == ""
+
+    calls = []
+    summary = run_batch(jobs, output, workers=1, job_runner=make_runner(calls))
+    assert sorted(calls) == ["a", "b", "c"]
+    assert summary == {STATUS_OK: 3, STATUS_ERROR: 0, "skipped": 0}
+    table = pyarrow.parquet.read_table(output)
+    assert sorted(table.column("job_id").to_pylist()) == ["a", "b", "c"]
+
+
+def test_retry_failed_reruns_only_failed_jobs(tmp_path):
+    jobs = write_jobs(tmp_path / "jobs.jsonl", ["a", "b", "c"])
+    output = str(tmp_path / "results.jsonl")
+    summary = run_batch(jobs, output, workers=1, job_runner=make_runner([], fail={"b"}))
+    assert summary == {STATUS_OK: 2, STATUS_ERROR: 1, "skipped": 0}
+
+    calls = []
+    summary = run_batch(jobs, output, workers=1, job_runner=make_runner(calls))
+    assert calls == [] and summary["skipped"] == 3
+
+    summary = run_batch(jobs, output, workers=1, retry_failed=True, job_runner=make_runner(calls))
+    assert calls == ["b"]
+    assert summary == {STATUS_OK: 1, STATUS_ERROR: 0, "skipped": 2}
+    # The retried job's new row follows its failed one
+    rows = [row for row in read_rows(output) if row["job_id"] == "b"]
+    assert [row["status"] for row in rows] == [STATUS_ERROR, STATUS_OK]
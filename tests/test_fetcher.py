@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from local_http_server import LocalHTTPServer
+from utils.fetcher import Fetcher, HTTPCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return HTTPCache(str(tmp_path / "http_cache.sqlite3"))
+
+
+@pytest.mark.parametrize("etag", [True, False], ids=["etag", "last-modified"])
+def test_revalidated_page_returns_the_stored_body(cache, etag):
+    # no-cache pages are stored but revalidated before every use
+    with LocalHTTPServer(etag=etag) as server, Fetcher(cache=cache) as fetcher:
+        url = server.urls[0]
+        first = fetcher.fetch(url)
+        body_bytes = server.body_bytes
+        second = fetcher.fetch(url)
+    assert not first.from_cache
+    assert second.revalidated and second.from_cache
+    assert second.content == first.content
+    assert server.requests == 2 and server.not_modified == 1
+    assert server.body_bytes == body_bytes
+
+
+def test_fresh_page_is_served_without_a_request(cache):
+    with LocalHTTPServer(cache_control="max-age=60") as server, Fetcher(cache=cache) as fetcher:
+        first = fetcher.fetch(server.urls[0])
+        second = fetcher.fetch(server.urls[0])
+    assert second.from_cache and not second.revalidated
+    assert second.content == first.content
+    assert server.requests == 1
+
+
+def test_no_store_page_is_not_stored(cache):
+    with LocalHTTPServer(cache_control="no-store") as server, Fetcher(cache=cache) as fetcher:
+        fetcher.fetch(server.urls[0])
+        second = fetcher.fetch(server.urls[0])
+    assert not second.from_cache
+    assert server.requests == 2 and server.not_modified == 0
+    assert cache.stats()["entries"] == 0
+
+
+def test_requests_per_host_are_limited():
+    with LocalHTTPServer(latency=0.1) as server, Fetcher(per_host_limit=2, use_cache=False) as fetcher:
+        threads = [threading.Thread(target=fetcher.fetch, args=(url,)) for url in server.urls * 3]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert server.requests == len(threads)
+    assert server.max_in_flight == 2
@@ -1,64 +1,99 @@
-from utils.content_node import ContentNode
-import bs4
+from utils.content_node import ContentTree, MAX_CONTENT_LENGTH, truncate_text
+from utils.parsed_document import ParsedDocument, get_text_prefixes
+from utils.record_detection import detect_record_groups
 
-def generate_ascii_tree(node, prefix=""):
-    lines = []
+# Tags left out of the tree on top of the ones ParsedDocument already decomposes
+TAGS_TO_SKIP = frozenset(['link'])
 
-    # Add the current node tag
-    node_repr = f"{node.tag}"
-    if node.id:
-        node_repr += f"#{node.id}"
-    if node.classes:
-        node_repr += f".{'.'.join(node.classes)}"
-    if node.content:
-        content_str = ' '.join(node.content)
-        node_repr += f" - {content_str}"
+LAST_CHILD_CONNECTOR = "└── "
+CHILD_CONNECTOR = "├── "
+LAST_CHILD_EXTENSION = "    "
+CHILD_EXTENSION = "│   "
 
-    lines.append(prefix + node_repr)
+# Content lengths tried in turn when a token_limit is given, 0 leaves the texts out
+BUDGET_CONTENT_LENGTHS = (MAX_CONTENT_LENGTH, 30, 0)
 
-    # Process children with recursion
-    children_prefix = prefix + "│   "
-    last_child_prefix = prefix + "    "
-    for i, child in enumerate(node.children):
-        is_last = i == (len(node.children) - 1)
-        child_lines = generate_ascii_tree(child, children_prefix if not is_last else last_child_prefix)
-        if is_last:
-            child_lines[0] = prefix + "└── " + child_lines[0][len(prefix):]
-        else:
-            child_lines[0] = prefix + "├── " + child_lines[0][len(prefix):]
-        lines.extend(child_lines)
 
-    return lines
+def build_content_tree(document, max_content_length: int = MAX_CONTENT_LENGTH, collapse_records: bool = False) -> ContentTree:
+    # One pass down the cleaned body to store the nodes in document order, one pass
+    # back up to compute each node's text from its children. With collapse_records a
+    # list of repeated records is drawn as its exemplar and the number of records.
+    tree = ContentTree()
+    records = detect_record_groups(document.body) if collapse_records else None
+    skipped = records.skipped if records else ()
+    elements = []
+    stack = [(document.body, 0, True)]
+    while stack:
+        element, depth, is_last = stack.pop()
+        repeats = records.exemplar_counts.get(element, 1) if records else 1
+        tree.add_node(element.tag, element.get('id'), (element.get('class') or '').split(), depth, is_last, repeats)
+        elements.append(element)
+        children = [child for child in element
+                    if isinstance(child.tag, str) and child.tag not in TAGS_TO_SKIP and child not in skipped]
+        for i in range(len(children) - 1, -1, -1):
+            stack.append((children[i], depth + 1, i == len(children) - 1))
+
+    if max_content_length <= 0:
+        return tree
+    # Only the first characters of a node's text are shown, one more than that tells
+    # whether the text was truncated
+    texts = get_text_prefixes(elements, max_content_length + 1)
+    for index, text in enumerate(texts):
+        if text:
+            tree.contents[index] = truncate_text(text, max_content_length)
+    return tree
+
+
+def iter_ascii_tree_lines(tree: ContentTree):
+    # Yield the lines of the tree one at a time. A node at depth d is drawn after the
+    # extensions of its ancestors, its connector and its own extension.
+    prefixes = [""]
+    for index in range(len(tree)):
+        depth = tree.depths[index]
+        if depth == 0:
+            yield tree.node_repr(index)
+            continue
+        is_last = tree.is_last[index]
+        extension = LAST_CHILD_EXTENSION if is_last else CHILD_EXTENSION
+        connector = LAST_CHILD_CONNECTOR if is_last else CHILD_CONNECTOR
+        parent_prefix = prefixes[depth - 1]
+        del prefixes[depth:]
+        prefixes.append(parent_prefix + extension)
+        yield parent_prefix + connector + extension + tree.node_repr(index)
 
-# Function to get the ASCII tree as a string
-def get_ascii_tree_string(root_node):
-    lines = generate_ascii_tree(root_node)
-    return "\n".join(lines)
 
-# Modify the process_tag function to work with ContentNode
-def process_tag(tag, parent_node):
-    # Create a ContentNode with the tag's name, id, and classes
-    node = ContentNode(tag.name, tag.get('id'), tag.get('class'))
-    text = tag.get_text(strip=True)
-    if text:
-        node.add_content(text)
-    for child in tag.children:
-        if isinstance(child, bs4.element.Tag):
-            child_node = process_tag(child, node)
-            node.add_child(child_node)
-    return node
+def render_within_budget(tree: ContentTree, token_limit: int):
+    # Return (text, complete). Lines are added until the next one would not fit and
+    # the rest of the tree is never rendered.
+    from utils.ensure_limit import get_encoding
+    enc = get_encoding()
+    lines = []
+    used = 0
+    for line in iter_ascii_tree_lines(tree):
+        tokens = len(enc.encode(line + "\n", disallowed_special=()))
+        if used + tokens > token_limit:
+            return "\n".join(lines), False
+        lines.append(line)
+        used += tokens
+    return "\n".join(lines), True
+
+
+# Function to get the ASCII tree as a string
+def get_ascii_tree_string(tree: ContentTree, token_limit: int = None) -> str:
+    if token_limit is None:
+        return "\n".join(iter_ascii_tree_lines(tree))
+    return render_within_budget(tree, token_limit)[0]
 
-# The summarize_body function using ContentNode
-def summarize_body_using_ascii_tree(soup):
-    # Decompose unwanted tags
-    for tag in soup(['script', 'style', 'meta', 'link', 'comment', 'head', 'footer', 'nav', 'form', 'noscript']):
-        tag.decompose()
 
-    # Start processing from the body tag or the root of the soup
-    root_node = process_tag(soup.body if soup.body else soup, None)
-    # Convert the tree of ContentNodes to a nested dictionary
-    # summarized_dict = convert_to_dict(root_node)
-    summarized_dict = get_ascii_tree_string(root_node=root_node)
-    with open('tst.txt','w', encoding='utf-8') as f:
-        f.write(summarized_dict)
-    return summarized_dict
+def summarize_body_using_ascii_tree(soup, token_limit: int = None, collapse_records: bool = False) -> str:
+    # Accepts a ParsedDocument, a BeautifulSoup tag or raw HTML. With a token_limit the
+    # node texts are shortened, then dropped, before the tree is cut at the budget.
+    document = ParsedDocument.from_content(soup)
+    if token_limit is None:
+        return get_ascii_tree_string(build_content_tree(document, collapse_records=collapse_records))
+    for max_content_length in BUDGET_CONTENT_LENGTHS:
+        tree = build_content_tree(document, max_content_length, collapse_records)
+        rendered, complete = render_within_budget(tree, token_limit)
+        if complete:
+            break
+    return rendered
@@ -0,0 +1,277 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+import httpx
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from utils.prompts import (SYSTEM_PROMPT_DEFAULT, build_messages)
+from utils.llm_cache import cached_completion_async
+from utils.openai_client import read_usage
+
+# Load environment variables
+load_dotenv()
+
+DEFAULT_MODEL = "gpt-4-1106-preview"
+RESPONSE_FORMAT_JSON = {"type": "json_object"}
+
+# Status codes worth retrying, everything else is raised straight away
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# Characters per token of English text, requests are counted against the tokens per
+# minute bucket from their length
+ESTIMATED_CHARS_PER_TOKEN = 4
+
+# Limits of the client shared by every synchronous caller in the process
+SHARED_MAX_CONCURRENCY = int(os.getenv("GPT_MAX_CONCURRENCY", 8))
+SHARED_REQUESTS_PER_MINUTE = int(os.getenv("GPT_REQUESTS_PER_MINUTE", 500))
+SHARED_TOKENS_PER_MINUTE = int(os.getenv("GPT_TOKENS_PER_MINUTE", 300000))
+
+
+class TokenBucket:
+    # Refills continuously at capacity per minute, acquire() waits until enough is available
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = capacity_per_minute
+        self.available = capacity_per_minute
+        self.refill_per_second = capacity_per_minute / 60.0
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated_at) * self.refill_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        # A single request larger than the bucket would wait forever, let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) / self.refill_per_second)
+
+
+def get_retry_after(error) -> float:
+    # Seconds the server asked us to wait, or None when it did not say
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    if headers.get("retry-after-ms"):
+        try:
+            return float(headers["retry-after-ms"]) / 1000.0
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+    try:
+        retry_date = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        # Neither seconds nor an HTTP date, fall back to the exponential backoff
+        return None
+    return max(0.0, retry_date.timestamp() - time.time()) if retry_date else None
+
+
+def is_retryable(error) -> bool:
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+class AsyncGPTClient:
+    # Shared asyncio client for many concurrent GPT calls.
+    # One pooled HTTP client, a semaphore bounding in-flight requests, token buckets for
+    # requests and tokens per minute and exponential backoff that honors Retry-After.
+    # on_usage(usage) receives the token counts of every completed request.
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: int = 500, tokens_per_minute: int = 300000,
+                 max_retries: int = 5, timeout: float = 120.0, backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 api_key: str = None, base_url: str = None, use_cache: bool = True, on_usage=None):
+        self.on_usage = on_usage
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.use_cache = use_cache
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Set when the server rate limits us so every worker backs off, not only the one that got the 429
+        self._paused_until = 0.0
+        self._http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency))
+        # Retries are handled here so they share the rate limiting state
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                                  http_client=self._http_client)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self) -> None:
+        await self.client.close()
+
+    def _backoff_delay(self, attempt: int, error) -> float:
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, delay)
+
+    async def _wait_if_paused(self) -> None:
+        delay = self._paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def create_completion(self, user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT,
+                                model: str = DEFAULT_MODEL, response_format=None, page_content: str = None,
+                                on_usage=None, **kwargs):
+        # on_usage overrides the client's on_usage for this request
+        on_usage = on_usage or self.on_usage
+        messages = build_messages(system_prompt, user_request, page_content)
+        # A length bound rather than encoding whole pages on the event loop
+        estimated_tokens = sum(len(message["content"]) for message in messages) // ESTIMATED_CHARS_PER_TOKEN + 1
+        if response_format is not None:
+            kwargs["response_format"] = response_format
+
+        attempt = 0
+        while True:
+            await self._wait_if_paused()
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimated_tokens)
+            try:
+                async with self._semaphore:
+                    result = await self.client.chat.completions.create(messages=messages, model=model, **kwargs)
+                if on_usage:
+                    on_usage(read_usage(result.usage))
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                if isinstance(e, openai.RateLimitError):
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _cached(self, create_response, model, system_prompt, user_request, response_format, use_cache,
+                      page_content=None):
+        return await cached_completion_async(
+            create_response, model=model, system_prompt=system_prompt, user_request=user_request,
+            response_format=response_format, use_cache=self.use_cache if use_cache is None else use_cache,
+            page_content=page_content)
+
+    async def get_response(self, user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT,
+                           model: str = DEFAULT_MODEL, use_cache: bool = None) -> str:
+        async def create_response():
+            result = await self.create_completion(user_request, system_prompt, model)
+            return result.choices[0].message.content.strip()
+
+        return await self._cached(create_response, model, system_prompt, user_request, None, use_cache)
+
+    async def get_response_json(self, user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT,
+                                model: str = DEFAULT_MODEL, use_cache: bool = None, page_content: str = None,
+                                on_usage=None) -> dict:
+        async def create_response():
+            result = await self.create_completion(user_request, system_prompt, model,
+                                                  response_format=RESPONSE_FORMAT_JSON, page_content=page_content,
+                                                  on_usage=on_usage)
+            return json.loads(result.choices[0].message.content.strip())
+
+        return await self._cached(create_response, model, system_prompt, user_request, RESPONSE_FORMAT_JSON, use_cache,
+                                  page_content)
+
+    async def get_responses_json(self, requests, model: str = DEFAULT_MODEL, max_concurrency: int = None,
+                                 use_cache: bool = None, on_usage=None):
+        # requests is a list of (user_request, system_prompt) pairs, or of (user_request,
+        # system_prompt, page_content) for requests about a page. Results keep the input
+        # order, a request that still fails after retrying yields its exception.
+        # max_concurrency bounds the requests of this call in flight, below the client's bound.
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+
+        async def get_response_json(user_request, system_prompt, page_content):
+            if semaphore is None:
+                return await self.get_response_json(user_request, system_prompt, model, use_cache, page_content,
+                                                    on_usage)
+            async with semaphore:
+                return await self.get_response_json(user_request, system_prompt, model, use_cache, page_content,
+                                                    on_usage)
+
+        tasks = []
+        for user_request, system_prompt, *page_content in requests:
+            tasks.append(get_response_json(user_request, system_prompt, page_content[0] if page_content else None))
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class SharedClient:
+    # An AsyncGPTClient on an event loop of its own in a background thread. Every thread
+    # of the process submits its requests to it, so they share one connection pool, one
+    # concurrency bound, the rate limit buckets and the pause after a 429.
+
+    def __init__(self, **client_kwargs):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="gpt-client", daemon=True)
+        self.thread.start()
+        self.client = self.run(self._create_client(**client_kwargs))
+
+    async def _create_client(self, **client_kwargs):
+        return AsyncGPTClient(**client_kwargs)
+
+    def run(self, coroutine):
+        # Run the coroutine on the client's loop and wait for its result
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def close(self) -> None:
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+_shared_clients = {}
+_shared_clients_lock = threading.Lock()
+
+
+def get_shared_client(api_key: str = None, base_url: str = None) -> SharedClient:
+    # One shared client per endpoint, limits come from GPT_MAX_CONCURRENCY,
+    # GPT_REQUESTS_PER_MINUTE and GPT_TOKENS_PER_MINUTE
+    with _shared_clients_lock:
+        key = (api_key, base_url)
+        if key not in _shared_clients:
+            _shared_clients[key] = SharedClient(
+                max_concurrency=SHARED_MAX_CONCURRENCY, requests_per_minute=SHARED_REQUESTS_PER_MINUTE,
+                tokens_per_minute=SHARED_TOKENS_PER_MINUTE, api_key=api_key, base_url=base_url)
+        return _shared_clients[key]
+
+
+def get_gpt_responses_json(requests, model: str = DEFAULT_MODEL, max_concurrency: int = None, use_cache: bool = None,
+                           on_usage=None, api_key: str = None, base_url: str = None):
+    # Synchronous entry point for callers without an event loop, e.g. Streamlit pages and
+    # batch worker threads. Requests go through the process-wide shared client, so
+    # concurrent callers stay within the same rate limits.
+    # on_usage(usage) is called in the calling thread once all requests are done.
+    usages = []
+    shared_client = get_shared_client(api_key=api_key, base_url=base_url)
+    results = shared_client.run(shared_client.client.get_responses_json(
+        requests, model=model, max_concurrency=max_concurrency, use_cache=use_cache,
+        on_usage=usages.append if on_usage else None))
+    for usage in usages:
+        on_usage(usage)
+    return results
@@ -0,0 +1,305 @@
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+from utils.parsed_document import ParsedDocument
+from utils.enhance_instructions import enhance_user_instructions
+from utils.select_approach import select_approach_for_document
+from utils.purely_gpt_utils import extract_using_approach_1
+from utils.css_selector_utils import extract_using_approach_2
+from utils.scrape_html_using_scrapenetwork import scrape_body_from_url
+
+# Job lines look like
+#   {"id": "books-1", "url": "https://books.toscrape.com", "instruction": "...", "approach": 2}
+#   {"html_path": "sample/books.html", "instruction": "...", "enhance_instructions": true}
+# "id" defaults to a hash of the job and "approach" to "auto" (selected by GPT).
+# Approach 2 jobs reuse selector templates per site layout, set "use_templates": false to
+# always ask GPT, or "enhance_content": false to return the raw scraped content.
+# Approach 1 jobs split pages too long for one GPT call into chunks, "chunked": true
+# always splits and "chunked": false truncates the page instead. They reuse the JSON
+# schema stored for the domain and instruction ("use_templates": false to always
+# generate it) and otherwise generate it in the extraction call, "single_call": false
+# generates it in a call of its own.
+# "stream": true streams the extraction answer and records its time to first record,
+# "max_records": n also stops it once n records have arrived.
+#
+# Finished jobs are checkpointed and skipped when a run is resumed. Jobs re-run with
+# retry_failed get a second result row with the same job_id after their failed one,
+# the last row of a job_id holds its latest result.
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_ERROR = "error"
+
+
+def get_job_id(job: dict) -> str:
+    if job.get("id") is not None:
+        return str(job["id"])
+    return hashlib.sha1(json.dumps(job, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def read_jobs(path: str):
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.error(f"Skipping invalid job on line {line_number}: {e}")
+                continue
+            if not job.get("instruction") or not (job.get("url") or job.get("html_path")):
+                logger.error(f"Skipping job on line {line_number}: it needs an instruction and a url or html_path")
+                continue
+            yield job
+
+
+def load_html(job: dict):
+    # Return the raw HTML of a job and the base URL used to resolve its links
+    if job.get("html_path"):
+        with open(job["html_path"], "rb") as f:
+            return f.read(), job.get("base_url")
+    parsed_url = urlsplit(job["url"])
+    return scrape_body_from_url(url=job["url"]), f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+
+def run_job(job: dict, cpu_pool=None) -> dict:
+    started_at = time.perf_counter()
+    instruction = job["instruction"]
+    if job.get("enhance_instructions"):
+        instruction = enhance_user_instructions(instruction)
+
+    html_content, base_url = load_html(job)
+    if not html_content:
+        raise ValueError("No HTML content could be retrieved")
+    document = ParsedDocument(html_content, base_url=base_url)
+
+    # Streamed jobs collect the records as they arrive and stop once max_records are in
+    metrics = {}
+    on_record = None
+    if job.get("stream") or job.get("max_records"):
+        received = []
+
+        def on_record(path, record):
+            received.append(record)
+            return not job.get("max_records") or len(received) < job["max_records"]
+
+    def on_result(label, value):
+        if label == "Time to First Record (s)" and value is not None:
+            metrics["time_to_first_record_seconds"] = round(value, 3)
+        elif label.endswith("Call Usage") and value:
+            # Prompt tokens of all GPT calls of the job and how many of them were read
+            # from the provider's prompt cache
+            metrics["prompt_tokens"] = metrics.get("prompt_tokens", 0) + value["prompt_tokens"]
+            metrics["cached_prompt_tokens"] = metrics.get("cached_prompt_tokens", 0) + value["cached_tokens"]
+
+    approach = job.get("approach", "auto")
+    if approach == "auto":
+        approach = select_approach_for_document(document, instruction, url=job.get("url"))
+    if int(approach) == 1:
+        result = extract_using_approach_1(document, instruction, base_url=base_url, chunked=job.get("chunked"),
+                                          on_result=on_result, on_record=on_record, cpu_pool=cpu_pool,
+                                          single_call=job.get("single_call", True),
+                                          use_schema_cache=job.get("use_templates", True))
+    else:
+        result = extract_using_approach_2(document, instruction, use_templates=job.get("use_templates", True),
+                                          enhance_content=job.get("enhance_content", True),
+                                          on_result=on_result, on_record=on_record, cpu_pool=cpu_pool)
+
+    return {"approach": int(approach), "instruction": instruction, "result": result,
+            "elapsed_seconds": round(time.perf_counter() - started_at, 3),
+            "time_to_first_record_seconds": metrics.get("time_to_first_record_seconds"),
+            "prompt_tokens": metrics.get("prompt_tokens"), "cached_prompt_tokens": metrics.get("cached_prompt_tokens")}
+
+
+class JsonlResultWriter:
+    # Appends one JSON record per line and flushes after each so a crash loses nothing.
+    # on_written(records) is called once records are on disk.
+
+    def __init__(self, path: str, on_written=None):
+        self.file = open(path, "a", encoding="utf-8")
+        self.on_written = on_written
+
+    def write(self, record: dict) -> None:
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        if self.on_written:
+            self.on_written([record])
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ParquetResultWriter:
+    # Writes records into a directory of Parquet part files, one per batch_size records.
+    # Nested results are stored as JSON strings so every part shares the same schema.
+    # Records are only on disk once their part is written, on_written(records) is called then.
+
+    COLUMNS = ("job_id", "status", "url", "html_path", "instruction", "approach", "elapsed_seconds",
+               "time_to_first_record_seconds", "prompt_tokens", "cached_prompt_tokens", "error", "result")
+    FLOAT_COLUMNS = ("elapsed_seconds", "time_to_first_record_seconds")
+    INT_COLUMNS = ("prompt_tokens", "cached_prompt_tokens")
+
+    def __init__(self, path: str, batch_size: int = 100, on_written=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow), or write to a .jsonl file")
+        self.pyarrow = pyarrow
+        self.parquet = pyarrow.parquet
+        self.path = path
+        self.batch_size = batch_size
+        self.on_written = on_written
+        self.rows = []
+        self.records = []
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, record: dict) -> None:
+        row = {column: record.get(column) for column in self.COLUMNS}
+        row["result"] = json.dumps(record.get("result"), ensure_ascii=False)
+        row["approach"] = str(row["approach"]) if row["approach"] is not None else None
+        self.rows.append(row)
+        self.records.append(record)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        table = self.pyarrow.Table.from_pylist(self.rows, schema=self.pyarrow.schema(
+            [(column, self.pyarrow.float64() if column in self.FLOAT_COLUMNS else
+              self.pyarrow.int64() if column in self.INT_COLUMNS else self.pyarrow.string())
+             for column in self.COLUMNS]))
+        part_name = f"part-{time.time_ns()}.parquet"
+        # Written under a temporary name first, a crash never leaves a truncated part
+        temporary_path = os.path.join(self.path, f".{part_name}.tmp")
+        self.parquet.write_table(table, temporary_path)
+        os.replace(temporary_path, os.path.join(self.path, part_name))
+        records, self.rows, self.records = self.records, [], []
+        if self.on_written:
+            self.on_written(records)
+
+    def close(self) -> None:
+        self.flush()
+
+
+class Checkpoint:
+    # Append-only log of finished job ids, read back on start to resume a run
+
+    def __init__(self, path: str):
+        self.path = path
+        self.statuses = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    job_id, _, status = line.rstrip("\n").partition("\t")
+                    if job_id:
+                        self.statuses[job_id] = status
+        self.file = open(path, "a", encoding="utf-8")
+
+    def should_run(self, job_id: str, retry_failed: bool = False) -> bool:
+        status = self.statuses.get(job_id)
+        return status is None or (retry_failed and status != STATUS_OK)
+
+    def mark(self, job_id: str, status: str) -> None:
+        self.statuses[job_id] = status
+        self.file.write(f"{job_id}\t{status}\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def open_writer(output_path: str, on_written=None):
+    if output_path.endswith(".parquet"):
+        return ParquetResultWriter(output_path, on_written=on_written)
+    return JsonlResultWriter(output_path, on_written=on_written)
+
+
+def run_batch(jobs_path: str, output_path: str, workers: int = 4, checkpoint_path: str = None,
+              retry_failed: bool = False, job_runner=run_job, cpu_workers: int = 0) -> dict:
+    # Jobs run in worker threads, which mostly wait on requests. With cpu_workers the
+    # CPU-bound conversion and summarization of the pages run in that many processes.
+    cpu_pool = None
+    if cpu_workers:
+        from utils.cpu_pool import CPUPool
+        cpu_pool = CPUPool(cpu_workers)
+        job_runner = functools.partial(job_runner, cpu_pool=cpu_pool)
+    checkpoint = Checkpoint(checkpoint_path or output_path + ".checkpoint")
+
+    def mark_written(records):
+        for record in records:
+            checkpoint.mark(record["job_id"], record["status"])
+
+    # Jobs are checkpointed once their results are on disk, a crash before that re-runs
+    # them rather than losing them
+    writer = open_writer(output_path, on_written=mark_written)
+    summary = {STATUS_OK: 0, STATUS_ERROR: 0, "skipped": 0}
+    running = {}
+
+    def collect(done):
+        for future in done:
+            job_id, job = running.pop(future)
+            record = {"job_id": job_id, "url": job.get("url"), "html_path": job.get("html_path"),
+                      "instruction": job["instruction"]}
+            try:
+                record.update(future.result())
+                record["status"] = STATUS_OK
+            except Exception as e:
+                logger.error(f"Job {job_id} failed: {e}")
+                record.update({"status": STATUS_ERROR, "error": str(e)})
+            writer.write(record)
+            summary[record["status"]] += 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for job in read_jobs(jobs_path):
+                job_id = get_job_id(job)
+                if not checkpoint.should_run(job_id, retry_failed):
+                    summary["skipped"] += 1
+                    continue
+                # Keep a bounded number of jobs in flight so huge job files stream through
+                while len(running) >= workers * 2:
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    collect(done)
+                running[executor.submit(job_runner, job)] = (job_id, job)
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                collect(done)
+    finally:
+        writer.close()
+        checkpoint.close()
+        if cpu_pool is not None:
+            cpu_pool.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run extraction jobs from a JSONL file without the Streamlit UI.")
+    parser.add_argument("jobs", help="JSONL file with one {url or html_path, instruction} job per line")
+    parser.add_argument("-o", "--output", required=True, help="Results file (.jsonl) or Parquet directory (.parquet)")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--checkpoint", help="Checkpoint file, defaults to <output>.checkpoint")
+    parser.add_argument("--retry-failed", action="store_true", help="Re-run jobs that failed in a previous run, their new results are appended after the failed ones")
+    parser.add_argument("--cpu-workers", type=int, default=0,
+                        help="Convert and summarize pages in this many processes, 0 keeps them in the job threads")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    summary = run_batch(args.jobs, args.output, workers=args.workers, checkpoint_path=args.checkpoint,
+                        retry_failed=args.retry_failed, cpu_workers=args.cpu_workers)
+    logger.info(f"Finished: {summary[STATUS_OK]} ok, {summary[STATUS_ERROR]} failed, {summary['skipped']} skipped")
+
+
+if __name__ == "__main__":
+    main()
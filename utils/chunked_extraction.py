@@ -0,0 +1,140 @@
+import json
+import re
+from utils.reporting import get_sink
+from utils.ensure_limit import count_tokens, get_encoding
+from utils.async_gpt_client import get_gpt_responses_json, DEFAULT_MODEL
+from utils.prompts import (STRUCTURED_CONTENT_OF_PAGE_TEMPLATE, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)
+
+# Pages whose markdown does not fit one GPT call used to be cut at the limit and
+# everything after it was lost. Here the markdown is split on headings and list items
+# into chunks of a token budget, every chunk is extracted concurrently with the same
+# JSON schema and the records of all chunks are merged.
+
+# Markdown above this many tokens no longer fits a single extraction call
+SINGLE_CALL_TOKEN_LIMIT = 100000
+DEFAULT_CHUNK_TOKENS = 8000
+# Tokens of the page the schema is generated from in chunked mode
+SCHEMA_SAMPLE_TOKENS = 16000
+DEFAULT_MAX_CONCURRENCY = 8
+
+# Lines that start a new block: headings, bullet and numbered list items
+BLOCK_START_PATTERN = re.compile(r'^(#{1,6}\s|\s*(?:[*+-]|\d+\.)\s)')
+HEADING_PATTERN = re.compile(r'^#{1,6}\s')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def split_markdown_blocks(markdown_content: str):
+    # Split markdown into paragraphs, headings and list items, in order
+    blocks = []
+    current = []
+    for line in markdown_content.splitlines():
+        if not line.strip():
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        if current and BLOCK_START_PATTERN.match(line):
+            blocks.append("\n".join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _split_oversized_block(block: str, chunk_tokens: int):
+    # A single block larger than the budget, e.g. a huge table, is cut at token boundaries
+    enc = get_encoding()
+    tokens = enc.encode(block, disallowed_special=())
+    return [enc.decode(tokens[i:i + chunk_tokens], errors="ignore") for i in range(0, len(tokens), chunk_tokens)]
+
+
+def split_markdown_into_chunks(markdown_content: str, chunk_tokens: int = DEFAULT_CHUNK_TOKENS):
+    # Pack consecutive blocks into chunks of at most chunk_tokens tokens. A heading
+    # starts a new chunk once the current one is half full, so sections stay together.
+    chunks = []
+    current = []
+    used = 0
+    for block in split_markdown_blocks(markdown_content):
+        tokens = count_tokens(block) + 1
+        if tokens > chunk_tokens:
+            pieces = _split_oversized_block(block, chunk_tokens)
+        else:
+            pieces = [block]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece) + 1
+            starts_section = HEADING_PATTERN.match(piece) and used > chunk_tokens // 2
+            if current and (used + piece_tokens > chunk_tokens or starts_section):
+                chunks.append("\n\n".join(current))
+                current = []
+                used = 0
+            current.append(piece)
+            used += piece_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def _is_empty(value) -> bool:
+    return value is None or value == "" or value == [] or value == {}
+
+
+def _normalize(value):
+    # Records that only differ in case or whitespace are the same record
+    if isinstance(value, str):
+        return WHITESPACE_PATTERN.sub(" ", value).strip().lower()
+    if isinstance(value, dict):
+        return {key: _normalize(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_normalize(item) for item in value]
+    return value
+
+
+def _record_key(record) -> str:
+    return json.dumps(_normalize(record), sort_keys=True, ensure_ascii=False)
+
+
+def merge_values(merged, value):
+    # Dicts are merged key by key, lists are concatenated without duplicates and the
+    # first non-empty scalar wins
+    if isinstance(merged, dict) and isinstance(value, dict):
+        for key, item in value.items():
+            merged[key] = merge_values(merged[key], item) if key in merged else item
+        return merged
+    if isinstance(merged, list) and isinstance(value, list):
+        seen = {_record_key(record) for record in merged}
+        for record in value:
+            key = _record_key(record)
+            if key not in seen:
+                seen.add(key)
+                merged.append(record)
+        return merged
+    return value if _is_empty(merged) else merged
+
+
+def merge_extractions(results) -> dict:
+    merged = {}
+    for result in results:
+        if isinstance(result, dict):
+            merge_values(merged, result)
+    return merged
+
+
+def extract_in_chunks(markdown_content: str, instruction: str, json_schema, chunk_tokens: int = DEFAULT_CHUNK_TOKENS,
+                      max_concurrency: int = DEFAULT_MAX_CONCURRENCY, model: str = DEFAULT_MODEL, **client_kwargs) -> dict:
+    # Extract every chunk of the markdown concurrently and merge the records. Chunks
+    # that still fail after retrying are reported and left out of the result, when
+    # every chunk fails the first error is raised. Every
+    # chunk is sent as the page prefix of its request, so extracting the page again with
+    # another instruction or schema reads the chunks from the provider's prompt cache.
+    chunks = split_markdown_into_chunks(markdown_content, chunk_tokens)
+    user_request = STRUCTURED_CONTENT_OF_PAGE_TEMPLATE.render(JSON_SCHEMA=str(json_schema), INSTRUCTION=instruction)
+    requests = [(user_request, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA, chunk) for chunk in chunks]
+    results = get_gpt_responses_json(requests, model=model, max_concurrency=max_concurrency, **client_kwargs)
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures and len(failures) == len(results):
+        # Nothing was extracted, the page failed rather than came back empty
+        raise failures[0]
+    if failures:
+        get_sink().error(f"{len(failures)} of {len(chunks)} chunks could not be extracted: {failures[0]}")
+    return merge_extractions(results)
@@ -1,27 +1,85 @@
 import re
+from array import array
+
+# Characters escaped with a backslash in ids and classes so they stay valid CSS
+CSS_SPECIAL_CHARACTERS = re.compile(r'([!"#$%&\'()*+,./:;<=>?@[\\]^`{|}~])')
+
+MAX_CONTENT_LENGTH = 70
+
+
+def truncate_text(text, max_length=MAX_CONTENT_LENGTH):
+    return text[:max_length] + '...' if len(text) > max_length else text
+
+
+def escape_css_identifier(identifier):
+    return CSS_SPECIAL_CHARACTERS.sub(r'\\\1', identifier)
+
 
 class ContentNode:
+    __slots__ = ('tag', 'id', 'classes', 'content', 'children')
+
     def __init__(self, tag=None, id=None, classes=None):
         self.tag = tag
-        self.id = self.escape_css_identifier(id) if id else None
-        self.classes = [self.escape_css_identifier(cls) for cls in classes] if classes else []
+        self.id = escape_css_identifier(id) if id else None
+        self.classes = [escape_css_identifier(cls) for cls in classes] if classes else []
         self.content = []
         self.children = []
 
     # Define the truncate_text function
-    def truncate_text(self, text, max_length=70):
-        return text[:max_length] + '...' if len(text) > max_length else text
+    def truncate_text(self, text, max_length=MAX_CONTENT_LENGTH):
+        return truncate_text(text, max_length)
 
     def add_content(self, text):
-        truncated_text = self.truncate_text(text)
-        self.content.append(truncated_text)
+        self.content.append(truncate_text(text))
 
     def add_child(self, child_node):
         self.children.append(child_node)
 
     def escape_css_identifier(self, identifier):
-        # Escape special characters with a backslash
-        return re.sub(r'([!"#$%&\'()*+,./:;<=>?@[\\]^`{|}~])', r'\\\1', identifier)
+        return escape_css_identifier(identifier)
 
     def get_text(self):
         return ' '.join(self.content)
+
+
+class ContentTree:
+    # Compact store of a whole page, one slot per node in document order instead of
+    # one object per node. depths and is_last are all a renderer needs to draw the
+    # tree, so there are no child lists to keep alive.
+    __slots__ = ('tags', 'ids', 'classes', 'contents', 'depths', 'is_last', 'repeats')
+
+    def __init__(self):
+        self.tags = []
+        self.ids = []
+        self.classes = []
+        # Truncated text of the node and all its descendants, None when empty
+        self.contents = []
+        self.depths = array('I')
+        self.is_last = array('b')
+        # Number of records a node stands for when repeated records are collapsed
+        self.repeats = array('I')
+
+    def add_node(self, tag, id=None, classes=None, depth=0, is_last=True, repeats=1) -> int:
+        self.tags.append(tag)
+        self.ids.append(escape_css_identifier(id) if id else None)
+        self.classes.append(tuple(escape_css_identifier(cls) for cls in classes) if classes else ())
+        self.contents.append(None)
+        self.depths.append(depth)
+        self.is_last.append(is_last)
+        self.repeats.append(repeats)
+        return len(self.tags) - 1
+
+    def __len__(self):
+        return len(self.tags)
+
+    def node_repr(self, index) -> str:
+        node_repr = self.tags[index]
+        if self.ids[index]:
+            node_repr += f"#{self.ids[index]}"
+        if self.classes[index]:
+            node_repr += f".{'.'.join(self.classes[index])}"
+        if self.contents[index]:
+            node_repr += f" - {self.contents[index]}"
+        if self.repeats[index] > 1:
+            node_repr += f" (repeated {self.repeats[index]} times)"
+        return node_repr
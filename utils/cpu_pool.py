@@ -0,0 +1,93 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Parsing, cleaning, summarizing and markdown conversion are CPU-bound Python work that
+# holds the GIL. A CPUPool runs these stages in worker processes: only the raw page goes
+# in and only the compact result (markdown, a summary dict) comes back, trees never
+# cross the process boundary. Workers are started and warmed up front, they import lxml
+# and the utils modules and load the tiktoken encoding before the first page arrives.
+
+DEFAULT_CPU_WORKERS = int(os.getenv("CPU_POOL_WORKERS", 0)) or os.cpu_count() or 1
+
+
+def _warm_up():
+    from utils.ensure_limit import get_encoding
+    import utils.purely_gpt_utils  # noqa: F401
+    import utils.selector_utils  # noqa: F401
+    get_encoding()
+
+
+def _ready():
+    return os.getpid()
+
+
+def convert_to_markdown(raw_html, base_url=None, collapsed=True) -> dict:
+    # The page as markdown, and with collapsed also as markdown with one exemplar per
+    # list of repeated records, from a single parse
+    from utils.parsed_document import ParsedDocument
+    from utils.purely_gpt_utils import scrape_and_convert
+    document = ParsedDocument(raw_html, base_url=base_url)
+    result = {"markdown": scrape_and_convert(document, base_url=base_url)}
+    if collapsed:
+        result["collapsed_markdown"] = scrape_and_convert(document, base_url=base_url, collapse_records=True)
+    return result
+
+
+def summarize_for_selectors(raw_html, collapse_records=True) -> dict:
+    from utils.parsed_document import ParsedDocument
+    from utils.selector_utils import summarize_body_using_dict_method
+    return summarize_body_using_dict_method(ParsedDocument(raw_html), collapse_records=collapse_records)
+
+
+class CPUPool:
+    def __init__(self, workers: int = DEFAULT_CPU_WORKERS):
+        self.workers = workers
+        # Spawned rather than forked, forking a process running Streamlit's or the batch
+        # runner's threads can deadlock on locks those threads hold
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                            initializer=_warm_up)
+        # Start every worker now, the executor otherwise spawns them on first use
+        for future in [self.executor.submit(_ready) for _ in range(workers)]:
+            future.result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit(self, stage, *args, **kwargs):
+        # stage must be a module-level function taking and returning picklable values
+        return self.executor.submit(stage, *args, **kwargs)
+
+    def run(self, stage, *args, **kwargs):
+        return self.submit(stage, *args, **kwargs).result()
+
+    async def run_async(self, stage, *args, **kwargs):
+        # Await a stage without blocking the event loop
+        return await asyncio.wrap_future(self.submit(stage, *args, **kwargs))
+
+    def markdown(self, raw_html, base_url=None, collapsed=True) -> dict:
+        return self.run(convert_to_markdown, raw_html, base_url, collapsed)
+
+    def summary(self, raw_html, collapse_records=True) -> dict:
+        return self.run(summarize_for_selectors, raw_html, collapse_records)
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_cpu_pool(workers: int = None) -> CPUPool:
+    # One shared pool per process, CPU_POOL_WORKERS sets its size (all cores by default)
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = CPUPool(workers or DEFAULT_CPU_WORKERS)
+    return _default_pool
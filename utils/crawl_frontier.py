@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import heapq
+import math
+import os
+import time
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from utils.reporting import logger
+
+# Multi-page result sets are walked by a crawl frontier: a priority queue of canonical
+# URLs, a filter of the URLs already queued, and a politeness delay between two
+# requests to the same domain. Async workers take the next URL whose domain is ready,
+# fetch it, extract its records and queue the pagination links it holds.
+
+DEFAULT_POLITENESS_DELAY_SECONDS = float(os.getenv("CRAWL_POLITENESS_DELAY_SECONDS", 1.0))
+# Crawls expected to see more URLs than this remember them in a Bloom filter
+BLOOM_FILTER_THRESHOLD = 100000
+
+# Query parameters that only track where a click came from, two URLs differing in them
+# are the same page
+TRACKING_PARAMS = frozenset(['ref', 'ref_', 'qid', 'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', 'spm'])
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def canonicalize_url(url: str, base: str = None):
+    # Absolute URL with a lowercase scheme and host, no default port, no fragment,
+    # no tracking parameters and sorted query parameters. None for non-HTTP links.
+    if base:
+        url = urljoin(base, url.strip())
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return None
+    host = parts.hostname.lower()
+    if parts.port and parts.port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{parts.port}"
+    query = sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                   if name.lower() not in TRACKING_PARAMS and not name.lower().startswith('utm_'))
+    return urlunsplit((scheme, host, parts.path or '/', urlencode(query), ''))
+
+
+class BloomFilter:
+    # Set membership in a fixed bit array, false positives at about error_rate once
+    # capacity items are added, never false negatives
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        # Double hashing, k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, item: str) -> bool:
+        # Add item and return whether it was new
+        new = False
+        for position in self._positions(item):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        self.count += new
+        return new
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position // 8] & (1 << position % 8) for position in self._positions(item))
+
+    def __len__(self):
+        return self.count
+
+
+class SeenSet(set):
+    # Exact counterpart of BloomFilter.add for small crawls
+    def add(self, item: str) -> bool:
+        if item in self:
+            return False
+        super().add(item)
+        return True
+
+
+class CrawlFrontier:
+    # Priority queue of URLs to crawl, the lowest priority first and queue order among
+    # equals. next_ready() only hands out a URL once its domain's politeness delay has passed.
+
+    def __init__(self, politeness_delay: float = DEFAULT_POLITENESS_DELAY_SECONDS, expected_urls: int = 1000):
+        self.politeness_delay = politeness_delay
+        self.seen = BloomFilter(expected_urls) if expected_urls > BLOOM_FILTER_THRESHOLD else SeenSet()
+        self._heap = []
+        self._sequence = 0
+        self._domain_ready_at = {}
+
+    def add(self, url: str, priority: float = 0, depth: int = 0, base: str = None) -> bool:
+        # Queue url unless it was queued before, return whether it was queued
+        url = canonicalize_url(url, base)
+        if url is None or not self.seen.add(url):
+            return False
+        heapq.heappush(self._heap, (priority, self._sequence, url, depth))
+        self._sequence += 1
+        return True
+
+    def __len__(self):
+        return len(self._heap)
+
+    def next_ready(self, now: float = None):
+        # Return (url, depth, 0) for the best URL whose domain may be requested now, or
+        # (None, None, wait) with the seconds until one will be
+        now = time.monotonic() if now is None else now
+        skipped = []
+        wait = None
+        try:
+            while self._heap:
+                entry = heapq.heappop(self._heap)
+                domain = urlsplit(entry[2]).netloc
+                ready_at = self._domain_ready_at.get(domain, 0)
+                if ready_at <= now:
+                    self._domain_ready_at[domain] = now + self.politeness_delay
+                    return entry[2], entry[3], 0
+                skipped.append(entry)
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+            return None, None, wait
+        finally:
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+
+
+class CrawlResult:
+    def __init__(self):
+        self.pages = []
+        self.records = {}
+        self.errors = {}
+        self.elapsed = 0.0
+
+
+async def crawl(start_urls, process_page, max_pages: int = 10, max_depth: int = 20, workers: int = 4,
+                politeness_delay: float = DEFAULT_POLITENESS_DELAY_SECONDS, fetch=None, on_page=None) -> CrawlResult:
+    # Walk the pages reachable from start_urls. process_page(url, content, follow) runs in
+    # a thread and returns the page's extraction result, it calls follow(links) with the
+    # URLs to queue one level deeper as soon as it knows them so that the next pages are
+    # fetched while this one is still being extracted. fetch(url) returns the page's
+    # bytes, by default through the shared pooled and cached fetcher. on_page(url, records)
+    # is called after every page. Records are merged across pages.
+    from utils.chunked_extraction import merge_values
+    if fetch is None:
+        from utils.fetcher import get_default_fetcher
+        fetch = lambda url: get_default_fetcher().fetch(url).content
+
+    started_at = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    result = CrawlResult()
+    frontier = CrawlFrontier(politeness_delay, expected_urls=max_pages * 100)
+    for url in start_urls:
+        frontier.add(url)
+    claimed = 0
+    active = 0
+    changed = asyncio.Condition()
+
+    async def queue_links(links, depth, base):
+        async with changed:
+            for link in links:
+                # Links of shallower pages first, the frontier's queue order keeps the
+                # order the page gave them
+                frontier.add(link, priority=depth, depth=depth, base=base)
+            changed.notify_all()
+
+    async def worker():
+        nonlocal claimed, active
+        while True:
+            async with changed:
+                while True:
+                    if claimed >= max_pages or (not frontier and active == 0):
+                        changed.notify_all()
+                        return
+                    url, depth, wait = frontier.next_ready()
+                    if url is not None:
+                        break
+                    # Wait for the politeness delay or for another worker to queue links
+                    try:
+                        await asyncio.wait_for(changed.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+                claimed += 1
+                active += 1
+
+            def follow(links, url=url, depth=depth):
+                if depth < max_depth and links:
+                    asyncio.run_coroutine_threadsafe(queue_links(list(links), depth + 1, url), loop).result()
+
+            try:
+                content = await asyncio.to_thread(fetch, url)
+                records = await asyncio.to_thread(process_page, url, content, follow)
+                result.pages.append(url)
+                merge_values(result.records, records or {})
+                if on_page:
+                    on_page(url, records)
+            except Exception as e:
+                logger.error(f"Crawling {url} failed: {e}")
+                result.errors[url] = str(e)
+            finally:
+                async with changed:
+                    active -= 1
+                    changed.notify_all()
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    result.elapsed = time.perf_counter() - started_at
+    return result
+
+
+def crawl_and_extract(start_url: str, instruction: str, approach: int = 2, max_pages: int = 10, workers: int = 4,
+                      politeness_delay: float = DEFAULT_POLITENESS_DELAY_SECONDS, use_gpt_fallback: bool = True,
+                      fetch=None, on_page=None, cpu_pool=None) -> CrawlResult:
+    # Follow the pagination of start_url and extract every page with approach 1 or 2.
+    # Approach 2 learns the selectors of the first page and reuses them as a template
+    # for the following pages of the same layout. With a cpu_pool the pages are
+    # converted or summarized in its worker processes.
+    from utils.parsed_document import ParsedDocument
+    from utils.pagination import discover_pagination_links
+    from utils.purely_gpt_utils import extract_using_approach_1
+    from utils.css_selector_utils import extract_using_approach_2
+
+    def process_page(url, content, follow):
+        document = ParsedDocument(content, base_url=url)
+        follow(discover_pagination_links(document, url, use_gpt_fallback=use_gpt_fallback))
+        if int(approach) == 1:
+            return extract_using_approach_1(document, instruction, base_url=url, cpu_pool=cpu_pool)
+        return extract_using_approach_2(document, instruction, cpu_pool=cpu_pool)
+
+    return asyncio.run(crawl([start_url], process_page, max_pages=max_pages, workers=workers,
+                             politeness_delay=politeness_delay, fetch=fetch, on_page=on_page))
@@ -1,107 +1,109 @@
-import streamlit as st
-from bs4 import BeautifulSoup
-from utils.get_gpt_response_json import get_gpt_response_json
+from utils.get_gpt_response_json import get_gpt_response_json, stream_gpt_response_json
 import json
 from utils.prompts import (SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS,
-                           USER_REQUEST_FOR_GETTING_THE_DESIRED_SELECTORS,
+                           DESIRED_SELECTORS_TEMPLATE,
                            SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
-                           USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT)
+                           ENHANCING_SELECTORS_CONTENT_TEMPLATE)
 
 from utils.selector_utils import summarize_body_using_dict_method
-from utils.ensure_limit import reduce_string_to_token_limit
+from utils.parsed_document import ParsedDocument
+from utils.selector_engine import compile_selectors
+from utils.summary_budget import fit_summary_to_budget
 from utils.scrape_html_using_scrapenetwork import scrape_body_from_url as scrape_util
+from utils.purely_gpt_utils import report_result
+from utils.reporting import get_sink
+from utils.template_store import get_selectors_with_template
 
 def scrape_body_from_url(url):
     try:
         html_content_scrapped = scrape_util(url=url)
-        soup = BeautifulSoup(html_content_scrapped, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        return html_content_scrapped, body_content
+        # Parse the page once, every later step reuses the same document
+        document = ParsedDocument(html_content_scrapped, base_url=url)
+        return html_content_scrapped, document
     except Exception as e:
-        st.error(f"Error scraping HTML content from URL: {str(e)}")
+        get_sink().error(f"Error scraping HTML content from URL: {str(e)}")
         return None, None
 
 def scrape_body_from_html(html_content_raw):
     try:
-        soup = BeautifulSoup(html_content_raw, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        return html_content_raw, body_content
+        # Parse the page once, every later step reuses the same document
+        document = ParsedDocument.from_content(html_content_raw)
+        return html_content_raw, document
     except Exception as e:
-        st.error(f"Error during HTML content extraction: {str(e)}")
+        get_sink().error(f"Error during HTML content extraction: {str(e)}")
         return None, None
 
 
 def scrape_content_using_selectors(html_content, selectors): 
-    scraped_content = {}
-    # Initialize BeautifulSoup with the HTML content
-    soup = BeautifulSoup(html_content, 'html.parser')
-   
-    def scrape_nested(soup, selectors, content_dict):
-        for name, selector in selectors.items():
-            try:
-                if isinstance(selector, dict):  # Nested structure
-                    content_dict[name] = {}
-                    scrape_nested(soup, selector, content_dict[name])
-                elif isinstance(selector, list):  # Selector is a list
-                    # Concatenate list elements to form a selector string
-                    selector_string = ' '.join(selector)
-                    elements = soup.select(selector_string)
-                    content = [element.get_text(strip=True) for element in elements]
-                    content_dict[name] = content
-                else:  # Selector is a string
-                    elements = soup.select(selector)
-                    content = [element.get_text(strip=True) for element in elements]
-                    content_dict[name] = content
-            except Exception as e:
-                # Log the error and continue with the next selector
-                print(f"Error processing selector {name}: {e}")
-                content_dict[name] = []
-
-    scrape_nested(soup, selectors, scraped_content)
-    return scraped_content
-
-
-def process_using_approach_2(raw_html_content, instruction):
+    # Selectors run against the full page, reuse its tree when a ParsedDocument is given.
+    # The selector dict is compiled once and the plan is cached for later pages.
+    document = ParsedDocument.from_content(html_content)
+    return compile_selectors(selectors).evaluate(document)
+
+
+def extract_using_approach_2(raw_html_content, instruction, on_result=None, use_templates=True, enhance_content=True,
+                             on_record=None, cpu_pool=None):
+    # CSS selectors extraction without any UI, intermediate results are passed to on_result(label, value).
+    # Selectors are reused from the template store for pages that share a site layout, and
+    # with enhance_content=False a template hit needs no GPT call at all. With on_record the
+    # enhanced records are streamed to on_record(path, record), returning False stops early.
+    # With a cpu_pool (utils.cpu_pool.CPUPool) the page is summarized in a worker process.
+    # Process the HTML content
+    html_content_raw, document = scrape_body_from_html(raw_html_content)
+    if not document:
+        return {}
+    report_result(on_result, "Raw HTML Content", document.html)
+
+    # Summarize the HTML content, one exemplar per list of repeated records. The selectors
+    # generated for the exemplar are applied to every record below.
+    if cpu_pool is not None:
+        summarized_dict = cpu_pool.summary(document.raw_html)
+    else:
+        summarized_dict = summarize_body_using_dict_method(document, collapse_records=True)
+    report_result(on_result, "Summarized Selectors", summarized_dict)
+
+    # Generate the desired selectors, unless a stored template still matches this page
+    def generate_selectors():
+        # Degrade the summary until it fits the budget instead of cutting its JSON
+        reduced_dict = json.dumps(fit_summary_to_budget(summarized_dict))
+        user_request_for_desired_selectors = DESIRED_SELECTORS_TEMPLATE.render(
+            INSTRUCTION=instruction, SELECTORS_TO_CONTENT_MAPPING=reduced_dict)
+        return get_gpt_response_json(
+            user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS,
+            raise_errors=True)
+
+    # Scrape content using the generated selectors
+    desired_selectors, scraped_content_after_applying_selectors, from_template = get_selectors_with_template(
+        summarized_dict, instruction, generate_selectors,
+        lambda selectors: scrape_content_using_selectors(html_content=document, selectors=selectors),
+        url=document.base_url, kind="css", use_templates=use_templates)
+    report_result(on_result, "Desired Selectors (cached template)" if from_template else "Desired Selectors GPT", desired_selectors)
+    report_result(on_result, "Scrapped Content after applying Selectors", scraped_content_after_applying_selectors)
+
+    if not enhance_content:
+        return scraped_content_after_applying_selectors
+
+    # Enhance the scraped content
+    user_request_for_enhancing_scrapped_content = ENHANCING_SELECTORS_CONTENT_TEMPLATE.render(
+        INSTRUCTION=instruction, RAW_SCRAPPED_CONTENT_DICT=json.dumps(scraped_content_after_applying_selectors))
+    if on_record:
+        # Stream the answer and pass on every record as soon as it is complete
+        enhanced_scrapped_content, stream = stream_gpt_response_json(
+            user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
+            on_record=on_record, raise_errors=True)
+        report_result(on_result, "Time to First Record (s)", stream.time_to_first_record)
+    else:
+        enhanced_scrapped_content = get_gpt_response_json(
+            user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT,
+            raise_errors=True)
+    report_result(on_result, "Enhanced Content", enhanced_scrapped_content)
+
+    return enhanced_scrapped_content
+
+def process_using_approach_2(raw_html_content, instruction, on_record=None):
+    # Same as extract_using_approach_2 but reports every step and error to the installed sink
+    sink = get_sink()
     try:
-        # Process the HTML content
-        html_content_raw, html_content = scrape_body_from_html(raw_html_content)
-
-        if html_content:
-            with st.expander(label="Raw HTML Content"):
-                st.markdown(html_content)
-
-            # Summarize the HTML content using BeautifulSoup
-            summarized_dict = summarize_body_using_dict_method(html_content)
-            with st.expander(label="Summarized Selectors"):
-                st.json(summarized_dict)
-
-            # Generate the desired selectors
-            reduced_dict = reduce_string_to_token_limit(json.dumps(summarized_dict))
-            user_request_for_desired_selectors = USER_REQUEST_FOR_GETTING_THE_DESIRED_SELECTORS.replace(
-                "<<INSTRUCTION>>", instruction).replace("<<SELECTORS_TO_CONTENT_MAPPING>>", reduced_dict)
-            desired_selectors = get_gpt_response_json(
-                user_request=user_request_for_desired_selectors, system_prompt=SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS)
-
-            with st.expander(label="Desired Selectors GPT"):
-                st.json(desired_selectors)
-
-            # Scrape content using the generated selectors
-            scraped_content_after_applying_selectors = scrape_content_using_selectors(
-                html_content=html_content_raw, selectors=desired_selectors)
-
-            with st.expander(label="Scrapped Content after applying Selectors"):
-                st.json(scraped_content_after_applying_selectors)
-
-            # Enhance the scraped content
-            user_request_for_enhancing_scrapped_content = USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT.replace(
-                "<<INSTRUCTION>>", instruction).replace("<<RAW_SCRAPPED_CONTENT_DICT>>", json.dumps(scraped_content_after_applying_selectors))
-            enhanced_scrapped_content = get_gpt_response_json(
-                user_request=user_request_for_enhancing_scrapped_content, system_prompt=SYSTEM_PROMPT_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT)
-
-            with st.expander(label="Enhanced Content"):
-                st.json(enhanced_scrapped_content)
-
+        return extract_using_approach_2(raw_html_content, instruction, on_result=sink.result, on_record=on_record)
     except Exception as e:
-        st.error(f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        sink.error(f"An unexpected error occurred: {str(e)}")
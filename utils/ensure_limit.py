@@ -1,49 +1,92 @@
-import tiktoken
-import streamlit as st
+from utils.reporting import get_sink
 
-def reduce_string_to_token_limit(input_string: str, token_limit: int = 100000, chunk_size: int = 1000, verbose: bool = False) -> str:
-    try:
-        if verbose:
-            st.info(f"Received input string of length: {len(input_string)}")
-        # Get the encoding for the model, assuming "gpt-4" as an example
-        enc = tiktoken.get_encoding("cl100k_base")
-        if verbose:
-            st.info("Encoding model loaded.")
+# Name of the encoding shared by gpt-4 and gpt-3.5 models
+ENCODING_NAME = "cl100k_base"
+
+# Strategies supported by truncate_to_token_limit
+TRUNCATION_STRATEGIES = ("head", "tail", "middle")
+
+# Marker inserted between the kept parts when using the "middle" strategy
+MIDDLE_TRUNCATION_MARKER = "\n...\n"
+
+# Loading an encoding parses a large BPE ranks file, so it is done once per process
+_encoding = None
+
+
+def get_encoding():
+    global _encoding
+    if _encoding is None:
+        import tiktoken
+        _encoding = tiktoken.get_encoding(ENCODING_NAME)
+    return _encoding
+
+
+def count_tokens(input_string: str) -> int:
+    return len(get_encoding().encode(input_string, disallowed_special=()))
 
-        # Count the initial number of tokens
-        total_tokens = len(enc.encode(input_string))
-        if verbose:
-            st.info(f"Initial number of tokens: {total_tokens}")
 
-        # Check if the total tokens are within the limit
-        if total_tokens <= token_limit:
-            if verbose:
-                st.info("Total tokens are within the limit, returning the original string.")
-            return input_string
+def truncate_to_token_limit(input_string: str, token_limit: int = 100000, strategy: str = "head") -> str:
+    # Keep at most token_limit tokens of the input string.
+    # "head" keeps the beginning, "tail" keeps the end and "middle" keeps both ends
+    # and drops the centre of the string.
+    if strategy not in TRUNCATION_STRATEGIES:
+        raise ValueError(f"Unknown truncation strategy: {strategy}")
+    if token_limit <= 0:
+        return ""
 
+    # Encode once and cut at the exact token boundary instead of re-encoding
+    # the remaining string after every removed chunk
+    enc = get_encoding()
+    tokens = enc.encode(input_string, disallowed_special=())
+    if len(tokens) <= token_limit:
+        return input_string
+
+    if strategy == "head":
+        return _decode_within_limit(enc, tokens[:token_limit], token_limit, keep="head")
+    if strategy == "tail":
+        return _decode_within_limit(enc, tokens[-token_limit:], token_limit, keep="tail")
+
+    marker_tokens = len(enc.encode(MIDDLE_TRUNCATION_MARKER))
+    available = token_limit - marker_tokens
+    if available <= 0:
+        return _decode_within_limit(enc, tokens[:token_limit], token_limit, keep="head")
+    head_limit = (available + 1) // 2
+    tail_limit = available - head_limit
+    head = _decode_within_limit(enc, tokens[:head_limit], head_limit, keep="head")
+    tail = _decode_within_limit(enc, tokens[len(tokens) - tail_limit:], tail_limit, keep="tail") if tail_limit else ""
+    return head + MIDDLE_TRUNCATION_MARKER + tail
+
+
+def _decode_within_limit(enc, tokens, token_limit, keep):
+    # Decoding a slice can split a multi-byte character, and re-encoding the decoded
+    # text is not guaranteed to give back the same token count. Trim the cut edge
+    # one token at a time until the text re-encodes within the limit, which almost
+    # always happens on the first check.
+    while tokens:
+        text = enc.decode(tokens, errors="ignore")
+        if len(enc.encode(text, disallowed_special=())) <= token_limit:
+            return text
+        tokens = tokens[:-1] if keep == "head" else tokens[1:]
+    return ""
+
+
+def reduce_string_to_token_limit(input_string: str, token_limit: int = 100000, chunk_size: int = 1000, verbose: bool = False, strategy: str = "head") -> str:
+    # chunk_size is kept for backwards compatibility, truncation now happens at the
+    # exact token boundary in a single pass
+    sink = get_sink()
+    try:
         if verbose:
-            st.info(f"Total tokens exceed the limit of {token_limit}, starting reduction process.")
-        # If tokens exceed the limit, start removing chunks from the end
-        while total_tokens > token_limit and len(input_string) > 0:
-            # Determine the size of the chunk to remove
-            actual_chunk_size = min(chunk_size, len(input_string))
-            if verbose:
-                st.info(f"Attempting to remove a chunk of size: {actual_chunk_size}")
-
-            # Remove the chunk from the end of the string
-            input_string = input_string[:-actual_chunk_size]
-            if verbose:
-                st.info(f"Chunk removed. New string length: {len(input_string)}")
-
-            # Count the tokens in the updated string
-            total_tokens = len(enc.encode(input_string))
-            if verbose:
-                st.info(f"New total number of tokens: {total_tokens}")
+            sink.info(f"Received input string of length: {len(input_string)}")
+
+        reduced_string = truncate_to_token_limit(input_string, token_limit=token_limit, strategy=strategy)
 
         if verbose:
-            st.info("Reduction process completed. Returning the reduced string.")
-        return input_string
+            if reduced_string is input_string:
+                sink.info("Total tokens are within the limit, returning the original string.")
+            else:
+                sink.info(f"Total tokens exceeded the limit of {token_limit}, string reduced to length: {len(reduced_string)}")
+        return reduced_string
     except Exception as e:
         if verbose:
-            st.error(f"An error occurred while reducing the string to the token limit: {e}")
-        return ""
\ No newline at end of file
+            sink.error(f"An error occurred while reducing the string to the token limit: {e}")
+        return ""
@@ -0,0 +1,297 @@
+import email.utils
+import json
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+import httpx
+from dotenv import load_dotenv
+from utils.reporting import logger
+
+# Every page is fetched through one Fetcher: a pooled keep-alive HTTP client with
+# timeouts, a limit on concurrent requests per host and an on-disk HTTP cache. Cached
+# pages are served while fresh and revalidated with If-None-Match / If-Modified-Since
+# once stale, a 304 answer costs no body. Backends decide what is requested, either
+# the page itself or a rendering proxy such as ScrapeNetwork.
+
+load_dotenv()
+
+DEFAULT_FETCH_CACHE_PATH = os.getenv("FETCH_CACHE_PATH", os.path.join(".cache", "http_cache.sqlite3"))
+DEFAULT_FETCH_CACHE_MAX_SIZE_BYTES = int(os.getenv("FETCH_CACHE_MAX_SIZE_BYTES", 512 * 1024 * 1024))
+FETCH_CACHE_DISABLED = os.getenv("FETCH_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+# Rendered pages carry no validators of the page itself, they are reused for this long
+DEFAULT_RENDER_TTL_SECONDS = int(os.getenv("FETCH_RENDER_TTL_SECONDS", 60 * 60))
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", 30))
+DEFAULT_USER_AGENT = "Mozilla/5.0 (compatible; IntelliScrape/1.0)"
+
+
+def get_accept_encoding() -> str:
+    # httpx decodes brotli only when a brotli package is installed, never ask for it otherwise
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        pass
+    try:
+        import brotlicffi  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        return "gzip, deflate"
+
+
+def parse_cache_control(value: str) -> dict:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or True
+    return directives
+
+
+def get_expires_at(headers, now: float, default_ttl: float = 0) -> float:
+    # Time until which a response may be served without revalidation
+    directives = parse_cache_control(headers.get("cache-control"))
+    if "no-cache" in directives:
+        return now
+    if "max-age" in directives:
+        try:
+            return now + int(directives["max-age"])
+        except ValueError:
+            return now
+    if headers.get("expires"):
+        try:
+            return email.utils.parsedate_to_datetime(headers["expires"]).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now + default_ttl
+
+
+class FetchResponse:
+    def __init__(self, url, status_code, headers, content, from_cache=False, revalidated=False, elapsed=0.0):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        # Served from the cache without a request, or after a 304 answer
+        self.from_cache = from_cache
+        self.revalidated = revalidated
+        self.elapsed = elapsed
+
+
+class HTTPCache:
+    # Responses stored in SQLite by backend and URL with their validators. The least
+    # recently used entries are evicted once the bodies exceed max_size_bytes.
+
+    def __init__(self, path: str = DEFAULT_FETCH_CACHE_PATH, max_size_bytes: int = DEFAULT_FETCH_CACHE_MAX_SIZE_BYTES):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.revalidations = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, status INTEGER NOT NULL, headers TEXT NOT NULL, content BLOB NOT NULL, "
+            "size INTEGER NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, key: str):
+        # Return (status, headers, content, expires_at) or None
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, headers, content, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0], json.loads(row[1]), row[2], row[3]
+
+    def set(self, key: str, status: int, headers: dict, content: bytes, expires_at: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, status, headers, content, size, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, status, json.dumps(headers), content, len(content), expires_at, now))
+            self._evict()
+
+    def refresh(self, key: str, headers: dict, expires_at: float) -> None:
+        # A 304 answer confirms the stored body, only its headers and freshness change
+        with self._lock:
+            self._connection.execute("UPDATE responses SET headers = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                                     (json.dumps(headers), expires_at, time.time(), key))
+
+    def _evict(self) -> None:
+        if self.max_size_bytes is None:
+            return
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        rows = self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            stale_keys.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "revalidations": self.revalidations, "misses": self.misses,
+                "entries": entries, "size_bytes": size}
+
+
+class DirectBackend:
+    # Requests the page itself
+    name = "direct"
+    supports_revalidation = True
+    default_ttl = 0
+
+    def build_request(self, url: str):
+        return url, None
+
+
+class ScrapeNetworkBackend:
+    # Requests the page through the ScrapeNetwork rendering proxy, which runs its scripts.
+    # Its answers say nothing about the page's own validators, so they are reused for
+    # default_ttl seconds instead of revalidated.
+    name = "scrapenetwork"
+    supports_revalidation = False
+    api_url = "https://app.scrapenetwork.com/api"
+
+    def __init__(self, api_key: str = None, js_render: bool = True, default_ttl: float = DEFAULT_RENDER_TTL_SECONDS):
+        self.api_key = api_key
+        self.js_render = js_render
+        self.default_ttl = default_ttl
+
+    def build_request(self, url: str):
+        params = {
+            'api_key': self.api_key or os.getenv("SCRAPENETWORK_API_KEY"),
+            'request_url': url,
+            'js_render': 'true' if self.js_render else 'false'
+        }
+        return self.api_url, params
+
+
+BACKENDS = {"direct": DirectBackend, "scrapenetwork": ScrapeNetworkBackend}
+
+
+class Fetcher:
+    def __init__(self, backend=None, max_connections: int = 20, per_host_limit: int = 4,
+                 timeout: float = DEFAULT_TIMEOUT_SECONDS, cache=None, use_cache: bool = True,
+                 user_agent: str = DEFAULT_USER_AGENT):
+        self.backend = backend or DirectBackend()
+        self.per_host_limit = per_host_limit
+        self.use_cache = use_cache and not FETCH_CACHE_DISABLED
+        self.cache = (cache or get_default_http_cache()) if self.use_cache else None
+        self._host_semaphores = {}
+        self._host_lock = threading.Lock()
+        # One pooled client, connections to a host are kept alive and reused
+        self.client = httpx.Client(
+            timeout=timeout, follow_redirects=True,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            headers={"User-Agent": user_agent, "Accept-Encoding": get_accept_encoding()})
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _host_semaphore(self, url: str):
+        host = urlsplit(url).netloc.lower()
+        with self._host_lock:
+            semaphore = self._host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = self._host_semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+        return semaphore
+
+    def fetch(self, url: str, use_cache: bool = None) -> FetchResponse:
+        # Return the page at url, raise httpx.HTTPError for failed requests and error statuses
+        started_at = time.perf_counter()
+        cache = self.cache if use_cache is not False else None
+        key = f"{self.backend.name} {url}"
+        cached = cache.get(key) if cache is not None else None
+        now = time.time()
+        if cached is not None and cached[3] > now:
+            cache.hits += 1
+            status, headers, content, _ = cached
+            return FetchResponse(url, status, headers, content, from_cache=True, elapsed=time.perf_counter() - started_at)
+
+        request_url, params = self.backend.build_request(url)
+        request_headers = {}
+        if cached is not None and self.backend.supports_revalidation:
+            if cached[1].get("etag"):
+                request_headers["If-None-Match"] = cached[1]["etag"]
+            if cached[1].get("last-modified"):
+                request_headers["If-Modified-Since"] = cached[1]["last-modified"]
+
+        # The target host is limited, not the proxy, a render proxy fetches it for us
+        with self._host_semaphore(url):
+            response = self.client.get(request_url, params=params, headers=request_headers)
+        headers = {name.lower(): value for name, value in response.headers.items()}
+
+        if response.status_code == 304 and cached is not None:
+            cache.revalidations += 1
+            status, stored_headers, content, _ = cached
+            stored_headers.update({name: value for name, value in headers.items()
+                                   if name in ("etag", "last-modified", "cache-control", "expires", "date")})
+            cache.refresh(key, stored_headers, get_expires_at(stored_headers, now, self.backend.default_ttl))
+            return FetchResponse(url, status, stored_headers, content, from_cache=True, revalidated=True,
+                                 elapsed=time.perf_counter() - started_at)
+
+        response.raise_for_status()
+        content = response.content
+        if cache is not None:
+            cache.misses += 1
+            expires_at = get_expires_at(headers, now, self.backend.default_ttl)
+            # Worth storing when it can be reused as is or revalidated later
+            reusable = expires_at > now or (self.backend.supports_revalidation and
+                                            (headers.get("etag") or headers.get("last-modified")))
+            if reusable and "no-store" not in parse_cache_control(headers.get("cache-control")):
+                # Bodies are stored decoded, the encoding headers no longer apply
+                headers.pop("content-encoding", None)
+                headers.pop("content-length", None)
+                cache.set(key, response.status_code, headers, content, expires_at)
+        logger.debug(f"Fetched {url} through {self.backend.name}: {response.status_code}, {len(content)} bytes")
+        return FetchResponse(url, response.status_code, headers, content, elapsed=time.perf_counter() - started_at)
+
+
+_default_cache = None
+_default_fetchers = {}
+_default_lock = threading.Lock()
+
+
+def get_default_http_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = HTTPCache()
+    return _default_cache
+
+
+def get_default_fetcher(backend_name: str = None) -> Fetcher:
+    # One shared fetcher per backend, FETCH_BACKEND picks the backend when none is given
+    backend_name = backend_name or os.getenv("FETCH_BACKEND", "direct")
+    if backend_name not in BACKENDS:
+        raise ValueError(f"Unknown fetch backend: {backend_name}")
+    cache = get_default_http_cache() if not FETCH_CACHE_DISABLED else None
+    with _default_lock:
+        if backend_name not in _default_fetchers:
+            _default_fetchers[backend_name] = Fetcher(BACKENDS[backend_name](), cache=cache)
+    return _default_fetchers[backend_name]
@@ -1,18 +1,11 @@
-import streamlit as st
-from openai import OpenAI
-from dotenv import load_dotenv
+from utils.openai_client import get_openai_client
+from utils.reporting import get_sink
 from utils.prompts import (SYSTEM_PROMPT_DEFAULT)
+from utils.llm_cache import cached_completion
 
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI()
-
-# @st.cache_data
-def get_gpt_response(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT, model: str = "gpt-4-1106-preview"):
-    try:
-        result = client.chat.completions.create(
+def get_gpt_response(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT, model: str = "gpt-4-1106-preview", use_cache: bool = True):
+    def create_response():
+        result = get_openai_client().chat.completions.create(
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_request}
@@ -20,6 +13,11 @@ def get_gpt_response(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAU
             model=model
         )
         return result.choices[0].message.content.strip()
+
+    try:
+        # Responses are cached on disk, failed calls are never stored
+        return cached_completion(create_response, model=model, system_prompt=system_prompt,
+                                 user_request=user_request, use_cache=use_cache)
     except Exception as e:
-        st.error(f"Error getting GPT response: {str(e)}")
+        get_sink().error(f"Error getting GPT response: {str(e)}")
         return {}
@@ -1,28 +1,136 @@
-
-import streamlit as st
-from openai import OpenAI
-from dotenv import load_dotenv
-from utils.prompts import (SYSTEM_PROMPT_DEFAULT)
+from utils.openai_client import get_openai_client, read_usage
+from utils.reporting import get_sink
+from utils.prompts import (SYSTEM_PROMPT_DEFAULT, build_messages)
+from utils.llm_cache import cached_completion, get_default_cache, make_cache_key
+from utils.streaming_json import IncrementalJSONParser, iter_records, build_partial_result
 import json
+import time
 
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-client = OpenAI()
+RESPONSE_FORMAT_JSON = {"type": "json_object"}
+# Streamed answers end with a chunk carrying the usage of the request
+STREAM_OPTIONS = {"stream_options": {"include_usage": True}}
 
-# @st.cache_data
-def get_gpt_response_json(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT, model: str = "gpt-4-1106-preview"):
-    try:
-        result = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_request}
-            ],
+def get_gpt_response_json(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT, model: str = "gpt-4-1106-preview",
+                          use_cache: bool = True, page_content: str = None, on_usage=None, raise_errors: bool = False):
+    # With page_content the page is sent ahead of the system prompt and request, as the
+    # prefix shared with other requests about the page (see utils.prompts.build_messages).
+    # on_usage(usage) receives the token counts of every request actually sent.
+    # A failed call is reported to the sink and returns {}, with raise_errors it raises instead.
+    def create_response():
+        result = get_openai_client().chat.completions.create(
+            messages=build_messages(system_prompt, user_request, page_content),
             model=model,
-            response_format={"type": "json_object"}
+            response_format=RESPONSE_FORMAT_JSON
         )
+        if on_usage:
+            on_usage(read_usage(result.usage))
         return json.loads(result.choices[0].message.content.strip())
+
+    try:
+        # Responses are cached on disk, failed calls are never stored
+        return cached_completion(create_response, model=model, system_prompt=system_prompt,
+                                 user_request=user_request, response_format=RESPONSE_FORMAT_JSON,
+                                 use_cache=use_cache, page_content=page_content)
+    except Exception as e:
+        if raise_errors:
+            raise
+        get_sink().error(f"Error getting GPT response: {str(e)}")
+        return {}
+
+class JSONResponseStream:
+    # Streamed variant of get_gpt_response_json. Iterating yields (path, record) pairs
+    # as soon as each record of the answer is complete, see utils.streaming_json.
+    # Leaving the loop early closes the connection, the records received so far are
+    # in partial_result. Cached answers are replayed, complete answers are cached.
+    # usage holds the token counts of a request streamed to the end.
+
+    def __init__(self, user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT,
+                 model: str = "gpt-4-1106-preview", use_cache: bool = True, page_content: str = None):
+        self.user_request = user_request
+        self.system_prompt = system_prompt
+        self.model = model
+        self.use_cache = use_cache
+        self.page_content = page_content
+        self.usage = None
+        self.records = []
+        self.result = None
+        self.complete = False
+        self.from_cache = False
+        self.time_to_first_record = None
+        self.total_time = None
+        self._stream = None
+
+    def _cache_key(self):
+        return make_cache_key(self.model, self.system_prompt, self.user_request, RESPONSE_FORMAT_JSON,
+                              self.page_content)
+
+    def __iter__(self):
+        started_at = time.perf_counter()
+        cache = get_default_cache() if self.use_cache else None
+        cached = cache.get(self._cache_key()) if cache is not None else None
+        try:
+            if cached is not None:
+                self.from_cache = True
+                records = iter_records(cached)
+            else:
+                records = self._stream_records()
+            for path, record in records:
+                if self.time_to_first_record is None:
+                    self.time_to_first_record = time.perf_counter() - started_at
+                self.records.append((path, record))
+                yield path, record
+            self.result = cached if cached is not None else self._parser.result()
+            self.complete = True
+            if cached is None and cache is not None:
+                cache.set(self._cache_key(), self.result)
+        finally:
+            self.total_time = time.perf_counter() - started_at
+            self.close()
+
+    def _stream_records(self):
+        self._parser = IncrementalJSONParser()
+        self._stream = get_openai_client().chat.completions.create(
+            messages=build_messages(self.system_prompt, self.user_request, self.page_content),
+            model=self.model,
+            response_format=RESPONSE_FORMAT_JSON,
+            stream=True,
+            extra_body=STREAM_OPTIONS
+        )
+        for chunk in self._stream:
+            if getattr(chunk, "usage", None):
+                self.usage = read_usage(chunk.usage)
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                yield from self._parser.feed(content)
+
+    def close(self) -> None:
+        # Stop the answer from streaming in, safe to call more than once
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    @property
+    def partial_result(self):
+        return self.result if self.complete else build_partial_result(self.records)
+
+
+def stream_gpt_response_json(user_request: str, system_prompt: str = SYSTEM_PROMPT_DEFAULT,
+                             model: str = "gpt-4-1106-preview", on_record=None, use_cache: bool = True,
+                             page_content: str = None, raise_errors: bool = False):
+    # Return (result, stream) while passing every record to on_record(path, record) as it
+    # arrives. on_record returning False cancels the answer, result then holds the
+    # records received so far. A failed answer is reported to the sink, with raise_errors
+    # it raises instead.
+    stream = JSONResponseStream(user_request, system_prompt, model, use_cache, page_content)
+    records = iter(stream)
+    try:
+        for path, record in records:
+            if on_record and on_record(path, record) is False:
+                break
     except Exception as e:
-        st.error(f"Error getting GPT response: {str(e)}")
-        return {}
\ No newline at end of file
+        if raise_errors:
+            raise
+        get_sink().error(f"Error getting GPT response: {str(e)}")
+    finally:
+        records.close()
+    return stream.partial_result, stream
@@ -0,0 +1,230 @@
+import hashlib
+import json
+import re
+import struct
+from collections import Counter, defaultdict
+from utils.parsed_document import ParsedDocument
+
+# Structural signatures of pages. Every element of the cleaned body contributes the
+# tag.class path of itself and its closest ancestors, the same paths the dict and
+# XPath summaries walk. Text never takes part, so two pages rendered from one
+# template get near identical signatures whatever their content.
+#
+# SimHash gives a single 64 bit value to compare by Hamming distance, MinHash
+# estimates the Jaccard similarity of the path sets and drives the LSH index that
+# groups pages into layout clusters without comparing every pair.
+
+# Number of path levels in a shingle, deeper paths repeat for every wrapper element
+SHINGLE_DEPTH = 3
+MINHASH_PERMUTATIONS = 64
+SIMHASH_BITS = 64
+
+# Pages whose estimated path similarity reaches this value share a layout
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+
+# 16 bands of 4 rows put the LSH candidate threshold around (1/16) ** (1/4) = 0.5,
+# well below the clustering threshold so near duplicates are hardly ever missed
+DEFAULT_LSH_BANDS = 16
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+DIGITS_PATTERN = re.compile(r'\d+')
+
+
+def _make_permutations(count):
+    # Fixed coefficients so signatures stay comparable across processes and runs
+    permutations = []
+    for i in range(count):
+        digest = hashlib.blake2b(f"minhash-{i}".encode(), digest_size=16).digest()
+        a, b = struct.unpack("<QQ", digest)
+        permutations.append(((a % (MERSENNE_PRIME - 1)) + 1, b % MERSENNE_PRIME))
+    return permutations
+
+
+PERMUTATIONS = _make_permutations(MINHASH_PERMUTATIONS)
+
+
+def _hash_shingle(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def get_node_label(element) -> str:
+    # tag plus its sorted classes with digits normalized, e.g. div.price.price-0
+    classes = element.get('class')
+    if not classes:
+        return element.tag
+    return '.'.join([element.tag] + sorted(DIGITS_PATTERN.sub('0', c) for c in classes.split()))
+
+
+def get_layout_shingles(html_content, depth: int = SHINGLE_DEPTH) -> Counter:
+    # Count the tag.class path suffixes of every element in the cleaned body
+    document = ParsedDocument.from_content(html_content)
+    shingles = Counter()
+    stack = [(document.body, ())]
+    while stack:
+        element, parent_path = stack.pop()
+        if not isinstance(element.tag, str):
+            continue
+        path = (parent_path + (get_node_label(element),))[-depth:]
+        shingles['/'.join(path)] += 1
+        for child in element:
+            stack.append((child, path))
+    return shingles
+
+
+class LayoutSignature:
+    __slots__ = ('simhash', 'minhash', 'shingle_count')
+
+    def __init__(self, simhash: int, minhash: tuple, shingle_count: int):
+        self.simhash = simhash
+        self.minhash = minhash
+        self.shingle_count = shingle_count
+
+    def similarity(self, other) -> float:
+        # MinHash estimate of the Jaccard similarity of the two path sets
+        if not self.minhash or not other.minhash:
+            return 0.0
+        equal = sum(1 for a, b in zip(self.minhash, other.minhash) if a == b)
+        return equal / len(self.minhash)
+
+    def hamming_distance(self, other) -> int:
+        return bin(self.simhash ^ other.simhash).count('1')
+
+    def to_dict(self) -> dict:
+        return {"simhash": self.simhash, "minhash": list(self.minhash), "shingle_count": self.shingle_count}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(data["simhash"], tuple(data["minhash"]), data["shingle_count"])
+
+
+def compute_simhash(weighted_hashes) -> int:
+    # weighted_hashes is a list of (64 bit hash, weight)
+    weights = [0] * SIMHASH_BITS
+    for value, weight in weighted_hashes:
+        for bit in range(SIMHASH_BITS):
+            if value >> bit & 1:
+                weights[bit] += weight
+            else:
+                weights[bit] -= weight
+    simhash = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            simhash |= 1 << bit
+    return simhash
+
+
+def compute_minhash(hashes) -> tuple:
+    if not hashes:
+        return ()
+    # Only the low 32 bits take part, the permutation is computed modulo a 61 bit prime
+    values = [h & MAX_HASH for h in hashes]
+    return tuple(min((a * value + b) % MERSENNE_PRIME for value in values) for a, b in PERMUTATIONS)
+
+
+def compute_layout_signature(html_content, depth: int = SHINGLE_DEPTH) -> LayoutSignature:
+    # Accepts a ParsedDocument, a BeautifulSoup tag or raw HTML
+    return compute_shingles_signature(get_layout_shingles(html_content, depth=depth))
+
+
+def compute_shingles_signature(shingles: Counter) -> LayoutSignature:
+    # Signature of any counted set of structural paths, e.g. those of a page summary
+    hashed = [(_hash_shingle(shingle), count) for shingle, count in shingles.items()]
+    # Weight by log-ish counts so one long repeated list does not drown out the page frame
+    simhash = compute_simhash([(value, 1 + count.bit_length()) for value, count in hashed])
+    minhash = compute_minhash([value for value, _ in hashed])
+    return LayoutSignature(simhash, minhash, len(shingles))
+
+
+class LayoutClusterIndex:
+    # LSH index over MinHash signatures. A page is compared only against the pages
+    # that share at least one band with it and joins the cluster of the most similar
+    # one above the threshold, otherwise it starts a new cluster. A bucket keeps one
+    # page per cluster, so thousands of pages of one layout cost a single comparison.
+
+    def __init__(self, bands: int = DEFAULT_LSH_BANDS, threshold: float = DEFAULT_SIMILARITY_THRESHOLD):
+        if MINHASH_PERMUTATIONS % bands:
+            raise ValueError(f"bands must divide {MINHASH_PERMUTATIONS}")
+        self.bands = bands
+        self.rows = MINHASH_PERMUTATIONS // bands
+        self.threshold = threshold
+        self.signatures = {}
+        self.cluster_of = {}
+        self._buckets = defaultdict(dict)
+        self._next_cluster = 0
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, signature.minhash[band * rows:(band + 1) * rows]
+
+    def query(self, signature, limit: int = None):
+        # Return [(page_id, similarity)] of indexed pages above the threshold, best first.
+        # At most one page per cluster and band is considered.
+        candidates = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, {}).values())
+        matches = []
+        for page_id in candidates:
+            similarity = signature.similarity(self.signatures[page_id])
+            if similarity >= self.threshold:
+                matches.append((page_id, similarity))
+        matches.sort(key=lambda match: match[1], reverse=True)
+        return matches[:limit] if limit else matches
+
+    def add(self, page_id, signature) -> int:
+        # Index a page and return the id of its layout cluster
+        if page_id in self.signatures:
+            return self.cluster_of[page_id]
+        matches = self.query(signature, limit=1) if signature.minhash else []
+        if matches:
+            cluster_id = self.cluster_of[matches[0][0]]
+        else:
+            cluster_id = self._next_cluster
+        self.restore(page_id, cluster_id, signature)
+        return cluster_id
+
+    def restore(self, page_id, cluster_id: int, signature) -> None:
+        # Index a page with the cluster it was assigned before, e.g. when loading
+        self.signatures[page_id] = signature
+        self.cluster_of[page_id] = cluster_id
+        self._index_bands(page_id, signature, cluster_id)
+        self._next_cluster = max(self._next_cluster, cluster_id + 1)
+
+    def _index_bands(self, page_id, signature, cluster_id):
+        if signature.minhash:
+            for key in self._band_keys(signature):
+                self._buckets[key].setdefault(cluster_id, page_id)
+
+    def add_document(self, page_id, html_content) -> int:
+        return self.add(page_id, compute_layout_signature(html_content))
+
+    def clusters(self) -> dict:
+        # cluster id -> list of page ids, in insertion order
+        grouped = defaultdict(list)
+        for page_id, cluster_id in self.cluster_of.items():
+            grouped[cluster_id].append(page_id)
+        return dict(grouped)
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def save(self, path: str) -> None:
+        # Page ids must be JSON serializable, buckets are rebuilt on load
+        data = {
+            "bands": self.bands,
+            "threshold": self.threshold,
+            "pages": [[page_id, self.cluster_of[page_id], signature.to_dict()]
+                      for page_id, signature in self.signatures.items()],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(bands=data["bands"], threshold=data["threshold"])
+        for page_id, cluster_id, signature_data in data["pages"]:
+            index.restore(page_id, cluster_id, LayoutSignature.from_dict(signature_data))
+        return index
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Defaults can be overridden through the environment so batch jobs and the
+# Streamlit app share the same cache file
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm_responses.sqlite3"))
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+DEFAULT_MAX_SIZE_BYTES = int(os.getenv("LLM_CACHE_MAX_SIZE_BYTES", 256 * 1024 * 1024))
+CACHE_DISABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+def make_cache_key(model: str, system_prompt: str, user_request: str, response_format=None, page_content=None) -> str:
+    # Content address of a request, the same inputs always map to the same key. Requests
+    # without page content keep the keys they had before it was sent separately.
+    inputs = [model, system_prompt, user_request, response_format]
+    if page_content is not None:
+        inputs.append(page_content)
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    # Persistent response cache backed by SQLite.
+    # Entries expire after ttl_seconds and the least recently used ones are evicted
+    # once the stored responses exceed max_size_bytes.
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_size_bytes: int = DEFAULT_MAX_SIZE_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # A single connection guarded by a lock, SQLite handles locking between processes
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at = row
+            if self.ttl_seconds is not None and now - created_at > self.ttl_seconds:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value) -> None:
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now))
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl_seconds is not None:
+            self._connection.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+        if self.max_size_bytes is None:
+            return
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_size_bytes:
+            return
+        # Drop least recently used entries until the cache fits again
+        rows = self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        stale_keys = []
+        for key, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+            stale_keys.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM responses WHERE key = ?", stale_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "size_bytes": size}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache():
+    # The cache shared by get_gpt_response and get_gpt_response_json, None when disabled
+    global _default_cache
+    if CACHE_DISABLED:
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+    return _default_cache
+
+
+def get_completion_cache(use_cache: bool = True, cache=None):
+    # The cache a completion is read from and stored in, None when it is bypassed
+    if not use_cache:
+        return None
+    return cache if cache is not None else get_default_cache()
+
+
+def cached_completion(create_response, model: str, system_prompt: str, user_request: str,
+                      response_format=None, use_cache: bool = True, cache=None, page_content=None):
+    # Return the cached response for these inputs or call create_response() and store it.
+    # use_cache=False bypasses the cache for both reading and writing.
+    cache = get_completion_cache(use_cache, cache)
+    if cache is None:
+        return create_response()
+    key = make_cache_key(model, system_prompt, user_request, response_format, page_content)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    response = create_response()
+    cache.set(key, response)
+    return response
+
+
+async def cached_completion_async(create_response, model: str, system_prompt: str, user_request: str,
+                                  response_format=None, use_cache: bool = True, cache=None, page_content=None):
+    # cached_completion for a coroutine function create_response. SQLite is read and
+    # written in a worker thread so the event loop keeps serving other requests.
+    cache = await asyncio.to_thread(get_completion_cache, use_cache, cache)
+    if cache is None:
+        return await create_response()
+    key = make_cache_key(model, system_prompt, user_request, response_format, page_content)
+    cached = await asyncio.to_thread(cache.get, key)
+    if cached is not None:
+        return cached
+    response = await create_response()
+    await asyncio.to_thread(cache.set, key, response)
+    return response
@@ -0,0 +1,196 @@
+import re
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+from utils.crawl_frontier import TRACKING_PARAMS
+
+# Pages are converted to markdown in one walk over their lxml tree, without serializing
+# and parsing them again. Content the extraction never needs is left out on the way:
+# scripts, styles, hidden elements, inline SVG, images embedded as data URIs, site
+# navigation and link lists repeated on the same page. Tracking parameters are removed
+# from URLs and URLs still longer than max_url_length lose their query.
+
+SKIPPED_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'math', 'iframe', 'canvas', 'object',
+                          'embed', 'head', 'meta', 'link', 'select', 'input', 'textarea', 'video', 'audio', 'map'])
+BOILERPLATE_TAGS = frozenset(['nav', 'footer'])
+BOILERPLATE_ROLES = frozenset(['navigation', 'banner', 'contentinfo', 'search'])
+BLOCK_TAGS = frozenset(['p', 'div', 'section', 'article', 'main', 'header', 'aside', 'figure', 'figcaption',
+                        'blockquote', 'address', 'details', 'summary', 'dl', 'dt', 'dd', 'fieldset', 'form',
+                        'center', 'table', 'caption', 'thead', 'tbody', 'tfoot', 'body', 'html'])
+HEADING_LEVELS = {'h1': 1, 'h2': 2, 'h3': 3, 'h4': 4, 'h5': 5, 'h6': 6}
+LIST_TAGS = frozenset(['ul', 'ol', 'menu'])
+BOLD_TAGS = frozenset(['strong', 'b'])
+# Lists of at least this many links are dropped when the same links were listed before
+MIN_REPEATED_LINKS = 3
+MAX_URL_LENGTH = 120
+
+HIDDEN_STYLE_PATTERN = re.compile(r'display\s*:\s*none|visibility\s*:\s*hidden', re.IGNORECASE)
+TRACKING_PATH_PATTERN = re.compile(r'/ref=[^/]*$')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# Paragraph breaks and indentation are written as PARAGRAPH and INDENT and resolved once
+# the page is rendered, so they are told apart from the whitespace of the page's text
+PARAGRAPH = '\x00'
+INDENT = '\x01'
+LINE_BREAKS_PATTERN = re.compile(r'[ \t]*(?:[\n\x00][\x01 \t]*)+')
+EMPTY_ITEM_LINE_PATTERN = re.compile(r'^([ \t]*(?:\d+\.|\*)) *\n(?!\n)[ \t]*', re.MULTILINE)
+INLINE_WHITESPACE_PATTERN = re.compile(r'[\s\x00\x01]+')
+REPEATED_SPACES_PATTERN = re.compile(r'(?<=\S) {2,}')
+
+
+def is_hidden(element) -> bool:
+    if element.get('hidden') is not None or element.get('aria-hidden') == 'true':
+        return True
+    style = element.get('style')
+    return bool(style and HIDDEN_STYLE_PATTERN.search(style))
+
+
+def _join_line_breaks(match):
+    # A run of line breaks becomes a blank line if it held a paragraph break, and keeps
+    # the indentation of its last line
+    run = match.group(0)
+    indent = re.split(r'[\n\x00]', run)[-1].count(INDENT)
+    return ('\n\n' if PARAGRAPH in run else '\n') + ' ' * indent
+
+
+class MarkdownConverter:
+    def __init__(self, base_url: str = None, strip_boilerplate: bool = True, max_url_length: int = MAX_URL_LENGTH):
+        self.base_url = base_url
+        self.strip_boilerplate = strip_boilerplate
+        self.max_url_length = max_url_length
+        self.parts = []
+        self.indent = ''
+        self.list_counters = []
+        self.seen_link_lists = set()
+
+    def convert(self, element) -> str:
+        self.parts = []
+        self._render(element)
+        text = LINE_BREAKS_PATTERN.sub(_join_line_breaks, ''.join(self.parts))
+        # List items starting with a block keep it on the item's line
+        text = EMPTY_ITEM_LINE_PATTERN.sub(r'\1 ', text)
+        return REPEATED_SPACES_PATTERN.sub(' ', text).strip() + '\n'
+
+    def shorten_url(self, href: str) -> str:
+        url = urljoin(self.base_url, href.strip()) if self.base_url else href.strip()
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https', ''):
+            return url
+        query = urlencode([(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                           if name.lower() not in TRACKING_PARAMS and not name.lower().startswith('utm_')])
+        path = TRACKING_PATH_PATTERN.sub('', parts.path)
+        url = urlunsplit((parts.scheme, parts.netloc, path, query, ''))
+        if len(url) > self.max_url_length:
+            url = urlunsplit((parts.scheme, parts.netloc, path, '', ''))
+        return url
+
+    def _block(self):
+        # Blocks inside list items only start a new line, a blank line would end the item
+        self.parts.append(('\n' if self.list_counters else PARAGRAPH) + self.indent)
+
+    def _text(self, text):
+        self.parts.append(WHITESPACE_PATTERN.sub(' ', text))
+
+    def _children(self, element):
+        if element.text:
+            self._text(element.text)
+        for child in element:
+            self._render(child)
+            if child.tail:
+                self._text(child.tail)
+
+    def _inline(self, element) -> str:
+        # The rendered content of element on a single line
+        parts = self.parts
+        self.parts = []
+        self._children(element)
+        text = INLINE_WHITESPACE_PATTERN.sub(' ', ''.join(self.parts)).strip()
+        self.parts = parts
+        return text
+
+    def _is_repeated_link_list(self, element) -> bool:
+        links = tuple(anchor.get('href') for anchor in element.iter('a'))
+        if len(links) < MIN_REPEATED_LINKS:
+            return False
+        if links in self.seen_link_lists:
+            return True
+        self.seen_link_lists.add(links)
+        return False
+
+    def _render(self, element):
+        tag = element.tag
+        # Comments and processing instructions only contribute their tail
+        if not isinstance(tag, str) or tag in SKIPPED_TAGS or is_hidden(element):
+            return
+        if self.strip_boilerplate and (tag in BOILERPLATE_TAGS or element.get('role') in BOILERPLATE_ROLES):
+            return
+
+        if tag in HEADING_LEVELS:
+            text = self._inline(element)
+            if text:
+                self._block()
+                self.parts.append('#' * HEADING_LEVELS[tag] + ' ' + text)
+                self._block()
+        elif tag == 'a':
+            text = self._inline(element)
+            href = element.get('href')
+            if not text:
+                return
+            if not href or href.startswith(('#', 'javascript:')):
+                self.parts.append(text)
+            else:
+                self.parts.append(f'[{text}]({self.shorten_url(href)})')
+        elif tag == 'img':
+            src = element.get('src') or element.get('data-src') or ''
+            alt = WHITESPACE_PATTERN.sub(' ', element.get('alt') or '').strip()
+            # Images without alt text are decorations or tracking pixels
+            if alt and src and not src.startswith('data:'):
+                self.parts.append(f'![{alt}]({self.shorten_url(src)})')
+            elif alt:
+                self.parts.append(alt)
+        elif tag == 'br':
+            self.parts.append('\n' + self.indent)
+        elif tag == 'hr':
+            self._block()
+            self.parts.append('---')
+            self._block()
+        elif tag in LIST_TAGS:
+            if self.strip_boilerplate and self._is_repeated_link_list(element):
+                return
+            self._block()
+            self.list_counters.append(0 if tag == 'ol' else None)
+            self._children(element)
+            self.list_counters.pop()
+            self._block()
+        elif tag == 'li':
+            counter = self.list_counters[-1] if self.list_counters else None
+            if counter is not None:
+                self.list_counters[-1] = counter = counter + 1
+            self.parts.append('\n' + self.indent + (f'{counter}. ' if counter is not None else '* '))
+            indent = self.indent
+            self.indent += INDENT * 2
+            self._children(element)
+            self.indent = indent
+        elif tag == 'tr':
+            cells = [self._inline(cell) for cell in element if cell.tag in ('td', 'th')]
+            if any(cells):
+                self.parts.append('\n' + self.indent + '| ' + ' | '.join(cells) + ' |')
+        elif tag in BOLD_TAGS:
+            text = self._inline(element)
+            if text:
+                self.parts.append(f'**{text}**')
+        elif tag == 'pre':
+            self._block()
+            self.parts.append('```\n' + element.text_content().strip('\n') + '\n```')
+            self._block()
+        elif tag == 'code':
+            text = self._inline(element)
+            if text:
+                self.parts.append(f'`{text}`')
+        elif tag in BLOCK_TAGS:
+            self._block()
+            self._children(element)
+            self._block()
+        else:
+            self._children(element)
+
+
+def html_to_markdown(element, base_url: str = None, strip_boilerplate: bool = True) -> str:
+    return MarkdownConverter(base_url=base_url, strip_boilerplate=strip_boilerplate).convert(element)
@@ -0,0 +1,35 @@
+import threading
+
+# The OpenAI client is created on first use, importing the utils package does not
+# load the openai SDK or require an API key
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_openai_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            from dotenv import load_dotenv
+            from openai import OpenAI
+            # Load environment variables
+            load_dotenv()
+            _client = OpenAI()
+    return _client
+
+
+def _usage_field(value, name):
+    # The SDK gives usage as a model, fields it does not know yet as dicts
+    return value.get(name) if isinstance(value, dict) else getattr(value, name, None)
+
+
+def read_usage(usage):
+    # Token counts of a response's usage field. cached_tokens are the prompt tokens read
+    # from the provider's prompt cache, 0 when it does not report them.
+    if usage is None:
+        return None
+    details = _usage_field(usage, "prompt_tokens_details")
+    cached_tokens = _usage_field(details, "cached_tokens") if details is not None else None
+    return {"prompt_tokens": _usage_field(usage, "prompt_tokens") or 0,
+            "cached_tokens": cached_tokens or 0,
+            "completion_tokens": _usage_field(usage, "completion_tokens") or 0}
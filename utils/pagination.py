@@ -0,0 +1,205 @@
+import json
+import re
+from urllib.parse import urlsplit, parse_qsl
+from utils.crawl_frontier import canonicalize_url
+
+# Pagination links are found from the link structure of the page. Every anchor is
+# scored on rel="next"/"prev", "next" texts in common languages, page-like query
+# parameters and paths, numbered links forming a sequence and pagination containers.
+# Candidates scoring CONFIDENT_SCORE or more are pagination links. When none does but
+# some come close, GPT is asked to pick among those candidates only.
+
+CONFIDENT_SCORE = 0.5
+CANDIDATE_SCORE = 0.2
+MAX_GPT_CANDIDATES = 15
+CONTAINER_DEPTH = 4
+
+NEXT_TEXTS = frozenset([
+    'next', 'next page', 'more results', 'suivant', 'suivante', 'page suivante', 'siguiente', 'página siguiente',
+    'weiter', 'nächste', 'nächste seite', 'avanti', 'successivo', 'successiva', 'próximo', 'próxima', 'seguinte',
+    'volgende', 'nästa', 'neste', 'næste', 'następna', 'dalej', 'další', 'sonraki', '次へ', '次のページ', '下一页',
+    '下一頁', '다음', 'следующая', 'далее', 'вперед', 'التالي'])
+PREV_TEXTS = frozenset([
+    'prev', 'previous', 'previous page', 'précédent', 'précédente', 'page précédente', 'anterior', 'zurück',
+    'vorherige', 'precedente', 'vorige', 'föregående', 'forrige', 'poprzednia', 'předchozí', 'önceki', '前へ',
+    '上一页', '上一頁', '이전', 'предыдущая', 'назад', 'السابق'])
+NEXT_SYMBOLS = frozenset(['›', '»', '→', '>', '>>', '›››', '»»'])
+PREV_SYMBOLS = frozenset(['‹', '«', '←', '<', '<<'])
+PAGE_PARAM_NAMES = frozenset(['page', 'p', 'pg', 'paged', 'offset', 'start', 'page_number', 'pagenumber', 'pageno'])
+PAGE_PATH_PATTERN = re.compile(r'(?:page[-_/]?|[-_/]oa|/p/?)(\d+)', re.IGNORECASE)
+PAGINATION_CONTAINER_PATTERN = re.compile(r'paginat|pager|paging|page-?nav|pagenav|page-numbers', re.IGNORECASE)
+
+
+class PaginationCandidate:
+    def __init__(self, url, text=''):
+        self.url = url
+        self.text = text
+        self.score = 0.0
+        # "next", "prev" or "page"
+        self.kind = 'page'
+        self.reasons = []
+
+    def add(self, weight, reason):
+        self.score = min(1.0, max(0.0, self.score + weight))
+        self.reasons.append(reason)
+
+    def to_dict(self) -> dict:
+        return {'url': self.url, 'score': round(self.score, 2), 'kind': self.kind, 'text': self.text,
+                'reasons': self.reasons}
+
+
+def anchor_text(element) -> str:
+    # Visible text, or the label of icon-only links
+    text = ' '.join(element.text_content().split()) if element.tag == 'a' else ''
+    return (text or element.get('aria-label') or element.get('title') or '').lower()
+
+
+def page_number(url: str):
+    # Page number or offset carried by a page-like query parameter or path segment
+    parts = urlsplit(url)
+    for name, value in parse_qsl(parts.query):
+        if name.lower() in PAGE_PARAM_NAMES and value.isdigit():
+            return int(value)
+    match = PAGE_PATH_PATTERN.search(parts.path)
+    return int(match.group(1)) if match else None
+
+
+def is_page_url(url: str) -> bool:
+    return page_number(url) is not None
+
+
+def link_direction(text: str, rel):
+    if 'next' in rel:
+        return 'next'
+    if 'prev' in rel or 'previous' in rel:
+        return 'prev'
+    words = re.sub(r'[^\w\s]', '', text).strip()
+    if words in NEXT_TEXTS or text in NEXT_SYMBOLS or words.startswith('next '):
+        return 'next'
+    if words in PREV_TEXTS or text in PREV_SYMBOLS or words.startswith('previous '):
+        return 'prev'
+    return None
+
+
+def in_pagination_container(element) -> bool:
+    for ancestor in [element] + list(element.iterancestors())[:CONTAINER_DEPTH]:
+        label = ' '.join(filter(None, [ancestor.get('class'), ancestor.get('id'), ancestor.get('aria-label'),
+                                       ancestor.get('role')]))
+        if label and PAGINATION_CONTAINER_PATTERN.search(label):
+            return True
+    return False
+
+
+def number_group(element):
+    # Numbered links wrapped one by one in li or span share their grandparent
+    parent = element.getparent()
+    if parent is not None and len(parent) == 1 and parent.getparent() is not None:
+        return parent.getparent()
+    return parent
+
+
+def is_sequence(numbers) -> bool:
+    # At least two distinct numbers, mostly consecutive, gaps for an ellipsis allowed
+    numbers = sorted(set(numbers))
+    if len(numbers) < 2:
+        return False
+    steps = [b - a for a, b in zip(numbers, numbers[1:])]
+    return sum(step == 1 for step in steps) * 2 >= len(steps)
+
+
+def rank_pagination_candidates(document, page_url: str = None):
+    # Scored candidates for the other pages of this result set, the best first
+    base = page_url or document.base_url
+    current = canonicalize_url(base) if base else None
+    current_host = urlsplit(current).netloc if current else None
+    current_number = page_number(current) if current else None
+    if current_number is None:
+        current_number = 1
+
+    scored = []
+    numbered = {}
+    for element in document.tree.getroot().iter('a', 'link'):
+        href = element.get('href')
+        if not href or href.startswith(('#', 'javascript:', 'mailto:', 'tel:')):
+            continue
+        url = canonicalize_url(href, base)
+        if url is None or url == current:
+            continue
+        rel = (element.get('rel') or '').lower().split()
+        if element.tag == 'link' and not ({'next', 'prev', 'previous'} & set(rel)):
+            continue
+        text = anchor_text(element)
+        candidate = PaginationCandidate(url, text[:40])
+        direction = link_direction(text, rel)
+        if 'next' in rel or 'prev' in rel or 'previous' in rel:
+            candidate.add(0.6, 'rel')
+        elif direction:
+            # Bare arrows also page through carousels and calendars
+            candidate.add(0.2 if text in NEXT_SYMBOLS or text in PREV_SYMBOLS else 0.35, f'{direction} text')
+        if direction:
+            candidate.kind = direction
+        number = page_number(url)
+        if number is not None:
+            candidate.add(0.25, 'page url')
+            if direction == 'next' and number > current_number:
+                candidate.add(0.1, 'following page number')
+        if in_pagination_container(element):
+            candidate.add(0.2, 'pagination container')
+        if element.tag == 'a' and text.isdigit() and len(text) <= 4:
+            candidate.add(0.1, 'numbered')
+            numbered.setdefault(number_group(element), []).append((int(text), candidate))
+        if current_host and urlsplit(url).netloc != current_host:
+            candidate.add(-0.3, 'other host')
+        scored.append(candidate)
+
+    # Numbered links of one container forming a sequence are page links
+    for group in numbered.values():
+        if is_sequence([number for number, _ in group]):
+            for _, candidate in group:
+                candidate.add(0.2, 'number sequence')
+
+    # A page linked several times keeps its best scoring link
+    candidates = {}
+    for candidate in scored:
+        existing = candidates.get(candidate.url)
+        if existing is None or candidate.score > existing.score:
+            candidates[candidate.url] = candidate
+
+    return sorted((candidate for candidate in candidates.values() if candidate.score >= CANDIDATE_SCORE),
+                  key=lambda candidate: (-candidate.score, candidate.kind != 'next'))
+
+
+def order_links(candidates):
+    # Next page links first, then the others by score, previous page links last
+    order = {'next': 0, 'page': 1, 'prev': 2}
+    return [candidate.url for candidate in sorted(candidates, key=lambda candidate: order[candidate.kind])]
+
+
+def find_pagination_links(document, page_url: str = None):
+    # Canonical URLs of the candidates confidently recognized as pagination links
+    return order_links([candidate for candidate in rank_pagination_candidates(document, page_url)
+                        if candidate.score >= CONFIDENT_SCORE])
+
+
+def choose_pagination_links_with_gpt(candidates):
+    # Ambiguous pages only send GPT the few candidate links, never the page itself
+    from utils.get_gpt_response_json import get_gpt_response_json
+    from utils.prompts import SYSTEM_PROMPT_FOR_PAGINATION_CANDIDATES, PAGINATION_CANDIDATES_TEMPLATE
+    candidates = candidates[:MAX_GPT_CANDIDATES]
+    listing = json.dumps([{'id': index, 'text': candidate.text, 'url': candidate.url}
+                          for index, candidate in enumerate(candidates)], ensure_ascii=False)
+    answer = get_gpt_response_json(user_request=PAGINATION_CANDIDATES_TEMPLATE.render(CANDIDATES=listing),
+                                   system_prompt=SYSTEM_PROMPT_FOR_PAGINATION_CANDIDATES)
+    chosen = []
+    for index in (answer or {}).get('pagination_links') or []:
+        if isinstance(index, int) and 0 <= index < len(candidates) and candidates[index] not in chosen:
+            chosen.append(candidates[index])
+    return order_links(chosen)
+
+
+def discover_pagination_links(document, page_url: str = None, use_gpt_fallback: bool = True):
+    candidates = rank_pagination_candidates(document, page_url)
+    confident = [candidate for candidate in candidates if candidate.score >= CONFIDENT_SCORE]
+    if confident or not candidates or not use_gpt_fallback:
+        return order_links(confident)
+    return choose_pagination_links_with_gpt(candidates)
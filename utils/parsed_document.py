@@ -0,0 +1,149 @@
+import copy
+import lxml.html
+from lxml import etree
+
+# Define the tags to decompose as a constant at the module level
+TAGS_TO_DECOMPOSE = ['script', 'style', 'meta', 'comment', 'head', 'footer', 'nav', 'form', 'noscript']
+
+# Tags whose strings BeautifulSoup leaves out of get_text()
+NON_TEXT_TAGS = frozenset(['script', 'style', 'template'])
+
+EMPTY_DOCUMENT = "<html><body></body></html>"
+
+
+def parse_html(html_content):
+    # Parse raw HTML (str or bytes) into an lxml tree rooted at <html>
+    if not html_content or not html_content.strip():
+        html_content = EMPTY_DOCUMENT
+    try:
+        root = lxml.html.document_fromstring(html_content)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        root = lxml.html.document_fromstring(html_content.encode('utf-8'))
+    except etree.ParserError:
+        root = lxml.html.document_fromstring(EMPTY_DOCUMENT)
+    return etree.ElementTree(root)
+
+
+def element_text(element) -> str:
+    # Equivalent of BeautifulSoup's tag.get_text(strip=True) for an lxml element
+    if element.tag in NON_TEXT_TAGS:
+        return (element.text or '').strip()
+    parts = []
+    # The stack holds nodes still to visit and tail strings still to emit, children
+    # are pushed in reverse so they pop in document order. Comments contribute
+    # their tail but not their text.
+    stack = [element]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            parts.append(node)
+            continue
+        if not isinstance(node.tag, str) or (node.tag in NON_TEXT_TAGS and node is not element):
+            continue
+        if node.text:
+            parts.append(node.text.strip())
+        for child in reversed(node):
+            if child.tail:
+                stack.append(child.tail.strip())
+            stack.append(child)
+    return ''.join(parts)
+
+
+def get_text_prefixes(elements, limit: int):
+    # Return element_text(element)[:limit] for every element of a subtree listed in
+    # document order, in one pass from the leaves up. Each element only joins the
+    # prefixes of its children, so no subtree is walked twice and the work per node
+    # stays bounded by limit. Children left out of the list, like skipped records,
+    # have their text computed directly.
+    index_of = {element: index for index, element in enumerate(elements)}
+    texts = [''] * len(elements)
+    for index in range(len(elements) - 1, -1, -1):
+        element = elements[index]
+        if element.tag in NON_TEXT_TAGS:
+            text = element_text(element)
+        else:
+            parts = [(element.text or '').strip()]
+            for child in element:
+                child_index = index_of.get(child)
+                if isinstance(child.tag, str) and child.tag not in NON_TEXT_TAGS:
+                    parts.append(texts[child_index] if child_index is not None else element_text(child)[:limit])
+                if child.tail:
+                    parts.append(child.tail.strip())
+            text = ''.join(parts)
+        texts[index] = text[:limit]
+    return texts
+
+
+class ParsedDocument:
+    # A page parsed exactly once. The lxml tree is built eagerly, every other view
+    # (cleaned body, serialized HTML, text) is derived from it on first access.
+
+    def __init__(self, html_content, base_url=None):
+        self.raw_html = html_content
+        self.base_url = base_url
+        self.tree = parse_html(html_content)
+        self._cleaned_tree = None
+        self._text = None
+        # Tag, id and class index built by utils.selector_engine on first use
+        self.selector_index = None
+
+    @classmethod
+    def from_content(cls, content, base_url=None):
+        # Accept a ParsedDocument, a BeautifulSoup tag or raw HTML
+        if isinstance(content, cls):
+            return content
+        if content is not None and not isinstance(content, (str, bytes)):
+            content = str(content)
+        return cls(content or "", base_url=base_url)
+
+    @property
+    def root(self):
+        return self.tree.getroot()
+
+    @property
+    def original_body(self):
+        # The unmodified <body> of the page, or the root if there is none
+        body = self.root.find('body')
+        return body if body is not None else self.root
+
+    @property
+    def cleaned_tree(self):
+        # A bare <html> holding a copy of the body with TAGS_TO_DECOMPOSE removed.
+        # The original tree stays intact for selectors that target the full page.
+        if self._cleaned_tree is None:
+            body = self.root.find('body')
+            if body is not None:
+                cleaned_root = lxml.html.Element('html')
+                cleaned_root.append(copy.deepcopy(body))
+            else:
+                cleaned_root = copy.deepcopy(self.root)
+            for element in list(cleaned_root.iter(*TAGS_TO_DECOMPOSE)):
+                if element is not cleaned_root:
+                    element.drop_tree()
+            self._cleaned_tree = etree.ElementTree(cleaned_root)
+        return self._cleaned_tree
+
+    @property
+    def body(self):
+        root = self.cleaned_tree.getroot()
+        body = root.find('body')
+        return body if body is not None else root
+
+    @property
+    def body_html(self) -> str:
+        return etree.tostring(self.body, encoding='unicode', method='html', with_tail=False)
+
+    @property
+    def html(self) -> str:
+        # Serialized original body, what str(soup.body) used to give
+        return etree.tostring(self.original_body, encoding='unicode', method='html', with_tail=False)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = ' '.join(self.body.text_content().split())
+        return self._text
+
+    def __str__(self):
+        return self.html
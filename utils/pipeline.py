@@ -0,0 +1,77 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class StageTiming:
+    def __init__(self, name, started_at, finished_at):
+        self.name = name
+        self.started_at = started_at
+        self.finished_at = finished_at
+
+    @property
+    def duration(self) -> float:
+        return self.finished_at - self.started_at
+
+    def as_dict(self) -> dict:
+        return {"stage": self.name, "start (s)": round(self.started_at, 3),
+                "end (s)": round(self.finished_at, 3), "duration (s)": round(self.duration, 3)}
+
+
+class StagePipeline:
+    # A small dependency graph of stages run on a thread pool.
+    # Each stage is called with the results of its dependencies as keyword arguments
+    # and starts as soon as all of them have finished, so independent stages overlap.
+
+    def __init__(self, max_workers: int = 4, wrap_stage=None):
+        self.max_workers = max_workers
+        # Optional hook applied to every stage function before it is submitted,
+        # e.g. to attach a Streamlit script context to the worker thread
+        self.wrap_stage = wrap_stage
+        self.stages = {}
+        self.results = {}
+        self.timings = {}
+        self.total_time = 0.0
+
+    def add_stage(self, name: str, func, dependencies=()):
+        for dependency in dependencies:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage '{name}' depends on unknown stage '{dependency}'")
+        self.stages[name] = (func, tuple(dependencies))
+        return self
+
+    def _run_stage(self, name, func, kwargs, origin):
+        started_at = time.perf_counter() - origin
+        try:
+            return func(**kwargs)
+        finally:
+            self.timings[name] = StageTiming(name, started_at, time.perf_counter() - origin)
+
+    def run(self) -> dict:
+        origin = time.perf_counter()
+        pending = dict(self.stages)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                # Submit every stage whose dependencies are all done
+                for name, (func, dependencies) in list(pending.items()):
+                    if all(dependency in self.results for dependency in dependencies):
+                        kwargs = {dependency: self.results[dependency] for dependency in dependencies}
+                        stage_func = self.wrap_stage(func) if self.wrap_stage else func
+                        running[executor.submit(self._run_stage, name, stage_func, kwargs, origin)] = name
+                        del pending[name]
+                if not running:
+                    raise ValueError(f"Stages with unresolvable dependencies: {', '.join(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        self.results[name] = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+        self.total_time = time.perf_counter() - origin
+        return self.results
+
+    def timing_report(self) -> list:
+        return [timing.as_dict() for timing in sorted(self.timings.values(), key=lambda t: t.started_at)]
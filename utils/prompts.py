@@ -1,3 +1,133 @@
+import re
+import threading
+from collections import OrderedDict
+
+# Prompts are templates with <<NAME>> placeholders. Each one is parsed once into static
+# segments and placeholders by PromptTemplate, render() fills all placeholders in a single
+# join. Values are inserted as they are, a placeholder-like string inside page content is
+# never substituted. Token counts of the static segments are cached per template and
+# those of recent values (a page sent in several calls) are cached per process.
+
+PLACEHOLDER_PATTERN = re.compile(r'<<([A-Z_]+)>>')
+# Characters on each side of a segment boundary re-encoded to account for tokens
+# merging across it
+BOUNDARY_WINDOW = 256
+VALUE_TOKEN_CACHE_SIZE = 32
+# Chat formatting tokens around every message and before the reply (gpt-3.5 and gpt-4)
+CHAT_TOKENS_PER_MESSAGE = 3
+CHAT_REPLY_TOKENS = 3
+
+# The provider caches the prompts it is sent and serves a later prompt's longest
+# previously seen prefix from that cache, once the prefix is at least
+# PROMPT_CACHE_MIN_TOKENS long, at CACHED_PROMPT_PRICE_RATIO of the usual price and
+# faster. Requests about a page therefore start with the same system prompt and the
+# page's content, byte for byte, and give their task only after it: the calls made on
+# one page, and the same calls with other instructions, share that prefix.
+PROMPT_CACHE_MIN_TOKENS = 1024
+CACHED_PROMPT_PRICE_RATIO = 0.5
+
+_value_tokens = OrderedDict()
+_value_tokens_lock = threading.Lock()
+
+
+def count_value_tokens(value: str) -> int:
+    from utils.ensure_limit import count_tokens
+    with _value_tokens_lock:
+        if value in _value_tokens:
+            _value_tokens.move_to_end(value)
+            return _value_tokens[value]
+    tokens = count_tokens(value)
+    with _value_tokens_lock:
+        _value_tokens[value] = tokens
+        while len(_value_tokens) > VALUE_TOKEN_CACHE_SIZE:
+            _value_tokens.popitem(last=False)
+    return tokens
+
+
+class PromptTemplate:
+    def __init__(self, text: str):
+        self.text = text
+        parts = PLACEHOLDER_PATTERN.split(text)
+        # Static text at even positions, placeholder names at odd positions
+        self.static_segments = parts[0::2]
+        self.placeholders = parts[1::2]
+        self._static_tokens = None
+
+    def _values(self, values):
+        missing = [name for name in self.placeholders if name not in values]
+        unknown = [name for name in values if name not in self.placeholders]
+        if missing or unknown:
+            raise KeyError(f"Prompt values missing: {missing}, unknown: {unknown}")
+        return [str(values[name]) for name in self.placeholders]
+
+    def _segments(self, values):
+        segments = [self.static_segments[0]]
+        for value, static in zip(self._values(values), self.static_segments[1:]):
+            segments.append(value)
+            segments.append(static)
+        return segments
+
+    def render(self, **values) -> str:
+        return ''.join(self._segments(values))
+
+    @property
+    def static_tokens(self):
+        # Token count of every static segment on its own, computed once
+        if self._static_tokens is None:
+            from utils.ensure_limit import count_tokens
+            self._static_tokens = [count_tokens(segment) for segment in self.static_segments]
+        return self._static_tokens
+
+    def segment_tokens(self, **values):
+        # [(placeholder name or None for static text, tokens)] in prompt order
+        tokens = [(None, self.static_tokens[0])]
+        for name, value, static_tokens in zip(self.placeholders, self._values(values), self.static_tokens[1:]):
+            tokens.append((name, count_value_tokens(value)))
+            tokens.append((None, static_tokens))
+        return tokens
+
+    def count_tokens(self, **values) -> int:
+        # Exact token count of the rendered prompt. The segments are counted separately and
+        # each boundary is corrected by re-encoding the text around it, where tokens of two
+        # neighbouring segments can merge.
+        from utils.ensure_limit import count_tokens
+        segments = self._segments(values)
+        total = sum(tokens for _, tokens in self.segment_tokens(**values))
+        for left, right in zip(segments, segments[1:]):
+            if left and right:
+                left_tail, right_head = left[-BOUNDARY_WINDOW:], right[:BOUNDARY_WINDOW]
+                total += count_tokens(left_tail + right_head) - count_tokens(left_tail) - count_tokens(right_head)
+        return total
+
+
+def build_messages(system_prompt: str, user_request: str, page_content: str = None):
+    # Chat messages of a request, with page_content the page comes first as the prefix
+    # shared by every request about it
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_request}]
+    if page_content is None:
+        return messages
+    return [{"role": "system", "content": SYSTEM_PROMPT_FOR_PAGE_CONTENT},
+            {"role": "user", "content": PAGE_CONTENT_TEMPLATE.render(SCRAPED_CONTENT=page_content)}] + messages
+
+
+def count_chat_prompt_tokens(system_prompt: str, template: PromptTemplate, page_content: str = None, **values) -> int:
+    # Prompt tokens of a system prompt plus a rendered user request, after the page
+    # prefix when page_content is given, as the API bills them
+    tokens = (count_value_tokens(system_prompt) + template.count_tokens(**values)
+              + 2 * CHAT_TOKENS_PER_MESSAGE + CHAT_REPLY_TOKENS)
+    if page_content is not None:
+        tokens += (count_value_tokens(SYSTEM_PROMPT_FOR_PAGE_CONTENT)
+                   + PAGE_CONTENT_TEMPLATE.count_tokens(SCRAPED_CONTENT=page_content) + 2 * CHAT_TOKENS_PER_MESSAGE)
+    return tokens
+
+
+def shares_page_prefix(page_tokens: int, sample_tokens: int) -> bool:
+    # Whether a call that could read a smaller sample of the page (e.g. the collapsed
+    # page) is better sent the whole page, whose prefix a following call on the page then
+    # reads from the provider's cache: page + cached page costs less than sample + page
+    return page_tokens >= PROMPT_CACHE_MIN_TOKENS and page_tokens * CACHED_PROMPT_PRICE_RATIO < sample_tokens
+
+
 SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA = """
 You're a helpful assistant tasked with converting user requests into a JSON schema (https://json-schema.org/). JSON Schema ensures consistency, validity, and interoperability of JSON data at scale. Exclude the '$schema' key from your response and always include the 'description' key where applicable. Ensure the provided JSON schema is valid. If the user request includes additional demands like 'scrape all products with title and price from the first two pages,' only consider the original request i.e. a list of products with title and price, since other information cannot be expressed in the JSON schema. Respond in JSON format exclusively, with no additional text before or after it.
 """
@@ -29,6 +159,40 @@ SCRAPED CONTENT:
 <<SCRAPED_CONTENT>>
 """
 
+# Layout with the page first, see build_messages. The page prefix is the same for every
+# task, the task specific system prompt and request follow it.
+SYSTEM_PROMPT_FOR_PAGE_CONTENT = """
+You're a helpful assistant working with the content of a webpage, scraped and converted to markdown. The content comes first, the task to carry out on it follows. Respond in JSON format exclusively, with no additional text before or after it.
+"""
+
+USER_REQUEST_FOR_PAGE_CONTENT = """
+SCRAPED CONTENT:
+<<SCRAPED_CONTENT>>
+"""
+
+USER_REQUEST_FOR_JSON_SCHEMA_OF_PAGE = """
+USER REQUEST:
+<<INSTRUCTION>>
+"""
+
+USER_REQUEST_FOR_STRUCTURED_CONTENT_OF_PAGE = """
+USER REQUEST:
+<<INSTRUCTION>>
+
+JSON SCHEMA:
+<<JSON_SCHEMA>>
+"""
+
+# Schema generation and extraction in a single call, the answer holds both
+SYSTEM_PROMPT_FOR_SCHEMA_AND_DATA = """
+You're a helpful assistant responsible for extracting required information from given webpage content. First write a JSON schema (https://json-schema.org/) for the information the user requests, exclude the '$schema' key and always include the 'description' key where applicable. If the user request includes additional demands like 'scrape all products with title and price from the first two pages,' only consider the original request i.e. a list of products with title and price. Then extract that information from the webpage content following your JSON schema. Respond exclusively in JSON format, with no additional text before or after it, with an object holding the JSON schema under the key "json_schema" followed by the extracted information, valid against that schema, under the key "data".
+"""
+
+USER_REQUEST_FOR_SCHEMA_AND_DATA = """
+USER REQUEST:
+<<INSTRUCTION>>
+"""
+
 # SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_SELECTORS="""
 # You're a proficient assistant skilled in identifying the correct CSS selectors for content specified by the user. The keys represent selectors in the HTML of the page, and a snippet containing the first 70 characters of content of that particular element is its value.
 
@@ -71,9 +235,18 @@ Your task involves examining the body content of an HTML page presented in markd
 Your responsibility is to scrutinize the given HTML content and determine if similar pagination exists. If so, your output should consist of a JSON object mapping the page number to its corresponding URL. In the absence of additional pages, the output should be a null JSON object."""
 
 USER_REQUEST_FOR_PAGINATION_LINKS = """
-MARDOWN CONTENT:
+MARKDOWN CONTENT:
 <<MARKDOWN_CONTENT>>"""
 
+SYSTEM_PROMPT_FOR_PAGINATION_CANDIDATES = """
+You're given a list of links found on a web page listing results, each with an id, its text and its URL. Decide which of them lead to other pages of the same list of results (next, previous or numbered result pages). Links to single items, filters, sorting options, carousels, calendars or other sections are not pagination links.
+
+Respond strictly in JSON format: {"pagination_links": [ids of the pagination links]}. Use an empty list when none of them is a pagination link."""
+
+USER_REQUEST_FOR_PAGINATION_CANDIDATES = """
+CANDIDATE LINKS:
+<<CANDIDATES>>"""
+
 SYSTEM_PROMPT_FOR_GETTING_THE_DESIRED_XPATHS = """
 You're a proficient assistant skilled in identifying the correct XPaths for content specified by the user. The user is looking for a JSON where keys are human-readable labels for the content they wish to extract from a webpage, and the values are the most relevant XPaths that can be used to retrieve that content.
 
@@ -145,4 +318,20 @@ The user requests the retrieval of specific information from the provided HTML c
 USER_REQUEST_FOR_ENHANCING_THE_INSTRUCTIONS="""
 RAW INSTRUCTIONS:
 <<INSTRUCTION>>
-"""
\ No newline at end of file
+"""
+
+# Templates of the user requests, parsed once
+JSON_SCHEMA_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_JSON_SCHEMA)
+STRUCTURED_CONTENT_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_STRUCTURED_CONTENT)
+PAGE_CONTENT_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_PAGE_CONTENT)
+JSON_SCHEMA_OF_PAGE_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_JSON_SCHEMA_OF_PAGE)
+STRUCTURED_CONTENT_OF_PAGE_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_STRUCTURED_CONTENT_OF_PAGE)
+SCHEMA_AND_DATA_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_SCHEMA_AND_DATA)
+DESIRED_SELECTORS_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_GETTING_THE_DESIRED_SELECTORS)
+ENHANCING_SELECTORS_CONTENT_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_SELECTORS_CONTENT)
+PAGINATION_LINKS_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_PAGINATION_LINKS)
+PAGINATION_CANDIDATES_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_PAGINATION_CANDIDATES)
+DESIRED_XPATHS_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_GETTING_THE_DESIRED_XPATHS)
+ENHANCING_XPATHS_CONTENT_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_ENHANCING_THE_SCRAPPED_XPATHS_CONTENT)
+SELECTING_APPROACH_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_SELECTING_APPROACH_DYNAMICALLY)
+ENHANCING_INSTRUCTIONS_TEMPLATE = PromptTemplate(USER_REQUEST_FOR_ENHANCING_THE_INSTRUCTIONS)
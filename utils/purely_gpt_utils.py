@@ -1,49 +1,180 @@
-import streamlit as st
-from bs4 import BeautifulSoup
-import html2text
+from utils.reporting import get_sink
+from utils.parsed_document import ParsedDocument
 from utils.ensure_limit import reduce_string_to_token_limit
-from utils.prompts import (USER_REQUEST_FOR_JSON_SCHEMA, SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA, USER_REQUEST_FOR_STRUCTURED_CONTENT, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)
-from utils.get_gpt_response_json import get_gpt_response_json
+from utils.prompts import (JSON_SCHEMA_OF_PAGE_TEMPLATE, SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA,
+                           STRUCTURED_CONTENT_OF_PAGE_TEMPLATE, SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA,
+                           SCHEMA_AND_DATA_TEMPLATE, SYSTEM_PROMPT_FOR_SCHEMA_AND_DATA,
+                           count_chat_prompt_tokens, count_value_tokens, shares_page_prefix)
+from utils.get_gpt_response_json import get_gpt_response_json, stream_gpt_response_json
+from utils.streaming_json import iter_records
+from utils.chunked_extraction import extract_in_chunks, DEFAULT_CHUNK_TOKENS, SCHEMA_SAMPLE_TOKENS, SINGLE_CALL_TOKEN_LIMIT
+from utils.record_detection import collapse_records as collapse_record_groups
+from utils.markdown_converter import html_to_markdown
+from utils.template_store import get_stored_schema, update_stored_schema
 
-# @st.cache_data
-def scrape_and_convert(html_content, base_url=None):
+def scrape_and_convert(html_content, base_url=None, collapse_records=False):
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
-        # Extract content within the <body> tag
-        body_content = soup.body if soup.body else soup
-        markdown_content = html2text.html2text(str(body_content), baseurl=base_url)
+        # Accepts raw HTML or an already parsed document
+        document = ParsedDocument.from_content(html_content, base_url=base_url)
+        # Convert the content within the <body> tag straight from the parsed tree, with
+        # collapse_records every list of repeated records is reduced to one exemplar and
+        # a note with their number
+        body = collapse_record_groups(document.original_body) if collapse_records else document.original_body
+        markdown_content = html_to_markdown(body, base_url=base_url or document.base_url)
         return markdown_content
     except Exception as e:
-        st.error(f"Error during HTML to Markdown conversion: {str(e)}")
+        get_sink().error(f"Error during HTML to Markdown conversion: {str(e)}")
         return ""
 
-def process_using_approach_1(raw_html_content, instruction, base_url=None):
-    try:
-        # Scrape and convert HTML to Markdown
-        markdown_content = scrape_and_convert(html_content=raw_html_content, base_url=base_url)
-        with st.expander(label="Scraped Raw Markdown Content"):
-            st.markdown(markdown_content)
+def report_result(on_result, label, value):
+    if on_result:
+        on_result(label, value)
+
+def report_usage(on_result, label):
+    # on_usage callback passing the token counts of a GPT call on as the result label
+    return lambda usage: report_result(on_result, label, usage)
+
+def extract_schema_and_data(markdown_content, instruction, on_record=None, on_usage=None):
+    # Generate the JSON schema and extract the page with it in one call, return
+    # (json_schema, extracted_content, stream). With on_record the answer is streamed and
+    # the records of the extracted content are passed on as they arrive, stream is
+    # None otherwise.
+    user_request = SCHEMA_AND_DATA_TEMPLATE.render(INSTRUCTION=instruction)
+    stream = None
+    if on_record:
+        def on_data_record(path, record):
+            # Lists inside the schema, e.g. "required", are not records
+            if path[:1] == ("json_schema",):
+                return None
+            return on_record(path[1:] if path[:1] == ("data",) else path, record)
 
+        answer, stream = stream_gpt_response_json(
+            user_request=user_request, system_prompt=SYSTEM_PROMPT_FOR_SCHEMA_AND_DATA, on_record=on_data_record,
+            page_content=markdown_content, raise_errors=True)
+        if stream.usage and on_usage:
+            on_usage(stream.usage)
+    else:
+        answer = get_gpt_response_json(user_request=user_request, system_prompt=SYSTEM_PROMPT_FOR_SCHEMA_AND_DATA,
+                                       page_content=markdown_content, on_usage=on_usage, raise_errors=True)
+    answer = answer or {}
+    json_schema = answer.get("json_schema") or {}
+    if isinstance(answer.get("data"), dict):
+        return json_schema, answer["data"], stream
+    # An answer without the "data" wrapper holds the records next to the schema
+    return json_schema, {key: value for key, value in answer.items() if key != "json_schema"}, stream
+
+def extract_using_approach_1(raw_html_content, instruction, base_url=None, on_result=None, chunked=None,
+                             chunk_tokens=DEFAULT_CHUNK_TOKENS, on_record=None, cpu_pool=None,
+                             single_call=True, use_schema_cache=True):
+    # Purely GPT extraction without any UI, intermediate results are passed to on_result(label, value).
+    # Pages too long for one call are extracted in chunks, chunked=True always does and
+    # chunked=False truncates the page to a single call instead.
+    # With on_record the answer is streamed and every record is passed to on_record(path, record)
+    # as it arrives, on_record returning False stops the extraction with the records so far.
+    # With a cpu_pool (utils.cpu_pool.CPUPool) the page is converted in a worker process.
+    # The JSON schema generated for the first page of a domain is stored per instruction
+    # and later pages of the domain are extracted with it in one call. Otherwise pages
+    # that fit a single call have the schema generated and the records extracted in the
+    # same call, single_call=False generates the schema in a call of its own first.
+    # Calls send the page ahead of their task, so the extraction call reads the page the
+    # schema call sent from the provider's prompt cache when both read the same page.
+    # The token counts of every call are passed on as "... Call Usage" results.
+    # A failed GPT call raises, process_using_approach_1 reports it to the sink.
+    # Scrape and convert HTML to Markdown
+    if cpu_pool is not None:
+        raw_html = raw_html_content.raw_html if isinstance(raw_html_content, ParsedDocument) else raw_html_content
+        markdown_content = cpu_pool.markdown(raw_html, base_url=base_url, collapsed=False)["markdown"]
+    else:
+        document = ParsedDocument.from_content(raw_html_content, base_url=base_url)
+        markdown_content = scrape_and_convert(html_content=document, base_url=base_url)
+    report_result(on_result, "Scraped Raw Markdown Content", markdown_content)
+    if chunked is None:
+        chunked = count_value_tokens(markdown_content) > SINGLE_CALL_TOKEN_LIMIT
+    if not chunked:
         # Reduce content to fit token limit if necessary
-        markdown_content = reduce_string_to_token_limit(markdown_content)
+        markdown_content = reduce_string_to_token_limit(markdown_content, token_limit=SINGLE_CALL_TOKEN_LIMIT)
+
+    schema_key, stored_schema = get_stored_schema(base_url, instruction, use_templates=use_schema_cache)
+    if stored_schema is not None:
+        json_schema = stored_schema.selectors
+        report_result(on_result, "JSON Schema", json_schema)
+        report_result(on_result, "JSON Schema From Cache", True)
+    elif single_call and not chunked:
+        report_result(on_result, "Extraction Prompt Tokens", count_chat_prompt_tokens(
+            SYSTEM_PROMPT_FOR_SCHEMA_AND_DATA, SCHEMA_AND_DATA_TEMPLATE, page_content=markdown_content,
+            INSTRUCTION=instruction))
+        json_schema, extracted_structured_content, stream = extract_schema_and_data(
+            markdown_content, instruction, on_record=on_record, on_usage=report_usage(on_result, "Extraction Call Usage"))
+        report_result(on_result, "JSON Schema", json_schema)
+        if stream is not None:
+            report_result(on_result, "Time to First Record (s)", stream.time_to_first_record)
+        report_result(on_result, "Extracted Structured Content", extracted_structured_content)
+        # A cancelled answer may end inside the schema
+        if stream is None or stream.complete:
+            update_stored_schema(schema_key, None, json_schema, extracted_structured_content, url=base_url)
+        return extracted_structured_content
+    else:
+        # The schema only needs the shape of the records, so it is generated from the page
+        # with one exemplar of each list of repeated records
+        if cpu_pool is not None:
+            collapsed_markdown = cpu_pool.run(scrape_and_convert, raw_html, base_url, True)
+        else:
+            collapsed_markdown = scrape_and_convert(html_content=document, base_url=base_url, collapse_records=True)
+        schema_content = reduce_string_to_token_limit(
+            collapsed_markdown, token_limit=SCHEMA_SAMPLE_TOKENS if chunked else SINGLE_CALL_TOKEN_LIMIT)
+        # Unless collapsing saves less than the prompt cache does, then the schema call
+        # reads the full page and the extraction call finds it in the cache
+        if not chunked and shares_page_prefix(count_value_tokens(markdown_content), count_value_tokens(schema_content)):
+            schema_content = markdown_content
 
         # Generate JSON schema based on user instruction
-        user_request_json_schema = USER_REQUEST_FOR_JSON_SCHEMA.replace(
-            "<<INSTRUCTION>>", instruction).replace("<<SCRAPED_CONTENT>>", markdown_content)
         json_schema = get_gpt_response_json(
-            user_request=user_request_json_schema, system_prompt=SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA)
+            user_request=JSON_SCHEMA_OF_PAGE_TEMPLATE.render(INSTRUCTION=instruction),
+            system_prompt=SYSTEM_PROMPT_FOR_GETTING_JSON_SCHEMA, page_content=schema_content,
+            on_usage=report_usage(on_result, "Schema Call Usage"), raise_errors=True)
+        report_result(on_result, "JSON Schema", json_schema)
 
-        with st.expander(label="JSON Schema"):
-            st.json(json_schema)
+    if chunked:
+        # Every chunk is extracted concurrently with the same schema and the records merged
+        extracted_structured_content = extract_in_chunks(markdown_content, instruction, json_schema, chunk_tokens,
+                                                         on_usage=report_usage(on_result, "Chunk Call Usage"))
+        if on_record:
+            # Chunks are merged before any record is final, so records are passed on afterwards
+            for path, record in iter_records(extracted_structured_content):
+                if on_record(path, record) is False:
+                    break
+        report_result(on_result, "Extracted Structured Content", extracted_structured_content)
+        update_stored_schema(schema_key, stored_schema, json_schema, extracted_structured_content, url=base_url)
+        return extracted_structured_content
 
-        # Extract structured content based on JSON schema
-        user_request_for_structured_content = USER_REQUEST_FOR_STRUCTURED_CONTENT.replace(
-            "<<JSON_SCHEMA>>", str(json_schema)).replace("<<INSTRUCTION>>", instruction).replace("<<SCRAPED_CONTENT>>", markdown_content)
+    # Extract structured content based on JSON schema
+    prompt_values = dict(INSTRUCTION=instruction, JSON_SCHEMA=str(json_schema))
+    user_request_for_structured_content = STRUCTURED_CONTENT_OF_PAGE_TEMPLATE.render(**prompt_values)
+    report_result(on_result, "Extraction Prompt Tokens", count_chat_prompt_tokens(
+        SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA, STRUCTURED_CONTENT_OF_PAGE_TEMPLATE,
+        page_content=markdown_content, **prompt_values))
+    if on_record:
+        extracted_structured_content, stream = stream_gpt_response_json(
+            user_request=user_request_for_structured_content, system_prompt=SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA,
+            on_record=on_record, page_content=markdown_content, raise_errors=True)
+        report_result(on_result, "Time to First Record (s)", stream.time_to_first_record)
+        if stream.usage:
+            report_result(on_result, "Extraction Call Usage", stream.usage)
+    else:
         extracted_structured_content = get_gpt_response_json(
-            user_request=user_request_for_structured_content, system_prompt=SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA)
+            user_request=user_request_for_structured_content, system_prompt=SYSTEM_PROMPT_FOR_DATA_EXTRACTION_ACCORDING_TO_THE_JSON_SCHEMA,
+            page_content=markdown_content, on_usage=report_usage(on_result, "Extraction Call Usage"),
+            raise_errors=True)
+    report_result(on_result, "Extracted Structured Content", extracted_structured_content)
+    update_stored_schema(schema_key, stored_schema, json_schema, extracted_structured_content, url=base_url)
 
-        with st.expander(label="Extracted Structured Content"):
-            st.json(extracted_structured_content)
+    return extracted_structured_content
 
+def process_using_approach_1(raw_html_content, instruction, base_url=None, chunked=None, on_record=None):
+    # Same as extract_using_approach_1 but reports every step and error to the installed sink
+    sink = get_sink()
+    try:
+        return extract_using_approach_1(raw_html_content, instruction, base_url=base_url,
+                                        on_result=sink.result, chunked=chunked, on_record=on_record)
     except Exception as e:
-        st.error(f"An unexpected error occurred: {str(e)}")
\ No newline at end of file
+        sink.error(f"An unexpected error occurred: {str(e)}")
@@ -0,0 +1,122 @@
+import copy
+import re
+from lxml import etree
+from utils.content_node import escape_css_identifier
+
+# Listing pages repeat the same card for every product, book or hotel. Siblings are
+# grouped by a structural hash of their tag.class label and the tag paths below them,
+# so cards with other texts, ids or ratings still match while a different widget does
+# not. Prompts then show one exemplar of each group with a count, and the selectors
+# generated from it run on every instance.
+
+# Siblings needed before a group counts as a list of records
+MIN_RECORD_REPEATS = 3
+# Elements a subtree needs, so runs of plain <li> or <br> are not treated as records
+MIN_RECORD_SIZE = 4
+# Levels of tag paths below an element that make up its shape
+SHAPE_DEPTH = 3
+
+DIGITS_PATTERN = re.compile(r'\d+')
+
+
+def get_structure_label(element) -> str:
+    classes = (element.get('class') or '').split()
+    if not classes:
+        return element.tag
+    return element.tag + '.' + '.'.join(sorted(DIGITS_PATTERN.sub('0', c) for c in classes))
+
+
+class RecordGroup:
+    def __init__(self, parent, elements, exemplar):
+        self.parent = parent
+        self.elements = elements
+        self.exemplar = exemplar
+
+    @property
+    def count(self) -> int:
+        return len(self.elements)
+
+
+class RecordIndex:
+    # Record groups of a subtree. exemplar_counts maps the exemplar of every group to
+    # the number of records, skipped holds the other instances.
+    def __init__(self, groups):
+        self.groups = groups
+        self.exemplar_counts = {group.exemplar: group.count for group in groups}
+        self.skipped = set()
+        for group in groups:
+            self.skipped.update(e for e in group.elements if e is not group.exemplar)
+
+    def __bool__(self):
+        return bool(self.groups)
+
+
+def detect_record_groups(root, min_repeats: int = MIN_RECORD_REPEATS, min_size: int = MIN_RECORD_SIZE) -> RecordIndex:
+    # One pass down to list the elements, one pass up to collect the tag paths below
+    # each element. Classes below the record itself are left out, they often carry
+    # per record states like "star-rating Three".
+    elements = [e for e in root.iter() if isinstance(e.tag, str)]
+    paths = {}
+    shapes = {}
+    sizes = {}
+    for element in reversed(elements):
+        children = [child for child in element if isinstance(child.tag, str)]
+        below = set()
+        for child in children:
+            below.update(path for path in paths[child] if path.count('/') < SHAPE_DEPTH - 1)
+        paths[element] = {element.tag} | {element.tag + '/' + path for path in below}
+        shapes[element] = hash((get_structure_label(element), frozenset(paths[element])))
+        sizes[element] = 1 + sum(sizes[c] for c in children)
+    del paths
+
+    groups = []
+    for parent in elements:
+        buckets = {}
+        for child in parent:
+            if isinstance(child.tag, str) and sizes[child] >= min_size:
+                buckets.setdefault(shapes[child], []).append(child)
+        for instances in buckets.values():
+            if len(instances) >= min_repeats:
+                # The most complete instance shows every field the records can have
+                exemplar = max(instances, key=sizes.__getitem__)
+                groups.append(RecordGroup(parent, instances, exemplar))
+    return RecordIndex(groups)
+
+
+def get_record_key(element):
+    # Selector key for the exemplar of a record group that matches every record. Record
+    # ids differ between records, so classes come first, then the shared prefix of the
+    # id, then the bare tag.
+    classes = (element.get('class') or '').split()
+    if classes:
+        return '.' + '.'.join(escape_css_identifier(cls) for cls in classes)
+    prefix = DIGITS_PATTERN.split(element.get('id') or '')[0]
+    if prefix and prefix != element.get('id'):
+        return f'[id^="{escape_css_identifier(prefix)}"]'
+    return element.tag
+
+
+def collapse_records(body, min_repeats: int = MIN_RECORD_REPEATS, min_size: int = MIN_RECORD_SIZE):
+    # Return a copy of body where every record group is reduced to its exemplar followed
+    # by a note giving the number of records it stands for
+    body = copy.deepcopy(body)
+    records = detect_record_groups(body, min_repeats, min_size)
+    for element in records.skipped:
+        parent = element.getparent()
+        if parent is None:
+            continue
+        # Keep the text that follows the removed record
+        if element.tail and element.tail.strip():
+            previous = element.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or '') + element.tail
+            else:
+                parent.text = (parent.text or '') + element.tail
+        parent.remove(element)
+    for exemplar, count in records.exemplar_counts.items():
+        note = etree.Element('p')
+        note.text = f"[{count - 1} more records like the one above]"
+        note.tail = exemplar.tail
+        exemplar.tail = None
+        exemplar.addnext(note)
+    return body
@@ -0,0 +1,88 @@
+import logging
+
+# The core library reports progress, errors and intermediate results through a sink
+# instead of calling Streamlit directly. Logging is the default, the Streamlit pages
+# install utils.streamlit_sink.StreamlitSink and batch jobs can pass callbacks.
+
+logger = logging.getLogger("intelliscrape")
+
+
+class ResultSink:
+    # Base sink, every method is a no-op
+
+    def info(self, message: str) -> None:
+        pass
+
+    def success(self, message: str) -> None:
+        pass
+
+    def warning(self, message: str) -> None:
+        pass
+
+    def error(self, message: str) -> None:
+        pass
+
+    def result(self, label: str, value) -> None:
+        pass
+
+
+class LoggingSink(ResultSink):
+    def __init__(self, log=logger):
+        self.log = log
+
+    def info(self, message: str) -> None:
+        self.log.info(message)
+
+    def success(self, message: str) -> None:
+        self.log.info(message)
+
+    def warning(self, message: str) -> None:
+        self.log.warning(message)
+
+    def error(self, message: str) -> None:
+        self.log.error(message)
+
+    def result(self, label: str, value) -> None:
+        self.log.debug(f"{label}: {value!r:.200}")
+
+
+class CallbackSink(ResultSink):
+    # Forwards messages to on_message(level, message) and results to on_result(label, value)
+
+    def __init__(self, on_message=None, on_result=None):
+        self.on_message = on_message
+        self.on_result = on_result
+
+    def _message(self, level: str, message: str) -> None:
+        if self.on_message:
+            self.on_message(level, message)
+
+    def info(self, message: str) -> None:
+        self._message("info", message)
+
+    def success(self, message: str) -> None:
+        self._message("success", message)
+
+    def warning(self, message: str) -> None:
+        self._message("warning", message)
+
+    def error(self, message: str) -> None:
+        self._message("error", message)
+
+    def result(self, label: str, value) -> None:
+        if self.on_result:
+            self.on_result(label, value)
+
+
+_sink = LoggingSink()
+
+
+def get_sink() -> ResultSink:
+    return _sink
+
+
+def set_sink(sink: ResultSink) -> ResultSink:
+    # Install the process-wide sink and return the previous one
+    global _sink
+    previous, _sink = _sink, sink
+    return previous
@@ -1,26 +1,18 @@
-import requests
-import streamlit as st
-from dotenv import load_dotenv
-import os
+from utils.fetcher import get_default_fetcher
+from utils.reporting import get_sink
 
-load_dotenv()
+# Pages are rendered by the ScrapeNetwork API through the shared fetcher, which keeps
+# connections alive and caches rendered pages on disk. Failed fetches are not cached.
 
-@st.cache_data
-def scrape_body_from_url(url):
+def scrape_body_from_url(url, backend="scrapenetwork"):
     try:
-        # Use Scrapenetwork API to get HTML content
-        api_url = "https://app.scrapenetwork.com/api"
-        params = {
-            'api_key': os.getenv("SCRAPENETWORK_API_KEY"),
-            'request_url': url,
-            'js_render': 'true'
-        }
-        response = requests.get(api_url, params=params)
-        st.error(response)
-        response.raise_for_status()  # Will raise an HTTPError if the HTTP request returned an unsuccessful status code
+        response = get_default_fetcher(backend).fetch(url)
         html_content_scrapped = response.content
-        st.success(html_content_scrapped)
+        if response.from_cache:
+            get_sink().success(f"Loaded {len(html_content_scrapped)} bytes of {url} from the cache")
+        else:
+            get_sink().success(f"Scraped {len(html_content_scrapped)} bytes from {url}")
         return html_content_scrapped
     except Exception as e:
-        st.error(f"Error scraping HTML content from URL: {str(e)}")
-        return None
\ No newline at end of file
+        get_sink().error(f"Error scraping HTML content from URL: {str(e)}")
+        return None
@@ -0,0 +1,46 @@
+from urllib.parse import urlparse
+from utils.prompts import (SYSTEM_PROMPT_FOR_SELECTING_APPROACH_DYNAMICALLY,
+                           SELECTING_APPROACH_TEMPLATE)
+from utils.get_gpt_response_json import get_gpt_response_json
+from utils.parsed_document import ParsedDocument
+
+def get_approach(url, instruction):
+    user_request = SELECTING_APPROACH_TEMPLATE.render(INSTRUCTION=instruction, URL=url)
+
+    response = get_gpt_response_json(
+        user_request=user_request, system_prompt=SYSTEM_PROMPT_FOR_SELECTING_APPROACH_DYNAMICALLY)
+    return int(response['approach'])
+
+def get_base_url(url):
+    parsed_url = urlparse(url)
+    return f"{parsed_url.scheme}://{parsed_url.netloc}"
+
+def get_top_2_urls_out_of_the_html(html_content):
+    document = ParsedDocument.from_content(html_content)
+    links = document.root.iter('a')
+    
+    url_tally = {}
+    
+    for link in links:
+        url = link.get('href')
+        if url is None:
+            continue
+        if url.startswith("http://") or url.startswith("https://"):
+            base_url = get_base_url(url)
+            if base_url in url_tally:
+                url_tally[base_url] += 1
+            else:
+                url_tally[base_url] = 1
+    
+    sorted_urls = sorted(url_tally.items(), key=lambda x: x[1], reverse=True)
+    top_two_urls = ""
+    for i, (base_url, count) in enumerate(sorted_urls[:2], 1):
+        top_two_urls += f"{i}. {base_url}: {count} times\n"
+    
+    return top_two_urls
+
+def select_approach_for_document(document, instruction, url=None):
+    # Uploaded files have no URL, describe the page by the sites it links to most
+    if not url:
+        url = get_top_2_urls_out_of_the_html(html_content=document)
+    return get_approach(url=url, instruction=instruction)
@@ -0,0 +1,268 @@
+import json
+import re
+import threading
+from collections import OrderedDict
+from lxml import etree
+from cssselect import HTMLTranslator, SelectorError, parse
+from cssselect.parser import Class, CombinedSelector, Element, Hash
+from utils.parsed_document import ParsedDocument, element_text
+from utils.reporting import logger
+
+# Selector dicts returned by GPT are compiled once into a plan and the plans are
+# cached, so every page scraped with the same dict skips parsing and translation,
+# which is the common case once selector templates are reused per site layout.
+#
+# Most generated selectors only combine tags, ids and classes with descendant or
+# child combinators. Those are answered from an index of the page built in a single
+# walk of the tree: candidates for the rightmost compound come from the index and
+# only their ancestors are checked. The XPath cssselect produces for a class scans
+# and re-normalizes every element's class attribute, once per selector. Any other
+# selector (attributes, pseudo-classes, siblings) runs as a compiled XPath.
+
+PLAN_CACHE_SIZE = 256
+
+_translator = HTMLTranslator()
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+# Kinds of plan entries
+NESTED = "nested"
+SELECTOR = "selector"
+
+# Whitespace normalize-space() collapses, the class separators seen by the XPath
+XPATH_WHITESPACE = re.compile(r'[ \t\r\n]+')
+NON_WHITESPACE = re.compile(r'^[^ \t\r\n\f]+$')
+
+
+class SelectorIndex:
+    # Elements of a page by tag, id and class, plus their document order
+    def __init__(self, root):
+        self.all = []
+        self.by_tag = {}
+        self.by_id = {}
+        self.by_class = {}
+        self.position = {}
+        for position, element in enumerate(root.iter(tag=etree.Element)):
+            self.all.append(element)
+            self.position[element] = position
+            self.by_tag.setdefault(element.tag, []).append(element)
+            element_id = element.get('id')
+            if element_id is not None:
+                self.by_id.setdefault(element_id, []).append(element)
+            for class_name in get_classes(element):
+                self.by_class.setdefault(class_name, []).append(element)
+
+
+def get_classes(element):
+    classes = element.get('class')
+    if not classes:
+        return ()
+    return set(XPATH_WHITESPACE.split(classes.strip(' \t\r\n'))) - {''}
+
+
+def get_selector_index(document: ParsedDocument) -> SelectorIndex:
+    # Built once per document on first use
+    if document.selector_index is None:
+        document.selector_index = SelectorIndex(document.root)
+    return document.selector_index
+
+
+class Compound:
+    # tag, ids and classes an element must all match, e.g. div#main.list.wide
+    __slots__ = ('tag', 'ids', 'classes')
+
+    def __init__(self, tag, ids, classes):
+        self.tag = tag
+        self.ids = ids
+        self.classes = classes
+
+    def candidates(self, index):
+        # The smallest index list that every match belongs to
+        lists = [index.by_id.get(i, ()) for i in self.ids] + [index.by_class.get(c, ()) for c in self.classes]
+        if self.tag is not None:
+            lists.append(index.by_tag.get(self.tag, ()))
+        return min(lists, key=len) if lists else index.all
+
+    def matches(self, element) -> bool:
+        if self.tag is not None and element.tag != self.tag:
+            return False
+        if self.ids and any(element.get('id') != i for i in self.ids):
+            return False
+        if self.classes:
+            classes = get_classes(element)
+            return all(c in classes for c in self.classes)
+        return True
+
+
+def parse_compound(tree):
+    tag, ids, classes = None, [], []
+    while not isinstance(tree, Element):
+        if isinstance(tree, Class):
+            if not tree.class_name or not NON_WHITESPACE.match(tree.class_name):
+                return None
+            classes.append(tree.class_name)
+        elif isinstance(tree, Hash):
+            ids.append(tree.id)
+        else:
+            return None
+        tree = tree.selector
+    if tree.namespace:
+        return None
+    if tree.element and tree.element != '*':
+        tag = tree.element.lower()
+    return Compound(tag, tuple(ids), tuple(classes))
+
+
+def parse_indexed_selector(selector_string):
+    # Return a list of chains, one per comma separated selector, each chain being
+    # [(compound, combinator to the left)] from right to left. None when the
+    # selector needs the XPath fallback.
+    try:
+        selectors = parse(selector_string)
+    except (SelectorError, TypeError):
+        return None
+    chains = []
+    for selector in selectors:
+        if selector.pseudo_element:
+            return None
+        chain = []
+        tree = selector.parsed_tree
+        while isinstance(tree, CombinedSelector):
+            if tree.combinator not in (' ', '>'):
+                return None
+            compound = parse_compound(tree.subselector)
+            if compound is None:
+                return None
+            chain.append((compound, tree.combinator))
+            tree = tree.selector
+        compound = parse_compound(tree)
+        if compound is None:
+            return None
+        chain.append((compound, None))
+        chains.append(chain)
+    return chains
+
+
+def _matches_chain(element, chain, i):
+    # element matched chain[i], check the compounds to its left
+    compound, combinator = chain[i]
+    if combinator is None:
+        return True
+    left = chain[i + 1][0]
+    ancestor = element.getparent()
+    if combinator == '>':
+        return ancestor is not None and left.matches(ancestor) and _matches_chain(ancestor, chain, i + 1)
+    while ancestor is not None:
+        if left.matches(ancestor) and _matches_chain(ancestor, chain, i + 1):
+            return True
+        ancestor = ancestor.getparent()
+    return False
+
+
+def select_indexed(index, chains):
+    matched = []
+    for chain in chains:
+        compound = chain[0][0]
+        for element in compound.candidates(index):
+            if compound.matches(element) and _matches_chain(element, chain, 0):
+                matched.append(element)
+    if len(chains) > 1:
+        # A selector group returns each element once, in document order
+        matched = sorted(set(matched), key=index.position.__getitem__)
+    return matched
+
+
+class CompiledSelectorPlan:
+    def __init__(self, selectors: dict):
+        # Entries are flattened in the order the nested dict is walked, so the scraped
+        # dict keeps the key order of the selectors. Identical selector strings share
+        # a single compiled expression and are evaluated once per page.
+        self.entries = []
+        self.expressions = {}
+        self.indexed = {}
+        self.errors = {}
+        # Walk the nested dict depth first without recursion, a nested dict is filled
+        # before moving on to the next key of its parent
+        stack = [((), iter(selectors.items()))]
+        while stack:
+            path, items = stack[-1]
+            item = next(items, None)
+            if item is None:
+                stack.pop()
+                continue
+            name, selector = item
+            entry_path = path + (name,)
+            if isinstance(selector, dict):
+                self.entries.append((NESTED, entry_path, None))
+                stack.append((entry_path, iter(selector.items())))
+                continue
+            try:
+                # A list is concatenated to form a selector string
+                selector_string = ' '.join(selector) if isinstance(selector, list) else selector
+                if selector_string not in self.expressions and selector_string not in self.indexed:
+                    # The XPath is compiled for every selector, it also validates it
+                    self.expressions[selector_string] = etree.XPath(_translator.css_to_xpath(selector_string))
+                    chains = parse_indexed_selector(selector_string)
+                    if chains is not None:
+                        self.indexed[selector_string] = chains
+                self.entries.append((SELECTOR, entry_path, selector_string))
+            except (SelectorError, etree.XPathError, TypeError, AttributeError) as e:
+                self.errors[entry_path] = e
+                self.entries.append((SELECTOR, entry_path, None))
+
+    def evaluate(self, html_content) -> dict:
+        # Accepts a ParsedDocument or anything ParsedDocument.from_content takes
+        document = ParsedDocument.from_content(html_content)
+        root = document.root
+        index = get_selector_index(document) if self.indexed else None
+        scraped_content = {}
+        containers = {(): scraped_content}
+        matches = {}
+        texts = {}
+        for kind, path, selector_string in self.entries:
+            parent = containers[path[:-1]]
+            name = path[-1]
+            if kind == NESTED:
+                parent[name] = containers[path] = {}
+                continue
+            if selector_string is None:
+                logger.warning(f"Error processing selector {name}: {self.errors[path]}")
+                parent[name] = []
+                continue
+            elements = matches.get(selector_string)
+            if elements is None:
+                try:
+                    if selector_string in self.indexed:
+                        elements = select_indexed(index, self.indexed[selector_string])
+                    else:
+                        elements = self.expressions[selector_string](root)
+                    matches[selector_string] = elements
+                except etree.XPathError as e:
+                    logger.warning(f"Error processing selector {name}: {e}")
+                    parent[name] = []
+                    continue
+            content = []
+            for element in elements:
+                # Elements matched by several selectors have their text extracted once
+                text = texts.get(element)
+                if text is None:
+                    text = texts[element] = element_text(element)
+                content.append(text)
+            parent[name] = content
+        return scraped_content
+
+
+def compile_selectors(selectors: dict) -> CompiledSelectorPlan:
+    # Return the cached plan for this selector dict, compiling it on first use
+    key = json.dumps(selectors, default=str)
+    with _plan_cache_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            return plan
+    plan = CompiledSelectorPlan(selectors)
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        while len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
@@ -1,71 +1,82 @@
-import re
-import bs4
-import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from utils.content_node import MAX_CONTENT_LENGTH, truncate_text, escape_css_identifier
+from utils.parsed_document import ParsedDocument, get_text_prefixes
+from utils.summary_budget import fit_summary_to_budget
+from utils.record_detection import detect_record_groups, get_record_key
 
-# Compile the regex pattern once and reuse it
-CSS_ESCAPE_PATTERN = re.compile(r'([!"#$%&\'()*+,./:;<=>?@[\\]^`{|}~])')
 
-# Define the tags to decompose as a constant at the module level
-TAGS_TO_DECOMPOSE = ['script', 'style', 'meta', 'comment', 'head', 'footer', 'nav', 'form', 'noscript']
+def get_selector_key(element):
+    # "#id" for elements with an id, ".class1.class2" for elements with classes
+    element_id = element.get('id')
+    if element_id is not None:
+        return f"#{escape_css_identifier(element_id)}"
+    classes = (element.get('class') or '').split()
+    if classes:
+        return '.' + '.'.join(escape_css_identifier(cls) for cls in classes)
+    return None
 
-# Define the truncate_text function
-def truncate_text(text: str, max_length: int = 70) -> str:
-    return text[:max_length] + '...' if len(text) > max_length else text
 
-# Function to escape special characters in CSS identifiers
-def escape_css_identifier(s: str) -> str:
-    return CSS_ESCAPE_PATTERN.sub(r'\\\1', s)
+def prune_empty_entries(summary: Dict[str, Any]) -> Dict[str, Any]:
+    # Remove empty content lists, empty children and the entries left without either,
+    # in place. Nested dicts are handled before their parents so emptiness propagates upwards.
+    dicts = [summary]
+    for d in dicts:
+        dicts.extend(entry['children'] for entry in d.values())
+    for d in reversed(dicts):
+        for key in list(d):
+            entry = d[key]
+            if not entry['content']:
+                del entry['content']
+            if not entry['children']:
+                del entry['children']
+            if 'content' not in entry and 'children' not in entry:
+                del d[key]
+    return summary
 
-def process_tag(tag: bs4.element.Tag, result_dict: Dict[str, Any]) -> None:
-    try:
-        key = None
-        if 'id' in tag.attrs:
-            key = f"#{escape_css_identifier(tag['id'])}"
-        elif 'class' in tag.attrs and tag['class']:
-            key = '.' + '.'.join(escape_css_identifier(cls) for cls in tag['class'])
 
-        if key:
-            if key not in result_dict:
-                result_dict[key] = {'content': [], 'children': {}}
-            text = tag.get_text(strip=True)
-            if text:
-                result_dict[key]['content'].append(truncate_text(text))
-            for child in tag.children:
-                if isinstance(child, bs4.element.Tag):  # Ensure child is a tag
-                    process_tag(child, result_dict[key]['children'])
-        else:
-            for child in tag.children:
-                if isinstance(child, bs4.element.Tag):
-                    process_tag(child, result_dict)
-    except Exception as e:
-        logging.error(f"Error processing tag {tag}: {e}")
-
-def clean_and_truncate(d: Dict[str, Any], max_content_items: int = 2) -> Dict[str, Any]:
-    if not isinstance(d, dict):
-        return d
-    clean_dict = {}
-    for key, value in d.items():
-        if key == 'content':
-            # Filter out empty strings and truncate the list to the first two items
-            value = [item for item in value if item.strip()][:max_content_items]
-        elif key == 'children':
-            # Recursively clean and truncate children
-            value = clean_and_truncate(value, max_content_items)
-        else:
-            value = clean_and_truncate(value, max_content_items)
-
-        if value:
-            clean_dict[key] = value
-
-    return {k: v for k, v in clean_dict.items() if v}
-
-# Update the summarize_body_using_dict_method function to pass the max_content_items parameter
-def summarize_body_using_dict_method(soup: bs4.BeautifulSoup, max_content_items: int = 2) -> Dict[str, Any]:
+def summarize_body_using_dict_method(soup, max_content_items: int = 2, token_limit: Optional[int] = None,
+                                     collapse_records: bool = False) -> Dict[str, Any]:
+    # Map the id and class selectors of the cleaned body to their first texts and the
+    # selectors nested under them. Accepts a ParsedDocument, a BeautifulSoup tag or raw HTML.
+    # With a token_limit the summary is reduced until its JSON fits. With collapse_records
+    # only one exemplar of each list of repeated records is summarized, under a key that
+    # matches every record and with the number of records under 'repeated'.
+    document = ParsedDocument.from_content(soup)
     result_dict = {}
+    records = detect_record_groups(document.body) if collapse_records else None
+
+    # Walk the tree once without recursion. Elements with the same selector under the
+    # same parent share one entry, elements without a selector pass their children
+    # on to the enclosing entry.
+    elements = []
+    keyed = []
+    stack = [(document.body, result_dict)]
+    while stack:
+        element, scope = stack.pop()
+        key = get_selector_key(element)
+        count = records.exemplar_counts.get(element) if records else None
+        if count:
+            key = get_record_key(element)
+        if key:
+            entry = scope.get(key)
+            if entry is None:
+                entry = scope[key] = {'content': [], 'children': {}}
+            if count:
+                entry['repeated'] = entry.get('repeated', 0) + count
+            keyed.append((len(elements), entry))
+            scope = entry['children']
+        elements.append(element)
+        for child in reversed(element):
+            if isinstance(child.tag, str) and not (records and child in records.skipped):
+                stack.append((child, scope))
 
-    for tag in soup(TAGS_TO_DECOMPOSE):
-        tag.decompose()
+    # Texts are computed once, bottom up, and an entry stops collecting content once it
+    # holds max_content_items texts
+    texts = get_text_prefixes(elements, MAX_CONTENT_LENGTH + 1)
+    for index, entry in keyed:
+        content = entry['content']
+        if len(content) < max_content_items and texts[index]:
+            content.append(truncate_text(texts[index]))
 
-    process_tag(soup.body if soup.body else soup, result_dict)
-    return clean_and_truncate(result_dict, max_content_items)
\ No newline at end of file
+    prune_empty_entries(result_dict)
+    return fit_summary_to_budget(result_dict, token_limit) if token_limit else result_dict
@@ -0,0 +1,135 @@
+import json
+
+# Extraction answers are a JSON object holding lists of records, e.g.
+#   {"products": [{"title": ..., "price": ...}, ...]}
+# IncrementalJSONParser is fed the answer as it streams in and returns every element
+# of an outermost list as soon as its closing bracket arrives, long before the whole
+# answer can be parsed. Elements of lists nested inside a record stay in the record.
+
+WHITESPACE = frozenset(" \t\r\n")
+
+
+class IncrementalJSONParser:
+    def __init__(self):
+        self._chunks = []
+        # One entry per open container: [kind, key, inside_list]. key is the object key
+        # the container is stored under, inside_list tells whether a list encloses it.
+        self._stack = []
+        self._key = None
+        self._expecting_key = False
+        self._in_string = False
+        self._escaped = False
+        self._string_is_key = False
+        self._key_parts = []
+        # The record being read: its text so far, the stack depth of its list and
+        # whether it is a bare value (string, number, ...) rather than a container
+        self._record_parts = None
+        self._record_start = 0
+        self._record_depth = None
+        self._record_is_scalar = False
+
+    def _record_list(self):
+        # The enclosing list when it is an outermost one, its elements are records
+        if self._stack and self._stack[-1][0] == '[' and not self._stack[-1][2]:
+            return self._stack[-1]
+        return None
+
+    def _path(self):
+        return tuple(entry[1] for entry in self._stack if entry[1] is not None)
+
+    def _finish_record(self, records, chunk, end):
+        self._record_parts.append(chunk[self._record_start:end])
+        text = ''.join(self._record_parts).strip()
+        self._record_parts = None
+        self._record_is_scalar = False
+        if text:
+            records.append((self._path(), json.loads(text)))
+
+    def feed(self, chunk: str):
+        # Consume the next piece of the answer and return the (path, record) pairs it completed
+        self._chunks.append(chunk)
+        records = []
+        self._record_start = 0
+        for index, char in enumerate(chunk):
+            if self._in_string:
+                if self._string_is_key:
+                    self._key_parts.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._string_is_key:
+                        self._key = json.loads('"' + ''.join(self._key_parts))
+                        self._string_is_key = False
+                continue
+            if char in WHITESPACE:
+                continue
+
+            if self._record_parts is None and char not in ',]' and self._record_list() is not None:
+                # First character of a new record
+                self._record_parts = []
+                self._record_start = index
+                self._record_depth = len(self._stack)
+                self._record_is_scalar = char not in '{['
+            elif self._record_is_scalar and char in ',]' and len(self._stack) == self._record_depth:
+                self._finish_record(records, chunk, index)
+
+            top = self._stack[-1] if self._stack else None
+            if char == '"':
+                self._in_string = True
+                self._string_is_key = top is not None and top[0] == '{' and self._expecting_key
+                self._key_parts = []
+            elif char in '{[':
+                key = self._key if top is not None and top[0] == '{' else None
+                inside_list = top is not None and (top[0] == '[' or top[2])
+                self._stack.append([char, key, inside_list])
+                self._expecting_key = char == '{'
+            elif char in '}]':
+                if self._stack:
+                    self._stack.pop()
+                if self._record_parts is not None and not self._record_is_scalar and len(self._stack) == self._record_depth:
+                    self._finish_record(records, chunk, index + 1)
+                self._expecting_key = False
+            elif char == ':':
+                self._expecting_key = False
+            elif char == ',':
+                self._expecting_key = top is not None and top[0] == '{'
+        if self._record_parts is not None:
+            self._record_parts.append(chunk[self._record_start:])
+            self._record_start = 0
+        return records
+
+    @property
+    def text(self) -> str:
+        return ''.join(self._chunks)
+
+    def result(self):
+        # The whole answer, once it has been fed completely
+        return json.loads(self.text)
+
+
+def iter_records(value, path=()):
+    # The (path, record) pairs IncrementalJSONParser yields for an already parsed answer
+    if isinstance(value, list):
+        for item in value:
+            yield path, item
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from iter_records(item, path + (key,))
+
+
+def build_partial_result(records):
+    # Rebuild the answer from the records received so far, e.g. after cancelling early
+    records = list(records)
+    if records and not records[0][0]:
+        # The answer itself is a list
+        return [record for _, record in records]
+    result = {}
+    for path, record in records:
+        target = result
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+        target.setdefault(path[-1], []).append(record)
+    return result
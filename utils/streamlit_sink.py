@@ -0,0 +1,90 @@
+import threading
+import time
+import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from utils.reporting import ResultSink, LoggingSink
+from utils.streaming_json import build_partial_result
+
+# The only module of the utils package that imports Streamlit, the pages install
+# this sink so the core library reports through st.* calls
+
+
+class StreamlitSink(ResultSink):
+    # Without a script context (e.g. a worker thread) messages go to the log instead
+    fallback = LoggingSink()
+
+    def _target(self):
+        return st if get_script_run_ctx() is not None else None
+
+    def info(self, message: str) -> None:
+        (self._target() or self.fallback).info(message)
+
+    def success(self, message: str) -> None:
+        (self._target() or self.fallback).success(message)
+
+    def warning(self, message: str) -> None:
+        (self._target() or self.fallback).warning(message)
+
+    def error(self, message: str) -> None:
+        (self._target() or self.fallback).error(message)
+
+    def result(self, label: str, value) -> None:
+        if self._target() is None:
+            self.fallback.result(label, value)
+            return
+        show_result_in_expander(label, value)
+
+
+def show_result_in_expander(label, value):
+    with st.expander(label=label):
+        if isinstance(value, str):
+            st.markdown(value)
+        else:
+            st.json(value)
+
+
+def with_script_run_ctx(func):
+    # Attach the calling page's script context to the worker thread that runs func,
+    # so st.* calls made from pipeline stages still render on the page
+    ctx = get_script_run_ctx()
+    def run(**kwargs):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return func(**kwargs)
+    return run
+
+
+class StreamedRecordsView:
+    # Shows the records of a streamed answer on the page while they arrive. Pass
+    # on_record to the extraction, it stops the answer once max_records are shown.
+    # Redrawing is throttled, a long answer would otherwise redraw the JSON per record.
+
+    def __init__(self, max_records: int = 0, refresh_seconds: float = 0.25):
+        self.max_records = max_records
+        self.refresh_seconds = refresh_seconds
+        self.records = []
+        self.started_at = time.perf_counter()
+        self.time_to_first_record = None
+        self._drawn_at = 0.0
+        self._caption = st.empty()
+        self._placeholder = st.empty()
+
+    def on_record(self, path, record):
+        if self.time_to_first_record is None:
+            self.time_to_first_record = time.perf_counter() - self.started_at
+        self.records.append((path, record))
+        now = time.perf_counter()
+        if now - self._drawn_at >= self.refresh_seconds:
+            self._drawn_at = now
+            self._caption.caption(f"{len(self.records)} records received, first after {self.time_to_first_record:.2f}s")
+            self._placeholder.json(build_partial_result(self.records))
+        return not self.max_records or len(self.records) < self.max_records
+
+    def finish(self):
+        # Replace the live view with a summary line, the caller shows the final result
+        self._placeholder.empty()
+        if self.time_to_first_record is None:
+            self._caption.empty()
+        else:
+            stopped = " (stopped early)" if self.max_records and len(self.records) >= self.max_records else ""
+            self._caption.caption(f"{len(self.records)} records streamed{stopped}, "
+                                  f"first after {self.time_to_first_record:.2f}s")
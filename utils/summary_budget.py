@@ -0,0 +1,150 @@
+import json
+import os
+import re
+from utils.content_node import truncate_text
+from utils.ensure_limit import count_tokens
+
+# Summaries sent to GPT are fitted to a token budget by degrading them step by step
+# instead of chopping the serialized JSON, which left invalid JSON and kept whatever
+# happened to come first on the page. Every step returns a valid summary of the same
+# shape, the first step that fits the budget is used.
+
+DEFAULT_SUMMARY_TOKEN_BUDGET = int(os.getenv("SUMMARY_TOKEN_BUDGET", "32000"))
+
+DIGITS_PATTERN = re.compile(r'\d+')
+
+# Steps tried in order before the depth of the summary is limited
+DEGRADATION_STEPS = (
+    {},
+    {"max_items": 1},
+    {"max_items": 1, "max_length": 40, "drop_redundant": True},
+    {"max_items": 1, "max_length": 40, "drop_redundant": True, "collapse_repeated": True},
+    {"max_items": 1, "max_length": 20, "drop_redundant": True, "collapse_repeated": True},
+)
+
+
+def summary_tokens(summary) -> int:
+    return count_tokens(json.dumps(summary))
+
+
+def summary_depth(summary) -> int:
+    depth = 0
+    stack = [(summary, 1)]
+    while stack:
+        entries, level = stack.pop()
+        if not entries:
+            continue
+        depth = max(depth, level)
+        for entry in entries.values():
+            if isinstance(entry, dict) and entry.get('children'):
+                stack.append((entry['children'], level + 1))
+    return depth
+
+
+def _is_redundant(entry, parent_content) -> bool:
+    # A leaf whose texts all appear in its parent's texts tells GPT nothing new
+    if entry.get('children') or not parent_content:
+        return False
+    content = entry.get('content') or []
+    return all(any(item.rstrip('.') in parent_item for parent_item in parent_content) for item in content)
+
+
+def degrade_summary(summary, max_items=None, max_length=None, drop_redundant=False,
+                    collapse_repeated=False, max_depth=None, max_top_level=None) -> dict:
+    # Return a reduced copy of a dict or XPath summary:
+    #   max_items          content samples kept per entry
+    #   max_length         characters kept per content sample
+    #   drop_redundant     drop leaves that only repeat their parent's text
+    #   collapse_repeated  keep one of the sibling keys that only differ by numbers and
+    #                      record how many there were under 'repeated'
+    #   max_depth          levels of children kept
+    #   max_top_level      top level entries kept
+    result = {}
+    stack = [(summary, result, 1, None)]
+    while stack:
+        source, target, depth, parent_content = stack.pop()
+        kept = {}
+        for key, entry in source.items():
+            if not isinstance(entry, dict):
+                continue
+            if depth == 1 and max_top_level is not None and len(target) >= max_top_level:
+                break
+            if drop_redundant and _is_redundant(entry, parent_content):
+                continue
+            if collapse_repeated:
+                normalized = DIGITS_PATTERN.sub('0', key)
+                if normalized in kept:
+                    kept_entry = kept[normalized]
+                    kept_entry['repeated'] = kept_entry.get('repeated', 1) + entry.get('repeated', 1)
+                    continue
+            new_entry = {}
+            content = entry.get('content')
+            if content:
+                content = content[:max_items] if max_items is not None else list(content)
+                if max_length is not None:
+                    content = [truncate_text(item, max_length) for item in content]
+                new_entry['content'] = content
+            if entry.get('class'):
+                new_entry['class'] = entry['class']
+            if entry.get('repeated'):
+                new_entry['repeated'] = entry['repeated']
+            if entry.get('children') and (max_depth is None or depth < max_depth):
+                new_entry['children'] = {}
+                stack.append((entry['children'], new_entry['children'], depth + 1, entry.get('content')))
+            target[key] = new_entry
+            if collapse_repeated:
+                kept[normalized] = new_entry
+    return _prune(result)
+
+
+def _prune(summary):
+    # Drop children dicts and entries left empty by the degradation, deepest first
+    dicts = [summary]
+    for d in dicts:
+        dicts.extend(entry['children'] for entry in d.values() if 'children' in entry)
+    for d in reversed(dicts):
+        for key in list(d):
+            entry = d[key]
+            if 'children' in entry and not entry['children']:
+                del entry['children']
+            if not entry.get('content') and not entry.get('children'):
+                del d[key]
+    return summary
+
+
+def fit_summary_to_budget(summary, token_limit: int = DEFAULT_SUMMARY_TOKEN_BUDGET) -> dict:
+    # Return the least degraded version of summary whose JSON fits token_limit
+    if not summary or summary_tokens(summary) <= token_limit:
+        return summary
+
+    strongest = DEGRADATION_STEPS[-1]
+    steps = [dict(step) for step in DEGRADATION_STEPS[1:]]
+    steps += [dict(strongest, max_depth=depth) for depth in range(summary_depth(summary) - 1, 0, -1)]
+
+    # Each step is smaller than the previous one, binary search the first that fits
+    low, high = 0, len(steps) - 1
+    best = None
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = degrade_summary(summary, **steps[middle])
+        if summary_tokens(candidate) <= token_limit:
+            best = candidate
+            high = middle - 1
+        else:
+            low = middle + 1
+    if best is not None:
+        return best
+
+    # Even the top level alone is too large, keep as many top level entries as fit
+    top_level = dict(strongest, max_depth=1)
+    low, high = 0, len(summary)
+    best = {}
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = degrade_summary(summary, max_top_level=middle, **top_level)
+        if summary_tokens(candidate) <= token_limit:
+            best = candidate
+            low = middle + 1
+        else:
+            high = middle - 1
+    return best
@@ -0,0 +1,267 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from utils.layout_fingerprint import (SHINGLE_DEPTH, LayoutClusterIndex, LayoutSignature,
+                                      compute_shingles_signature)
+from utils.reporting import logger
+
+# Selectors generated by GPT for one page are stored per site layout and reused for
+# every later page that shares the domain, the layout of its summary and the
+# instruction. GPT is only asked again when the stored selectors stop matching.
+# Layouts are clusters of near identical summary structures (see
+# utils.layout_fingerprint), a few blocks more or less on a page keep its layout.
+# The JSON schemas of the Purely GPT approach only depend on the instruction, they are
+# stored per domain and instruction in the same store.
+
+DEFAULT_TEMPLATE_STORE_PATH = os.getenv("TEMPLATE_STORE_PATH", os.path.join(".cache", "selector_templates.sqlite3"))
+TEMPLATE_STORE_DISABLED = os.getenv("TEMPLATE_STORE_DISABLED", "").lower() in ("1", "true", "yes")
+
+# Summary keys that describe content rather than structure, record counts included
+NON_STRUCTURAL_KEYS = ('content', 'class', 'repeated')
+DIGITS_PATTERN = re.compile(r'\d+')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def get_domain(url) -> str:
+    if not url:
+        return ""
+    netloc = urlsplit(url).netloc.lower()
+    return netloc[4:] if netloc.startswith("www.") else netloc
+
+
+def get_layout_paths(summarized_dict, prefix=""):
+    # Yield the structural key paths of a dict or XPath summary. Digits are normalized
+    # so generated ids like #product-1234 and positional indices do not split a layout.
+    stack = [(summarized_dict, prefix)]
+    while stack:
+        node, path = stack.pop()
+        if not isinstance(node, dict):
+            continue
+        for key, value in node.items():
+            if key in NON_STRUCTURAL_KEYS:
+                continue
+            if key == 'children':
+                stack.append((value, path))
+                continue
+            child_path = f"{path}\x1f{DIGITS_PATTERN.sub('0', key)}"
+            yield child_path
+            stack.append((value, child_path))
+
+
+def get_layout_signature(summarized_dict) -> LayoutSignature:
+    # The closest levels of every structural path, as the page signatures are built
+    shingles = Counter("\x1f".join(path.split("\x1f")[-SHINGLE_DEPTH:]) for path in get_layout_paths(summarized_dict))
+    return compute_shingles_signature(shingles)
+
+
+def normalize_instruction(instruction: str) -> str:
+    return WHITESPACE_PATTERN.sub(' ', instruction or '').strip().lower()
+
+
+def make_template_key(domain: str, layout_id: int, instruction: str, kind: str = "css") -> str:
+    payload = json.dumps([kind, domain, layout_id, normalize_instruction(instruction)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def make_schema_key(domain: str, instruction: str) -> str:
+    payload = json.dumps(["json_schema", domain, normalize_instruction(instruction)])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def count_filled_fields(scraped_content) -> int:
+    # Number of selectors that matched at least one non-empty value
+    filled = 0
+    stack = [scraped_content]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list) and any(item for item in node):
+            filled += 1
+    return filled
+
+
+class SelectorTemplate:
+    def __init__(self, key, selectors, filled_fields, uses=0):
+        self.key = key
+        self.selectors = selectors
+        # Fields the selectors filled on the page they were generated for
+        self.filled_fields = filled_fields
+        self.uses = uses
+
+    def validate(self, scraped_content) -> bool:
+        # A reused template must fill as many fields as it did when it was learned
+        return count_filled_fields(scraped_content) >= max(1, self.filled_fields)
+
+
+class SelectorTemplateStore:
+    def __init__(self, path: str = DEFAULT_TEMPLATE_STORE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS templates ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, domain TEXT NOT NULL, selectors TEXT NOT NULL, "
+            "filled_fields INTEGER NOT NULL, uses INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL)")
+        # The first signature of every layout cluster of a domain, the clusters' LSH
+        # indexes are rebuilt from them on first use
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS layouts ("
+            "domain TEXT NOT NULL, layout_id INTEGER NOT NULL, signature TEXT NOT NULL, "
+            "PRIMARY KEY (domain, layout_id))")
+        self._layout_indexes = {}
+
+    def _layout_index(self, domain: str) -> LayoutClusterIndex:
+        index = self._layout_indexes.get(domain)
+        if index is None:
+            index = self._layout_indexes[domain] = LayoutClusterIndex()
+            rows = self._connection.execute(
+                "SELECT layout_id, signature FROM layouts WHERE domain = ?", (domain,)).fetchall()
+            for layout_id, signature in rows:
+                index.restore(layout_id, layout_id, LayoutSignature.from_dict(json.loads(signature)))
+        return index
+
+    def get_layout_id(self, domain: str, signature: LayoutSignature) -> int:
+        # Id of the layout cluster of the domain the signature falls in, a new cluster
+        # is stored for a signature unlike any before. Pages without structure share None.
+        if not signature.minhash:
+            return None
+        with self._lock:
+            index = self._layout_index(domain)
+            matches = index.query(signature, limit=1)
+            if matches:
+                return index.cluster_of[matches[0][0]]
+            layout_id = index.add(len(index), signature)
+            self._connection.execute("INSERT OR REPLACE INTO layouts (domain, layout_id, signature) VALUES (?, ?, ?)",
+                                     (domain, layout_id, json.dumps(signature.to_dict())))
+        return layout_id
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT selectors, filled_fields, uses FROM templates WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return SelectorTemplate(key, json.loads(row[0]), row[1], row[2])
+
+    def put(self, key: str, selectors, filled_fields: int, kind: str = "css", domain: str = "") -> None:
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO templates (key, kind, domain, selectors, filled_fields, uses, created_at) "
+                "VALUES (?, ?, ?, ?, ?, 0, ?)",
+                (key, kind, domain, json.dumps(selectors), filled_fields, time.time()))
+
+    def record_use(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("UPDATE templates SET uses = uses + 1 WHERE key = ?", (key,))
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM templates WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM templates")
+            self._connection.execute("DELETE FROM layouts")
+            self._layout_indexes = {}
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            templates, uses = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(uses), 0) FROM templates").fetchone()
+            layouts = self._connection.execute("SELECT COUNT(*) FROM layouts").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "templates": templates, "reuses": uses, "layouts": layouts}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_template_store():
+    global _default_store
+    if TEMPLATE_STORE_DISABLED:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SelectorTemplateStore()
+    return _default_store
+
+
+def get_selectors_with_template(summarized_dict, instruction, generate_selectors, apply_selectors,
+                                url=None, kind="css", store=None, use_templates=True):
+    # Return (selectors, scraped_content, from_template).
+    # generate_selectors() asks GPT for selectors, apply_selectors(selectors) scrapes the page.
+    if use_templates and store is None:
+        store = get_default_template_store()
+    if not use_templates or store is None:
+        selectors = generate_selectors()
+        return selectors, apply_selectors(selectors), False
+
+    domain = get_domain(url)
+    key = make_template_key(domain, store.get_layout_id(domain, get_layout_signature(summarized_dict)), instruction, kind)
+    template = store.get(key)
+    if template is not None:
+        scraped_content = apply_selectors(template.selectors)
+        if template.validate(scraped_content):
+            store.hits += 1
+            store.record_use(key)
+            return template.selectors, scraped_content, True
+        # The page differs from its layout more than the cluster allows, learn it again
+        logger.info(f"Selector template for {domain or 'page'} no longer matches, regenerating")
+        store.invalidate(key)
+
+    store.misses += 1
+    selectors = generate_selectors()
+    scraped_content = apply_selectors(selectors)
+    filled_fields = count_filled_fields(scraped_content)
+    if filled_fields and isinstance(selectors, dict) and selectors:
+        store.put(key, selectors, filled_fields, kind=kind, domain=domain)
+    return selectors, scraped_content, False
+
+
+def get_stored_schema(url, instruction, store=None, use_templates=True):
+    # Return (key, template) for the JSON schema stored for the domain of url and the
+    # instruction, template is None when there is none. key is None without a store or
+    # without a domain, pages of unknown origin never share a schema.
+    if use_templates and store is None:
+        store = get_default_template_store()
+    domain = get_domain(url)
+    if not use_templates or store is None or not domain:
+        return None, None
+    key = make_schema_key(domain, instruction)
+    template = store.get(key)
+    if template is None:
+        store.misses += 1
+    return key, template
+
+
+def update_stored_schema(key, template, json_schema, extracted_content, url=None, store=None) -> None:
+    # Store a newly generated schema that extracted something, count the use of a
+    # stored schema that still does and drop it once it extracts nothing
+    if key is None:
+        return
+    store = store or get_default_template_store()
+    filled_fields = count_filled_fields(extracted_content)
+    if template is None:
+        if filled_fields and isinstance(json_schema, dict) and json_schema:
+            store.put(key, json_schema, filled_fields, kind="json_schema", domain=get_domain(url))
+    elif filled_fields:
+        store.hits += 1
+        store.record_use(key)
+    else:
+        logger.info(f"JSON schema for {get_domain(url) or 'page'} extracted nothing, regenerating next time")
+        store.invalidate(key)
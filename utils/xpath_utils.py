@@ -0,0 +1,116 @@
+import re
+from typing import Dict, Any, Optional
+from utils.parsed_document import ParsedDocument
+from utils.reporting import logger
+from utils.summary_budget import fit_summary_to_budget
+
+
+# Indices in a normalized path are all [1], siblings of the same tag share one entry
+INDEX_PATTERN = re.compile(r'\[\d+\]')
+
+
+def summarize_body_using_xpath_method(html_content, max_content_length: int = 70, max_nodes: Optional[int] = None,
+                                      token_limit: Optional[int] = None) -> Dict[str, Any]:
+    # Map the normalized xpath of every node of the cleaned body to its first texts and
+    # its children. max_nodes stops the walk after that many nodes on very large pages,
+    # with a token_limit the summary is reduced until its JSON fits.
+    result_dict = {}
+
+    # Walk the cleaned copy of the document, tags are already decomposed and the
+    # page does not have to be re-serialized and parsed again
+    document = ParsedDocument.from_content(html_content)
+    tree = document.cleaned_tree
+    root = tree.getroot()
+
+    # Paths are built from the parent's path instead of calling getpath for every node.
+    # A step gets [1] when its parent has more than one child of that tag, which is
+    # what normalizing the indices of getpath gives. The walk is depth first with an
+    # explicit stack so deep pages cannot hit the recursion limit.
+    stack = [(root, tree.getpath(root), result_dict)]
+    visited = 0
+    while stack:
+        if max_nodes is not None and visited >= max_nodes:
+            break
+        element, xpath, parent_dict = stack.pop()
+        visited += 1
+        entry = parent_dict.get(xpath)
+        if entry is None:
+            entry = parent_dict[xpath] = {'content': [], 'children': {}}
+            # Add class attribute if it exists, without its spaces
+            class_name = element.get('class')
+            if class_name:
+                entry['class'] = class_name.replace(' ', '')
+        text = (element.text or '').strip()
+        if text:
+            # Truncate the text if it's longer than max_content_length
+            truncated_text = text[:max_content_length] + '...' if len(text) > max_content_length else text
+            entry['content'].append(truncated_text)
+
+        if not len(element):
+            continue
+        tag_counts = {}
+        for child in element:
+            tag_counts[child.tag] = tag_counts.get(child.tag, 0) + 1
+        children = entry['children']
+        # Pushed in reverse so children are visited in document order
+        for child in reversed(element):
+            tag = child.tag
+            if isinstance(tag, str):
+                step = tag + '[1]' if tag_counts[tag] > 1 else tag
+            else:
+                # Comments and processing instructions are rare, let lxml name them
+                step = INDEX_PATTERN.sub('[1]', tree.getpath(child).rsplit('/', 1)[-1])
+            stack.append((child, f"{xpath}/{step}", children))
+
+    cleaned_result_dict = clean_summary(result_dict)
+    if not cleaned_result_dict:
+        return {}
+    return fit_summary_to_budget(cleaned_result_dict, token_limit) if token_limit else cleaned_result_dict
+
+
+def _clean_entry(cleaned):
+    if 'content' in cleaned:
+        # Filter out empty strings and truncate the list to the first two items
+        cleaned['content'] = [item for item in cleaned['content'] if item.strip()][:2]
+    if 'children' in cleaned and not cleaned['children']:
+        del cleaned['children']  # Remove empty children dicts
+    return cleaned if cleaned else None  # Remove empty dicts
+
+
+def clean_summary(summary):
+    # Drop empty values bottom up. Entries that end up empty are kept as None under
+    # their parent, as the summary has always shown them.
+    result = None
+    stack = [(iter(summary.items()), {}, None)]
+    while stack:
+        items, cleaned, key = stack[-1]
+        for k, v in items:
+            if not v:
+                continue
+            if isinstance(v, dict):
+                stack.append((iter(v.items()), {}, k))
+                break
+            cleaned[k] = v
+        else:
+            stack.pop()
+            value = _clean_entry(cleaned)
+            if stack:
+                stack[-1][1][key] = value
+            else:
+                result = value
+    return result
+
+
+def scrape_content_using_xpath(html_content, xpath_dict):
+    scraped_content = {}
+    tree = ParsedDocument.from_content(html_content).root
+
+    for label, xpath in xpath_dict.items():
+        try:
+            elements = tree.xpath(xpath)
+            # Extract text content from each element found by the XPath
+            scraped_content[label] = [element.text for element in elements if element.text]
+        except Exception as e:
+            logger.warning(f"Error processing XPath {xpath} for label {label}: {e}")
+
+    return scraped_content